@@ -0,0 +1,67 @@
+'''
+Benchmark of writing a big appendix with write_row, with and without the per-workbook format cache.
+
+Run from the repository root:
+    python -m benchmarks.bench_excel_formats [--rows 100000]
+
+Every row highlights one column, as the totals rows do. Without the cache, write_row created a
+new Format object for every formatted cell.
+'''
+import argparse
+import datetime
+import os
+import tempfile
+import time
+import zipfile
+
+import xlsxwriter
+
+from src import excel_helper
+
+
+def uncached_get_format(workbook, format_dict):
+    return workbook.add_format(dict(format_dict))
+
+
+def write_appendix(file_name, rows_num):
+    workbook = xlsxwriter.Workbook(file_name)
+    worksheet = workbook.add_worksheet()
+    next_row = excel_helper.write_row(worksheet, 0, ['symbol', 'sale_value_usd', 'purchase_date', 'profit_loss'],
+                                      workbook, bold=True, underline=True)
+    for i in range(rows_num):
+        next_row = excel_helper.write_row(worksheet, next_row,
+                                          ['TEST', i * 1.5, datetime.datetime(2020, 1, 1), i * 0.5],
+                                          workbook, highlighted_cols=[3])
+    workbook.close()
+
+
+def time_appendix(rows_num, cached):
+    get_format = excel_helper.get_format
+    if not cached:
+        excel_helper.get_format = uncached_get_format
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, 'appendix.xlsx')
+            start = time.perf_counter()
+            write_appendix(file_name, rows_num)
+            elapsed = time.perf_counter() - start
+            with zipfile.ZipFile(file_name) as z:
+                styles_size = z.getinfo('xl/styles.xml').file_size
+            return elapsed, os.path.getsize(file_name), styles_size
+    finally:
+        excel_helper.get_format = get_format
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='number of appendix rows')
+    args = parser.parse_args()
+
+    print(f'{"formats":>10} {"seconds":>10} {"file bytes":>12} {"styles.xml":>12}')
+    for cached in (False, True):
+        elapsed, file_size, styles_size = time_appendix(args.rows, cached)
+        print(f'{"cached" if cached else "uncached":>10} {elapsed:>10.3f} {file_size:>12} {styles_size:>12}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+'''
+Benchmark of reading a statement from a Flex Query XML export (flex_statement.py) against reading
+the same statement from its activity statement CSV.
+
+Run from the repository root:
+    python -m benchmarks.bench_flex_statement [--trades 100000] [--repeat 3]
+
+The statement is generated (see statement_generator.py) and written as a Flex export too.
+Prints the rows/sec and the peak memory (tracemalloc) of parse_statement() on each of them.
+'''
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from src import tax_generator
+
+from .statement_generator import generate_statement, write_flex_statement
+
+
+def best_seconds(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def peak_memory(func):
+    ''':return: peak memory allocated by func (bytes)'''
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trades', type=int, default=100000, help='number of trades of the generated statement')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every reader - the fastest time is taken')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        statement_csv = os.path.join(tmp_dir, 'statement.csv')
+        flex_xml = os.path.join(tmp_dir, 'statement.xml')
+        generate_statement(statement_csv, args.trades)
+        write_flex_statement(statement_csv, flex_xml)
+
+        print(f'{"input":>6} {"file MB":>8} {"rows/s":>10} {"peak MB":>8}')
+        for name, statement_file in (('CSV', statement_csv), ('Flex', flex_xml)):
+            seconds = best_seconds(lambda: tax_generator.parse_statement(statement_file), args.repeat)
+            peak = peak_memory(lambda: tax_generator.parse_statement(statement_file))
+            print(f'{name:>6} {os.path.getsize(statement_file) / 1e6:>8.1f} {args.trades / seconds:>10,.0f} '
+                  f'{peak / 1e6:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
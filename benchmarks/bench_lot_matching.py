@@ -0,0 +1,63 @@
+'''
+Benchmark of the per-symbol FIFO lot matching (match_symbol_lots).
+
+Run from the repository root:
+    python -m benchmarks.bench_lot_matching [--sizes 100000 200000 400000]
+
+Prints the matching time for a single symbol at each number of fills. The time per fill
+should stay flat as the number of fills grows (linear scaling).
+'''
+import argparse
+import datetime
+import random
+import time
+
+from src.tax_generator import match_symbol_lots, TradeOpen, TradeClose, AllStockSplits
+
+DEFAULT_SIZES = [25000, 50000, 100000, 200000, 400000]
+
+
+def generate_symbol_trades(fills_num, seed=0):
+    '''Chronological buys and sells of a single actively traded symbol'''
+    rnd = random.Random(seed)
+    trade_list = []
+    position = 0
+    day = datetime.datetime(2019, 1, 1)
+    for i in range(fills_num):
+        if i % 50 == 0:
+            day += datetime.timedelta(days=1)
+        price = rnd.uniform(10, 500)
+        if position == 0 or rnd.random() < 0.5:
+            shares = rnd.randint(1, 100)
+            position += shares
+            trade_list.append(TradeOpen(symbol='BENCH', transaction_price=price, date=day, total_shares_num=shares,
+                                        shares_left=shares, commission=1))
+        else:
+            shares = rnd.randint(1, position)
+            position -= shares
+            trade_list.append(TradeClose(symbol='BENCH', transaction_price=price, date=day, total_shares_num=-shares,
+                                         shares_left=-shares, commission=1))
+    return trade_list
+
+
+def time_matching(fills_num):
+    trade_list = generate_symbol_trades(fills_num)
+    start = time.perf_counter()
+    opening_shares_lists = match_symbol_lots(trade_list, AllStockSplits())
+    elapsed = time.perf_counter() - start
+    return elapsed, sum(len(lst) for lst in opening_shares_lists)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='numbers of fills per symbol')
+    args = parser.parse_args()
+
+    print(f'{"fills":>10} {"matches":>10} {"seconds":>10} {"us/fill":>10}')
+    for fills_num in args.sizes:
+        elapsed, matches_num = time_matching(fills_num)
+        print(f'{fills_num:>10} {matches_num:>10} {elapsed:>10.3f} {elapsed / fills_num * 1e6:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+'''
+Benchmark of generating many PDF forms in one process, with the template cache and with the
+previous pipeline - the template file opened and parsed again for every page, and the overlay
+merged with PyPDF2's mergePage (which parses and serializes the whole template page content).
+
+Run from the repository root (the Hebrew font must be there, as for generate_tax.py):
+    python -m benchmarks.bench_pdf_forms [--forms 200] [--font Arial.ttf]
+'''
+import argparse
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from src import pdf_helpers
+
+FORM_1322_TEMPLATE_PDF = 'itc1322_18.pdf'
+FORM_1324_TEMPLATE_PDF = 'itc1324_18.pdf'
+
+
+class StandInDividends:
+    def get_total_ils_deducted(self):
+        return 1234.5
+
+
+def write_form_pdf_reparsed(template_file, pages_pdftext_lists, output_file):
+    from PyPDF2 import PdfFileWriter, PdfFileReader
+    output = PdfFileWriter()
+    for page_num, pdftext_list in enumerate(pages_pdftext_lists):
+        page = PdfFileReader(open(template_file, 'rb')).getPage(page_num)
+        page.mergePage(pdf_helpers.create_overlay_page(pdftext_list))
+        output.addPage(page)
+    with open(output_file, 'wb') as output_stream:
+        output.write(output_stream)
+
+
+def open_files_num():
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+def generate_forms(tmp_dir, forms_num, cached):
+    '''
+    :return: list of the seconds it took to generate every form
+    '''
+    write_form_pdf = pdf_helpers.write_form_pdf
+    if not cached:
+        pdf_helpers.write_form_pdf = write_form_pdf_reparsed
+    try:
+        return time_forms(tmp_dir, forms_num)
+    finally:
+        pdf_helpers.write_form_pdf = write_form_pdf
+
+
+def time_forms(tmp_dir, forms_num):
+    latencies = []
+    for i in range(forms_num):
+        form1325 = SimpleNamespace(total_profits=1000.0 + i, total_sales=50000.0 + i)
+        start = time.perf_counter()
+        if i % 2:
+            pdf_helpers.generate_form1324_pdf(FORM_1324_TEMPLATE_PDF, os.path.join(tmp_dir, f'Form1324_{i}.pdf'),
+                                              form1325, StandInDividends(), 500.0 + i)
+        else:
+            pdf_helpers.generate_form1322_pdf(form1325, FORM_1322_TEMPLATE_PDF, os.path.join(tmp_dir, f'Form1322_{i}.pdf'),
+                                              tax_deduction='not_deducted_1', is_foreign_asset=True)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--forms', type=int, default=200, help='number of forms generated (1322 and 1324 alternately)')
+    parser.add_argument('--font', default=pdf_helpers.HEBREW_FONT_FILE, help='Hebrew TTF font file')
+    args = parser.parse_args()
+    pdf_helpers.HEBREW_FONT_FILE = args.font
+
+    print(f'{"pipeline":>10} {"mean ms":>10} {"median ms":>10} {"max ms":>10} {"forms/s":>10} {"open files":>12}')
+    for cached in (False, True):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files_before = open_files_num()
+            latencies = generate_forms(tmp_dir, args.forms, cached)
+            files_after = open_files_num()
+        latencies_ms = sorted(latency * 1000 for latency in latencies)
+        open_files = f'{files_before}->{files_after}' if files_before is not None else 'n/a'
+        print(f'{"cached" if cached else "mergePage":>10} {sum(latencies_ms) / len(latencies_ms):>10.2f} '
+              f'{latencies_ms[len(latencies_ms) // 2]:>10.2f} {latencies_ms[-1]:>10.2f} '
+              f'{len(latencies) / sum(latencies):>10.1f} {open_files:>12}')
+
+
+if __name__ == '__main__':
+    main()
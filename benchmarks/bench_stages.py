@@ -0,0 +1,241 @@
+'''
+Benchmark of every stage of main() on synthetic IB statements (see statement_generator.py),
+at growing numbers of trades, compared with stored baselines.
+
+Run from the repository root:
+    python -m benchmarks.bench_stages [--sizes 1000 10000 100000] [--save-baseline]
+
+Sizes of 10^6 and 10^7 trades are supported (--sizes 1000000 10000000), but the statement of
+10^7 trades is about 1.1GB and the run takes a long time.
+
+The stage times are compared with benchmarks/baselines/bench_stages.json. To compare machines of
+different speed, every time is divided by the time of a fixed calibration workload, measured on
+the same run. A stage that is slower than its baseline by more than --tolerance (and by more than
+NOISE_FLOOR_SECONDS) is a regression, and the exit code is 1.
+--save-baseline stores the times of this run as the baseline of the sizes run.
+The pdf stage needs the Hebrew font (--font) and is skipped without it. The lot_matching_parallel stage
+runs only with --match-workers (its time depends on the number of CPUs of the machine).
+'''
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from src import tax_generator
+from src.pdf_helpers import HEBREW_FONT_FILE
+from src import pdf_helpers
+from src.rate_calendar import RateCalendar
+
+from .statement_generator import generate_statement, trading_days, DEFAULT_START_DATE, DEFAULT_END_DATE
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'baselines', 'bench_stages.json')
+BASELINE_VERSION = 1
+DEFAULT_TOLERANCE = 0.5  # Fraction slower than the baseline that is reported as a regression
+NOISE_FLOOR_SECONDS = 0.01  # Differences smaller than this are never regressions
+STAGES = ('rate_table', 'parse', 'rate_lookup', 'lot_matching', 'lot_matching_parallel', 'form1325', 'form1325_vectorized',
+          'dividends_interests', 'appendixes', 'pdf')
+
+
+def calibration_seconds(repeat=3):
+    '''Time of a fixed pure Python workload (parsing dates, dictionaries, sorting) - the speed of the machine'''
+    rnd = random.Random(0)
+    dates = [f'2020-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}' for _ in range(100000)]
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        counts = dict()
+        for date in dates:
+            day = datetime.datetime.strptime(date, '%Y-%m-%d')
+            counts[day] = counts.get(day, 0) + 1
+        sorted(counts.items())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def synthetic_rates(start_date=DEFAULT_START_DATE, end_date=DEFAULT_END_DATE, seed=0):
+    '''
+    USD/ILS rate of every trading day of the generated statements (ExchangeRates.xlsx has gaps longer than
+    the rate search range)
+    :return: dictionary of datetime -> USD/ILS rate
+    '''
+    rnd = random.Random(seed)
+    first_day = start_date - datetime.timedelta(days=7)
+    return {datetime.datetime(day.year, day.month, day.day): round(rnd.uniform(3.2, 3.8), 3)
+            for day in trading_days(first_day, end_date)}
+
+
+def statement_file(data_dir, trades_num, seed):
+    '''Generate the statement of trades_num trades, or reuse it if it was already generated to data_dir'''
+    path = os.path.join(data_dir, f'statement_{trades_num}_{seed}.csv')
+    if not os.path.exists(path):
+        generate_statement(path + '.tmp', trades_num, seed=seed)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def run_stages(statement_csv, rates, output_dir, pdf, match_workers=None):
+    '''
+    Run the stages of main() on statement_csv, in the order main() runs them
+    :param match_workers: number of processes of the lot_matching_parallel stage. None - skip the stage
+    :return: dictionary of stage -> seconds
+    '''
+    times = dict()
+
+    def timed(stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        times[stage] = time.perf_counter() - start
+        return result
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        dollar_ils_rate = timed('rate_table', RateCalendar, rates)
+        statement = timed('parse', tax_generator.parse_statements, [statement_csv], statement_csv)
+
+        trade_dates = [trade.date for trade_list in statement.trades.values() for trade in trade_list]
+        timed('rate_lookup', lambda: [dollar_ils_rate.rate(date) for date in trade_dates])
+
+        # Matching changes the trades - form1325 gets a statement of its own
+        timed('lot_matching', lambda: [tax_generator.match_symbol_lots(trade_list, statement.stock_splits)
+                                       for trade_list in statement.trades.values()])
+        statement = tax_generator.parse_statements([statement_csv], statement_csv)
+        if match_workers is not None:
+            from src.parallel_matching import match_lots_parallel
+            timed('lot_matching_parallel', match_lots_parallel, statement.trades, statement.stock_splits, match_workers)
+            statement = tax_generator.parse_statements([statement_csv], statement_csv)
+        timed('form1325_vectorized', tax_generator.form1325_obj_create, statement.trades, dollar_ils_rate,
+              statement.stock_splits, vectorized=True)
+        statement = tax_generator.parse_statements([statement_csv], statement_csv)
+        form1325 = timed('form1325', tax_generator.form1325_obj_create, statement.trades, dollar_ils_rate,
+                         statement.stock_splits, vectorized=False)
+
+        def dividends_interests():
+            interests = tax_generator.Interests(statement.interests, dollar_ils_rate)
+            dividends = tax_generator.Dividends(statement.dividends, dollar_ils_rate)
+            interests.get_total_ils()
+            dividends.get_total_ils()
+            dividends.get_total_ils_deducted()
+            return dividends, interests
+        dividends, interests = timed('dividends_interests', dividends_interests)
+
+        tax_year = max(trade_dates).year if trade_dates else tax_generator.TAX_YEAR
+        form1325_1st_half = tax_generator.create_form1325_from_date_range(
+            form1325, datetime.datetime(tax_year, 1, 1), datetime.datetime(tax_year, 7, 1))
+        form1325_2nd_half = tax_generator.create_form1325_from_date_range(
+            form1325, datetime.datetime(tax_year, 7, 1), datetime.datetime(tax_year + 1, 1, 1))
+
+        def appendixes():
+            tax_generator.print_interests_appendix(interests, output_dir)
+            tax_generator.print_form1325_list(form1325, form1325_1st_half, form1325_2nd_half, dividends, interests, 0,
+                                              output_dir)
+            tax_generator.print_form1322_appendix_list(dividends, output_dir)
+        timed('appendixes', appendixes)
+
+        if pdf:
+            def pdfs():
+                _, loss_from_stock, profits = pdf_helpers.generate_form1322_pdf(
+                    form1325_1st_half, tax_generator.FORM_1322_TEMPLATE_PDF, os.path.join(output_dir, '1322_1.pdf'),
+                    tax_deduction='not_deducted_1', credits_from_stock=-form1325.total_losses)
+                _, _, profits = pdf_helpers.generate_form1322_pdf(
+                    form1325_2nd_half, tax_generator.FORM_1322_TEMPLATE_PDF, os.path.join(output_dir, '1322_2.pdf'),
+                    tax_deduction='not_deducted_2', credits_from_stock=loss_from_stock, dividends=dividends,
+                    interests=interests)
+                pdf_helpers.generate_form1324_pdf(tax_generator.FORM_1324_TEMPLATE_PDF,
+                                                  os.path.join(output_dir, '1324.pdf'), form1325, dividends, profits)
+            timed('pdf', pdfs)
+    return times
+
+
+def load_baseline(baseline_file):
+    try:
+        with open(baseline_file, encoding='utf-8') as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if baseline.get('version') != BASELINE_VERSION:
+        return None
+    return baseline
+
+
+def save_baseline(baseline_file, baseline, calibration, results):
+    if baseline is None:
+        baseline = {'version': BASELINE_VERSION, 'sizes': dict()}
+    for trades_num, times in results.items():
+        baseline['sizes'][str(trades_num)] = {stage: seconds / calibration for stage, seconds in times.items()}
+    baseline['calibration_seconds'] = calibration
+    os.makedirs(os.path.dirname(baseline_file), exist_ok=True)
+    with open(baseline_file, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='numbers of trades')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every size - the fastest time is taken')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated statements')
+    parser.add_argument('--data-dir', default=None,
+                        help='directory to keep the generated statements in, to reuse them. Default: temporary')
+    parser.add_argument('--match-workers', type=int, default=None,
+                        help='processes of the lot_matching_parallel stage (0 - the number of CPUs). Default: skip it')
+    parser.add_argument('--font', default=HEBREW_FONT_FILE, help='Hebrew TTF font file, for the pdf stage')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='store the times of this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='fraction slower than the baseline that is a regression')
+    args = parser.parse_args()
+
+    pdf = os.path.exists(args.font)
+    pdf_helpers.HEBREW_FONT_FILE = args.font
+    calibration = calibration_seconds()
+    rates = synthetic_rates()
+    baseline = load_baseline(args.baseline)
+    print(f'calibration: {calibration:.3f}s' + ('' if pdf else f' (no {args.font} - skipping the pdf stage)'))
+
+    results = dict()
+    regressions = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir or tmp_dir
+        os.makedirs(data_dir, exist_ok=True)
+        print(f'{"trades":>10} {"stage":>22} {"seconds":>10} {"us/trade":>10} {"baseline":>10} {"ratio":>7}')
+        for trades_num in args.sizes:
+            statement_csv = statement_file(data_dir, trades_num, args.seed)
+            times = dict()
+            for _ in range(args.repeat):
+                output_dir = tempfile.mkdtemp(dir=tmp_dir)
+                for stage, seconds in run_stages(statement_csv, rates, output_dir, pdf, args.match_workers).items():
+                    times[stage] = min(seconds, times.get(stage, seconds))
+            results[trades_num] = times
+
+            baseline_times = baseline['sizes'].get(str(trades_num), dict()) if baseline else dict()
+            for stage in STAGES:
+                if stage not in times:
+                    continue
+                seconds = times[stage]
+                line = f'{trades_num:>10} {stage:>22} {seconds:>10.4f} {seconds / trades_num * 1e6:>10.2f}'
+                if stage in baseline_times:
+                    expected = baseline_times[stage] * calibration
+                    ratio = seconds / expected if expected else float('inf')
+                    regression = seconds > expected * (1 + args.tolerance) and seconds - expected > NOISE_FLOOR_SECONDS
+                    line += f' {expected:>10.4f} {ratio:>6.2f}x' + (' REGRESSION' if regression else '')
+                    if regression:
+                        regressions.append((trades_num, stage))
+                print(line)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, baseline, calibration, results)
+        print(f'Baseline saved to {args.baseline}')
+    elif regressions:
+        print(f'{len(regressions)} regressions: {regressions}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+'''
+Benchmark of decoding the trades and cash sections of an IB statement: the tuple decoder of
+statement_decoder.py against the csv.DictReader parsing it replaced.
+
+Run from the repository root:
+    python -m benchmarks.bench_statement_decoder [--trades 100000] [--repeat 3]
+
+The statement is generated (see statement_generator.py), and its sections are read once - only the
+decoding of the rows of each section is timed. Prints rows/sec of both parsers for every section.
+'''
+import argparse
+import csv
+import datetime
+import os
+import tempfile
+import time
+
+from src import tax_generator
+
+from .statement_generator import generate_statement
+
+
+def dictreader_parse_trades(lines):
+    '''The trades section parser before the tuple decoder, appending to lists of trade fields'''
+    dic = dict()
+    for row in csv.DictReader(lines):
+        try:
+            open_close = row['Code']
+        except Exception as e:
+            print(e)
+            continue
+
+        realized = 0.0
+        if open_close == tax_generator.IB_CODE_OPEN or tax_generator.IB_CODE_OPEN + ';' in open_close:
+            side = 1
+        elif open_close == tax_generator.IB_CODE_CLOSE:
+            side = -1
+            realized = float(row['Realized P/L'])
+        else:
+            continue
+        dic.setdefault(row['Symbol'], []).append(
+            (side, datetime.datetime.strptime(row['Date/Time'].split(',')[0], '%Y-%m-%d'), float(row['T. Price']),
+             int(row['Quantity'].replace(',', '')), abs(float(row['Comm/Fee'])), realized))
+    return dic
+
+
+def dictreader_parse_cash(lines):
+    '''The dividends / interest section parser before the tuple decoder'''
+    records = []
+    for row in csv.DictReader(lines):
+        if row['Currency'] == 'Total':
+            break
+        records.append((row['Description'].split('(')[0], datetime.datetime.strptime(row['Date'], '%Y-%m-%d'),
+                        float(row['Amount'])))
+    return records
+
+
+def best_seconds(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trades', type=int, default=100000, help='number of trades of the generated statement')
+    parser.add_argument('--dividends', type=int, default=20000, help='number of dividends of the generated statement')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every parser - the fastest time is taken')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        statement_csv = os.path.join(tmp_dir, 'statement.csv')
+        generate_statement(statement_csv, args.trades, dividends_num=args.dividends)
+        sections = tax_generator._read_statement_sections(statement_csv, ('Trades', 'Dividends'))
+
+    parsers = {
+        'Trades': (dictreader_parse_trades, lambda lines: tax_generator._parse_trades_section(lines, dict())),
+        'Dividends': (dictreader_parse_cash, tax_generator._parse_dividends_section),
+    }
+    print(f'{"section":>10} {"rows":>10} {"DictReader rows/s":>18} {"decoder rows/s":>15} {"speedup":>8}')
+    for section, (dictreader_parse, decoder_parse) in parsers.items():
+        lines = sections[section]
+        rows_num = len(lines) - 1
+        dictreader_seconds = best_seconds(lambda: dictreader_parse(lines), args.repeat)
+        decoder_seconds = best_seconds(lambda: decoder_parse(lines), args.repeat)
+        print(f'{section:>10} {rows_num:>10} {rows_num / dictreader_seconds:>18,.0f} '
+              f'{rows_num / decoder_seconds:>15,.0f} {dictreader_seconds / decoder_seconds:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+'''
+Deterministic generator of synthetic IB activity statement CSV files, in the layout of the real
+statements (see test.csv): Trades (grouped by symbol, with SubTotal and Total rows), Dividends,
+Withholding Tax, Interest and Corporate Actions (stock splits) sections.
+
+The same arguments always generate the same file. Rows are written as they are generated,
+so statements of millions of trades are generated in constant memory.
+
+write_flex_statement() writes the same data as an IB Flex Query XML export (see src/flex_statement.py).
+
+Run from the repository root:
+    python -m benchmarks.statement_generator statement.csv --trades 100000 [--symbols 50] [--seed 0] [--flex statement.xml]
+'''
+import argparse
+import csv
+import datetime
+import math
+import random
+from xml.sax.saxutils import quoteattr
+
+DEFAULT_START_DATE = datetime.date(2019, 1, 2)  # Covered by ExchangeRates.xlsx
+DEFAULT_END_DATE = datetime.date(2020, 12, 31)
+TRADING_DAY_SECONDS = 6 * 3600 + 30 * 60
+TRADING_DAY_START_SECONDS = 9 * 3600 + 30 * 60
+SPLIT_RATIOS = (2, 3, 4)
+WITHHOLDING_TAX_RATE = 0.25
+
+TRADES_HEADER = ['DataDiscriminator', 'Asset Category', 'Currency', 'Symbol', 'Date/Time', 'Quantity', 'T. Price',
+                 'C. Price', 'Proceeds', 'Comm/Fee', 'Basis', 'Realized P/L', 'MTM P/L', 'Code']
+CASH_HEADER = ['Currency', 'Date', 'Description', 'Amount']
+CORPORATE_ACTIONS_HEADER = ['Asset Category', 'Currency', 'Report Date', 'Date/Time', 'Description', 'Quantity',
+                            'Proceeds', 'Value', 'Realized P/L', 'Code']
+FLEX_ACCOUNT = 'U0000000'  # Account of the Flex export of a statement without an Account Information section
+FLEX_ASSET_CATEGORIES = {'Stocks': 'STK', 'Forex': 'CASH', 'Equity and Index Options': 'OPT'}
+FLEX_CASH_TYPES = {'Dividends': 'Dividends', 'Withholding Tax': 'Withholding Tax', 'Interest': 'Broker Interest Received'}
+
+
+def symbol_name(index):
+    '''Letters only, as the corporate actions parser expects: AAA, AAB, ...'''
+    letters = ''
+    for _ in range(3):
+        index, letter = divmod(index, 26)
+        letters = chr(ord('A') + letter) + letters
+    while index:
+        index, letter = divmod(index - 1, 26)
+        letters = chr(ord('A') + letter) + letters
+    return letters
+
+
+def isin(index):
+    return f'US{index:09d}0'
+
+
+def trading_days(start_date, end_date):
+    days = []
+    day = start_date
+    while day <= end_date:
+        if day.weekday() < 5:
+            days.append(day)
+        day += datetime.timedelta(days=1)
+    return days
+
+
+def fills_per_symbol(trades_num, symbols_num):
+    '''
+    Zipf-like distribution of the fills - a few symbols are traded much more than the rest
+    :return: list of the number of fills of every symbol
+    '''
+    weights = [1 / (rank + 1) for rank in range(symbols_num)]
+    total_weight = sum(weights)
+    counts = [int(trades_num * weight / total_weight) for weight in weights]
+    for i in range(trades_num - sum(counts)):
+        counts[i % symbols_num] += 1
+    return counts
+
+
+def format_quantity(quantity):
+    # Quantities of 1000 shares and more are written with thousands separators, as IB does
+    return f'{quantity:,}'
+
+
+class GeneratedStatement:
+    '''Number of the rows of every kind written by generate_statement()'''
+    def __init__(self):
+        self.opens = 0
+        self.closes = 0
+        self.dividends = 0
+        self.withholdings = 0
+        self.interests = 0
+        self.splits = []  # list of (symbol, date, ratio)
+
+    @property
+    def trades(self):
+        return self.opens + self.closes
+
+    def __repr__(self):
+        return f'GeneratedStatement(trades={self.trades}, opens={self.opens}, closes={self.closes}, ' \
+               f'dividends={self.dividends}, withholdings={self.withholdings}, interests={self.interests}, ' \
+               f'splits={self.splits})'
+
+
+def _write_symbol_trades(writer, rnd, symbol, fills_num, days, split, generated):
+    '''
+    Chronological buys and sells of one symbol. A sell never sells more than the position,
+    so every closing trade is covered by earlier opening trades.
+    :param split: (date, ratio) of the stock split of the symbol, or None
+    :return: subtotal row values (quantity, proceeds, commission, basis, realized, MTM)
+    '''
+    price = rnd.uniform(20, 500)
+    position = 0
+    cost = 0.0  # Cost of the position - for the average cost basis
+    split_done = split is None
+    subtotal = [0, 0.0, 0.0, 0.0, 0.0, 0.0]
+    for i in range(fills_num):
+        # Spread the fills evenly over the trading days, in order
+        day_position = i * len(days) / fills_num
+        day = days[int(day_position)]
+        if not split_done and day > split[0]:
+            position *= split[1]
+            price /= split[1]
+            split_done = True
+        seconds = TRADING_DAY_START_SECONDS + int((day_position % 1) * TRADING_DAY_SECONDS)
+        date_time = f'{day.isoformat()}, {seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+        price = round(max(1.0, price * math.exp(rnd.gauss(0, 0.01))), 2)
+        close_price = round(price * math.exp(rnd.gauss(0, 0.005)), 2)
+
+        if position == 0 or rnd.random() < 0.55:
+            quantity = rnd.randint(1, 200) * (100 if rnd.random() < 0.05 else 1)
+            commission = -round(max(1.0, quantity * 0.005), 6)
+            proceeds = -round(quantity * price, 2)
+            basis = -proceeds - commission
+            realized = 0.0
+            position += quantity
+            cost += basis
+            # Some orders are executed in parts
+            code = 'O;P' if rnd.random() < 0.1 else 'O'
+            generated.opens += 1
+        else:
+            shares = position if rnd.random() < 0.2 else rnd.randint(1, position)
+            quantity = -shares
+            commission = -round(max(1.0, shares * 0.005), 6)
+            proceeds = round(shares * price, 2)
+            basis = -round(cost * shares / position, 6)
+            realized = round(proceeds + commission + basis, 6)
+            cost += basis
+            position -= shares
+            code = 'C'
+            generated.closes += 1
+        mtm = round((close_price - price) * quantity, 2)
+        writer.writerow(['Trades', 'Data', 'Order', 'Stocks', 'USD', symbol, date_time, format_quantity(quantity),
+                         price, close_price, proceeds, commission, round(basis, 6), realized, mtm, code])
+        for j, value in enumerate((quantity, proceeds, commission, basis, realized, mtm)):
+            subtotal[j] += value
+    return subtotal
+
+
+def generate_statement(statement_csv, trades_num, symbols_num=50, dividends_num=None, splits_num=1,
+                       withholding_fraction=1.0, interest=True, start_date=DEFAULT_START_DATE,
+                       end_date=DEFAULT_END_DATE, seed=0):
+    '''
+    Write a synthetic IB activity statement
+    :param trades_num: number of trades (fills) of all the symbols together
+    :param symbols_num: number of symbols traded
+    :param dividends_num: number of dividend rows. Default: one every quarter for every symbol
+    :param splits_num: number of stock splits (each of a different symbol)
+    :param withholding_fraction: fraction of the dividends with a withholding tax row
+    :param interest: write a credit interest row for every month
+    :param seed: seed of the random generator - the same arguments generate the same file
+    :return: GeneratedStatement
+    '''
+    rnd = random.Random(seed)
+    days = trading_days(start_date, end_date)
+    symbols_num = max(1, min(symbols_num, trades_num))
+    symbols = [symbol_name(i) for i in range(symbols_num)]
+    generated = GeneratedStatement()
+
+    # Splits are reported on a Saturday, between the trading days - so that no lot is opened
+    # or closed on the day of the split
+    splits = dict()
+    for symbol in rnd.sample(symbols, min(splits_num, symbols_num)):
+        day = days[rnd.randrange(len(days) // 4, 3 * len(days) // 4)]
+        split_date = day + datetime.timedelta(days=5 - day.weekday())
+        splits[symbol] = (split_date, rnd.choice(SPLIT_RATIOS))
+        generated.splits.append((symbol, split_date, splits[symbol][1]))
+
+    with open(statement_csv, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['Statement', 'Header', 'Field Name', 'Field Value'])
+        writer.writerow(['Statement', 'Data', 'BrokerName', 'Interactive Brokers'])
+        writer.writerow(['Statement', 'Data', 'Title', 'Activity Statement'])
+        writer.writerow(['Statement', 'Data', 'Period', f'{start_date:%B %d, %Y} - {end_date:%B %d, %Y}'])
+
+        # Trades - grouped by symbol, every symbol followed by its subtotal
+        writer.writerow(['Trades', 'Header'] + TRADES_HEADER)
+        total = [0.0] * 6
+        for symbol, fills_num in zip(symbols, fills_per_symbol(trades_num, symbols_num)):
+            if fills_num == 0:
+                continue
+            subtotal = _write_symbol_trades(writer, rnd, symbol, fills_num, days, splits.get(symbol), generated)
+            quantity, proceeds, commission, basis, realized, mtm = subtotal
+            writer.writerow(['Trades', 'SubTotal', '', 'Stocks', 'USD', symbol, '', format_quantity(quantity), '', '',
+                             round(proceeds, 2), round(commission, 6), round(basis, 6), round(realized, 6),
+                             round(mtm, 2), ''])
+            total = [t + s for t, s in zip(total, subtotal)]
+        writer.writerow(['Trades', 'Total', '', 'Stocks', 'USD', '', '', '', '', '', round(total[1], 2),
+                         round(total[2], 6), round(total[3], 6), round(total[4], 6), round(total[5], 2), ''])
+
+        # Dividends - every symbol pays at most once a day
+        if dividends_num is None:
+            dividends_num = symbols_num * max(1, len(days) // 63)
+        per_symbol = math.ceil(dividends_num / symbols_num)
+        step = max(1, len(days) // per_symbol)
+        dividends = []
+        for i in range(dividends_num):
+            symbol_index = i % symbols_num
+            day = days[min(len(days) - 1, (i // symbols_num) * step + symbol_index % step)]
+            per_share = round(rnd.uniform(0.05, 2.5), 8)
+            dividends.append((day, symbol_index, per_share, round(rnd.uniform(1, 500), 2)))
+        dividends.sort()
+
+        writer.writerow(['Dividends', 'Header'] + CASH_HEADER)
+        for day, symbol_index, per_share, amount in dividends:
+            writer.writerow(['Dividends', 'Data', 'USD', day.isoformat(),
+                             f'{symbols[symbol_index]}({isin(symbol_index)}) Cash Dividend {per_share:.8f} USD per Share '
+                             f'(Ordinary Dividend)', amount])
+            generated.dividends += 1
+        writer.writerow(['Dividends', 'Data', 'Total', '', '', round(sum(d[3] for d in dividends), 2)])
+
+        writer.writerow(['Withholding Tax', 'Header'] + CASH_HEADER + ['Code'])
+        withholding_total = 0.0
+        for day, symbol_index, per_share, amount in dividends:
+            if rnd.random() >= withholding_fraction:
+                continue
+            tax = -round(amount * WITHHOLDING_TAX_RATE, 2)
+            withholding_total += tax
+            writer.writerow(['Withholding Tax', 'Data', 'USD', day.isoformat(),
+                             f'{symbols[symbol_index]}({isin(symbol_index)}) Cash Dividend {per_share:.8f} USD per Share '
+                             f'- US Tax', tax, ''])
+            generated.withholdings += 1
+        writer.writerow(['Withholding Tax', 'Data', 'Total', '', '', round(withholding_total, 2), ''])
+
+        # Interest - credited at the beginning of every month for the previous month
+        writer.writerow(['Interest', 'Header'] + CASH_HEADER)
+        interest_total = 0.0
+        if interest:
+            month = datetime.date(start_date.year, start_date.month, 1)
+            while True:
+                month = (month + datetime.timedelta(days=32)).replace(day=1)
+                pay_day = next((day for day in days if day >= month), None)
+                if pay_day is None or pay_day > end_date:
+                    break
+                previous_month = month - datetime.timedelta(days=1)
+                amount = round(rnd.uniform(0.01, 50), 2)
+                interest_total += amount
+                writer.writerow(['Interest', 'Data', 'USD', pay_day.isoformat(),
+                                 f'USD Credit Interest for {previous_month:%b-%Y}', amount])
+                generated.interests += 1
+        writer.writerow(['Interest', 'Data', 'Total', '', '', round(interest_total, 2)])
+
+        writer.writerow(['Corporate Actions', 'Header'] + CORPORATE_ACTIONS_HEADER)
+        for symbol, split_date, ratio in generated.splits:
+            symbol_index = symbols.index(symbol)
+            writer.writerow(['Corporate Actions', 'Data', 'Stocks', 'USD', split_date.isoformat(),
+                             f'{split_date.isoformat()}, 20:25:00',
+                             f'{symbol}({isin(symbol_index)}) Split {ratio} for 1 ({symbol}, {symbol} INC, '
+                             f'{isin(symbol_index)})', '', 0, 0, 0, ''])
+        writer.writerow(['Corporate Actions', 'Data', 'Total', '', '', '', '', '', 0, 0, 0, ''])
+
+    return generated
+
+
+def _statement_rows(statement_csv, sections):
+    '''
+    :return: generator of (section, dictionary of header -> field) of the Data rows of the sections of the statement
+             CSV, up to the Total row of each section
+    '''
+    headers = dict()
+    ended = set()
+    with open(statement_csv, newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or row[0] not in sections:
+                continue
+            section = row[0]
+            if row[1] == 'Header':
+                headers[section] = row[2:]
+            elif row[1] == 'Data' and section not in ended:
+                fields = dict(zip(headers[section], row[2:]))
+                if fields.get('Currency', fields.get('Asset Category', '')).startswith('Total'):
+                    ended.add(section)
+                    continue
+                yield section, fields
+
+
+def _flex_date(date, time_of_day=False):
+    '''2019-04-22, 14:04:29 -> 20190422;140429'''
+    day, _, time = date.partition(',')
+    flex_date = day.strip().replace('-', '')
+    if time_of_day and time.strip():
+        flex_date += ';' + time.strip().replace(':', '')
+    return flex_date
+
+
+def _write_flex_element(f, tag, attributes):
+    f.write(f'<{tag} ' + ' '.join(f'{name}={quoteattr(str(value))}' for name, value in attributes.items()) + ' />\n')
+
+
+def write_flex_statement(statement_csv, flex_xml, account=None):
+    '''
+    Write the trades, dividends, withholding tax, interests and corporate actions of an IB activity statement CSV
+    as a Flex Query XML export, element by element. The cash transactions are written by date -
+    the withholding tax of a day before its dividends
+    :param account: accountId of the export. Default: the account of the statement, or FLEX_ACCOUNT
+    '''
+    for _, fields in _statement_rows(statement_csv, ('Account Information',)):
+        if account is None and fields.get('Field Name') == 'Account':
+            account = fields['Field Value']
+    account = FLEX_ACCOUNT if account is None else account
+
+    with open(flex_xml, 'w', encoding='utf-8') as f:
+        f.write('<FlexQueryResponse queryName="Activity" type="AF">\n<FlexStatements count="1">\n')
+        f.write(f'<FlexStatement accountId={quoteattr(account)}>\n')
+        _write_flex_element(f, 'AccountInformation', {'accountId': account, 'currency': 'USD'})
+
+        f.write('<Trades>\n')
+        for _, fields in _statement_rows(statement_csv, ('Trades',)):
+            if fields.get('DataDiscriminator') != 'Order':
+                continue
+            # The Code of the CSV is the open / close indicator and the notes (O;P)
+            codes = fields.get('Code', '').split(';')
+            open_close = codes[0] if codes[0] in ('O', 'C') else ''
+            notes = ';'.join(code for code in codes[1 if open_close else 0:] if code)
+            _write_flex_element(f, 'Trade', {
+                'accountId': account, 'currency': fields['Currency'],
+                'assetCategory': FLEX_ASSET_CATEGORIES.get(fields['Asset Category'], fields['Asset Category']),
+                'symbol': fields['Symbol'], 'dateTime': _flex_date(fields['Date/Time'], time_of_day=True),
+                'tradeDate': _flex_date(fields['Date/Time']), 'quantity': fields['Quantity'].replace(',', ''),
+                'tradePrice': fields['T. Price'], 'ibCommission': fields.get('Comm/Fee', fields.get('Comm in USD', '')),
+                'fifoPnlRealized': fields.get('Realized P/L') or '0', 'openCloseIndicator': open_close, 'notes': notes,
+                'levelOfDetail': 'EXECUTION'})
+        f.write('</Trades>\n')
+
+        cash_transactions = [(fields['Date'], 0 if section == 'Withholding Tax' else 1, section, fields)
+                             for section, fields in _statement_rows(statement_csv, tuple(FLEX_CASH_TYPES))]
+        f.write('<CashTransactions>\n')
+        for date, _, section, fields in sorted(cash_transactions, key=lambda transaction: transaction[:2]):
+            cash_type = FLEX_CASH_TYPES[section]
+            if section == 'Interest' and float(fields['Amount']) < 0:
+                cash_type = 'Broker Interest Paid'
+            _write_flex_element(f, 'CashTransaction', {
+                'accountId': account, 'currency': fields['Currency'], 'type': cash_type, 'dateTime': _flex_date(date),
+                'description': fields['Description'], 'amount': fields['Amount'], 'levelOfDetail': 'DETAIL'})
+        f.write('</CashTransactions>\n')
+
+        f.write('<CorporateActions>\n')
+        for _, fields in _statement_rows(statement_csv, ('Corporate Actions',)):
+            _write_flex_element(f, 'CorporateAction', {
+                'accountId': account,
+                'assetCategory': FLEX_ASSET_CATEGORIES.get(fields['Asset Category'], fields['Asset Category']),
+                'reportDate': _flex_date(fields['Report Date']), 'dateTime': _flex_date(fields['Date/Time'], True),
+                'description': fields['Description'], 'type': 'FS', 'levelOfDetail': 'DETAIL'})
+        f.write('</CorporateActions>\n')
+        f.write('</FlexStatement>\n</FlexStatements>\n</FlexQueryResponse>\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('statement_csv', help='file to write')
+    parser.add_argument('--trades', type=int, default=10000, help='number of trades')
+    parser.add_argument('--symbols', type=int, default=50, help='number of symbols')
+    parser.add_argument('--dividends', type=int, default=None, help='number of dividends. Default: quarterly')
+    parser.add_argument('--splits', type=int, default=1, help='number of stock splits')
+    parser.add_argument('--withholding-fraction', type=float, default=1.0,
+                        help='fraction of the dividends with withholding tax')
+    parser.add_argument('--no-interest', action='store_true', help='no interest rows')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--flex', metavar='FILE', default=None, help='also write the statement as a Flex Query XML export')
+    args = parser.parse_args()
+
+    generated = generate_statement(args.statement_csv, args.trades, args.symbols, args.dividends, args.splits,
+                                   args.withholding_fraction, not args.no_interest, seed=args.seed)
+    if args.flex is not None:
+        write_flex_statement(args.statement_csv, args.flex)
+    print(generated)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,27 @@
+import argparse
+
 from src.tax_generator import main
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Generate the tax forms and appendixes (see the input parameters '
+                                                 'in src/tax_generator.py)')
+    parser.add_argument('--report', metavar='FILE', default=None,
+                        help='write the wall time, CPU time, peak memory and counts of every stage to a JSON file')
+    parser.add_argument('--profile', action='store_true', default=None,
+                        help='run every stage under cProfile and dump the stats of the slowest stage next to the report')
+    parser.add_argument('--parse-workers', metavar='N', type=int, default=None,
+                        help='parse the statements on N processes, a statement per process (0 - the number of CPUs)')
+    parser.add_argument('--match-workers', metavar='N', type=int, default=None,
+                        help='match the lots of the symbols on N processes (0 - the number of CPUs, 1 - no processes)')
+    parser.add_argument('--prev-snapshot', metavar='FILE', default=None,
+                        help='year-end snapshot of the previous tax year - parse only the statement of the tax year')
+    parser.add_argument('--save-snapshot', metavar='FILE', default=None,
+                        help='save the open lots and the losses carried forward to a year-end snapshot file')
+    parser.add_argument('--ledger', metavar='FILE', default=None,
+                        help='read the trades, dividends and interests from a SQLite ledger (see import_statements.py) '
+                             'instead of the statements')
+    parser.add_argument('--account', default=None, help='account of the taxpayer in the ledger')
+    args = parser.parse_args()
+    main(run_report_file=args.report, profile=args.profile, parsing_workers=args.parse_workers,
+         matching_workers=args.match_workers, prev_snapshot_file=args.prev_snapshot, snapshot_file=args.save_snapshot,
+         ledger_file=args.ledger, account=args.account)
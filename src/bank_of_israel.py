@@ -0,0 +1,159 @@
+import csv
+import datetime
+import io
+import json
+import os
+
+# Bank of Israel SDMX API - daily representative USD/ILS rates
+BANK_OF_ISRAEL_RATES_URL = 'https://edge.boi.gov.il/FusionEdgeServer/sdmx/v2/data/dataflow/BOI.STATISTICS/EXR/1.0/RER_USD_ILS'
+BANK_OF_ISRAEL_DATE_FIELD = 'TIME_PERIOD'
+BANK_OF_ISRAEL_RATE_FIELD = 'OBS_VALUE'
+BANK_OF_ISRAEL_MAX_DAYS_PER_REQUEST = 366
+BANK_OF_ISRAEL_REQUEST_TIMEOUT = 30  # Seconds
+RATE_STORE_VERSION = 1
+
+_session = None
+
+
+def get_session():
+    '''requests session shared by all the fetches, so that the HTTP connections are reused'''
+    global _session
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=3)
+        _session.mount('https://', adapter)
+        _session.mount('http://', adapter)
+    return _session
+
+
+def parse_rates_csv(text):
+    '''
+    Decode the CSV returned by the Bank of Israel SDMX API
+    :return: dictionary of datetime -> USD/ILS rate
+    '''
+    dic = dict()
+    csv_reader = csv.DictReader(io.StringIO(text))
+    for row in csv_reader:
+        rate = row.get(BANK_OF_ISRAEL_RATE_FIELD)
+        if not rate:
+            continue
+        dic[datetime.datetime.strptime(row[BANK_OF_ISRAEL_DATE_FIELD], '%Y-%m-%d')] = float(rate)
+    return dic
+
+
+def fetch_rates(start_date, end_date, url=BANK_OF_ISRAEL_RATES_URL):
+    '''
+    Download the USD/ILS rates of the days between start_date and end_date (both included)
+    :return: dictionary of datetime -> USD/ILS rate
+    '''
+    dic = dict()
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(end_date, chunk_start + datetime.timedelta(days=BANK_OF_ISRAEL_MAX_DAYS_PER_REQUEST - 1))
+        response = get_session().get(url, params={'startperiod': chunk_start.strftime('%Y-%m-%d'),
+                                                  'endperiod': chunk_end.strftime('%Y-%m-%d'),
+                                                  'format': 'csv'},
+                                     timeout=BANK_OF_ISRAEL_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        dic.update(parse_rates_csv(response.content.decode('utf-8-sig')))
+        chunk_start = chunk_end + datetime.timedelta(days=1)
+    return dic
+
+
+class RateStore:
+    '''
+    Local store of the rates downloaded from the Bank of Israel.
+    Remembers the range of days that was already downloaded, so that only the days
+    missing from it are downloaded again.
+    '''
+    def __init__(self, store_file):
+        self.store_file = store_file
+        self.start = None  # First day downloaded
+        self.end = None  # Last day downloaded
+        self.rates = dict()  # day ordinal -> rate
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.store_file, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != RATE_STORE_VERSION:
+            return
+        self.start = datetime.date.fromordinal(data['start'])
+        self.end = datetime.date.fromordinal(data['end'])
+        self.rates = {ordinal: rate for ordinal, rate in data['rates']}
+
+    def save(self):
+        store_dir = os.path.dirname(self.store_file)
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+        data = {'version': RATE_STORE_VERSION,
+                'start': self.start.toordinal(),
+                'end': self.end.toordinal(),
+                'rates': sorted(self.rates.items())}
+        tmp_file = self.store_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_file, self.store_file)
+
+    def missing_ranges(self, start_date, end_date):
+        '''
+        :return: list of (start, end) ranges of days that must be downloaded so that the store
+                 covers all the days between start_date and end_date. The ranges touch the range
+                 already stored, so that the stored days are always contiguous
+        '''
+        if self.start is None:
+            return [(start_date, end_date)]
+        ranges = []
+        if start_date < self.start:
+            ranges.append((start_date, self.start - datetime.timedelta(days=1)))
+        if end_date > self.end:
+            ranges.append((self.end + datetime.timedelta(days=1), end_date))
+        return ranges
+
+    def add(self, start_date, end_date, dollar_ils_rate):
+        '''
+        Add the rates downloaded for the days between start_date and end_date.
+        The range must be one of missing_ranges()
+        '''
+        self.rates.update({date.toordinal(): rate for date, rate in dollar_ils_rate.items()})
+        self.start = start_date if self.start is None else min(self.start, start_date)
+        self.end = end_date if self.end is None else max(self.end, end_date)
+
+    def get(self, start_date, end_date):
+        '''
+        :return: dictionary of datetime -> USD/ILS rate of the days between start_date and end_date
+        '''
+        return {datetime.datetime.fromordinal(ordinal): rate for ordinal, rate in sorted(self.rates.items())
+                if start_date.toordinal() <= ordinal <= end_date.toordinal()}
+
+
+def dollar_ils_rate_from_bank_of_israel(start_date, end_date, store_file, url=BANK_OF_ISRAEL_RATES_URL):
+    '''
+    USD/ILS rates of the days between start_date and end_date. Only the days that are not
+    in the local store are downloaded from the Bank of Israel
+    :param start_date: datetime.date
+    :param end_date: datetime.date
+    :param store_file: path of the local rate store
+    :return: dictionary of datetime -> USD/ILS rate
+    '''
+    store = RateStore(store_file)
+    # Today's rate may not be published yet - never store today or later days as downloaded
+    last_published_day = datetime.date.today() - datetime.timedelta(days=1)
+    stored_end_date = min(end_date, last_published_day)
+
+    if start_date <= stored_end_date:
+        missing_ranges = store.missing_ranges(start_date, stored_end_date)
+        for missing_start, missing_end in missing_ranges:
+            store.add(missing_start, missing_end, fetch_rates(missing_start, missing_end, url))
+        if missing_ranges:
+            store.save()
+
+    dic = store.get(start_date, end_date)
+    if end_date > last_published_day:
+        dic.update(fetch_rates(max(start_date, last_published_day + datetime.timedelta(days=1)), end_date, url))
+    return dic
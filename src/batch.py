@@ -0,0 +1,176 @@
+'''
+Batch mode - generate the forms of many clients on a pool of worker processes.
+
+Every client is a directory in the clients directory:
+    <clients dir>/<client>/config.json   personal details, as src/config.json. May also have the
+                                         optional entries 'tax-year' and 'loss-from-prev-years'
+    <clients dir>/<client>/<year>.csv    IB activity statements, one per year (as in annual-statements).
+                                         <tax year>.csv is the statement of the tax year
+The files of every client are generated to <output dir>/<client>/, with the console output in report.txt.
+
+The USD/ILS rates are parsed once, by the batch process. The fonts and the template PDFs are loaded
+once by every worker, and reused for all the clients the worker runs.
+'''
+import argparse
+import contextlib
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import tax_generator
+from .pdf_helpers import register_fonts, get_pdf_template
+from .user_data_helper import get_user_data, set_config_file
+
+BATCH_CLIENTS_DIR = 'clients'
+BATCH_OUTPUT_DIR = os.path.join('generated_files', 'clients')
+BATCH_WORKERS = None  # Number of worker processes. None - the number of CPUs
+CLIENT_CONFIG_FILE_NAME = 'config.json'
+CLIENT_REPORT_FILE_NAME = 'report.txt'
+CLIENT_TAX_YEAR_KEY = 'tax-year'
+CLIENT_LOSS_FROM_PREV_YEARS_KEY = 'loss-from-prev-years'
+STATEMENT_EXTENSION = '.csv'
+
+_worker_dollar_ils_rate = None  # Parsed USD/ILS rates, set by _worker_init()
+
+
+class Client:
+    def __init__(self, client_dir):
+        self.name = os.path.basename(os.path.normpath(client_dir))
+        self.config_file = os.path.join(client_dir, CLIENT_CONFIG_FILE_NAME)
+        # Statements are named by year - sorted by name they are sorted by date
+        self.statements = sorted(os.path.join(client_dir, file_name) for file_name in os.listdir(client_dir)
+                                 if file_name.endswith(STATEMENT_EXTENSION))
+        user_data = get_user_data(self.config_file)
+        self.tax_year = int(user_data.get(CLIENT_TAX_YEAR_KEY, tax_generator.TAX_YEAR))
+        self.loss_from_prev_years = float(user_data.get(CLIENT_LOSS_FROM_PREV_YEARS_KEY,
+                                                        tax_generator.LOSS_FROM_PREV_YEARS))
+        self.tax_year_statement = os.path.join(client_dir, f'{self.tax_year}{STATEMENT_EXTENSION}')
+
+    def statements_size(self):
+        return sum(os.path.getsize(statement) for statement in self.statements)
+
+    def __repr__(self):
+        return f'Client({self.name})'
+
+
+class ClientResult:
+    def __init__(self, name, output_dir, seconds, error=None):
+        self.name = name
+        self.output_dir = output_dir
+        self.seconds = seconds
+        self.error = error  # Traceback of the failure, None if the client succeeded
+
+    def __repr__(self):
+        return f'ClientResult({self.name}, {"ok" if self.error is None else "failed"}, {self.seconds:.2f}s)'
+
+
+def find_clients(clients_dir):
+    '''
+    :return: list of Client of every directory in clients_dir that has a config file, sorted by name
+    '''
+    clients = []
+    for dir_name in sorted(os.listdir(clients_dir)):
+        client_dir = os.path.join(clients_dir, dir_name)
+        if os.path.isfile(os.path.join(client_dir, CLIENT_CONFIG_FILE_NAME)):
+            clients.append(Client(client_dir))
+    return clients
+
+
+def _worker_init(dollar_ils_rate):
+    '''Load everything the clients share, once per worker'''
+    global _worker_dollar_ils_rate
+    _worker_dollar_ils_rate = dollar_ils_rate
+    register_fonts()
+    for template_file in (tax_generator.FORM_1322_TEMPLATE_PDF, tax_generator.FORM_1324_TEMPLATE_PDF):
+        template = get_pdf_template(template_file)
+        for page_num in range(len(template.pages)):
+            template.get_contents_data(page_num)
+
+
+def run_client(client, output_dir, run_report=False):
+    '''
+    Generate the files of client to output_dir/<client name>. Run by the workers, after _worker_init()
+    :param run_report: if True - write the run report of the client (tax_generator.RUN_REPORT_FILE_NAME)
+    :return: ClientResult
+    '''
+    client_output_dir = os.path.join(output_dir, client.name)
+    os.makedirs(client_output_dir, exist_ok=True)
+    set_config_file(client.config_file)
+    start = time.perf_counter()
+    error = None
+    with open(os.path.join(client_output_dir, CLIENT_REPORT_FILE_NAME), 'w', encoding='utf-8') as report, \
+            contextlib.redirect_stdout(report):
+        try:
+            tax_generator.main(statements=client.statements, tax_year_statement=client.tax_year_statement,
+                               tax_year=client.tax_year, loss_from_prev_years=client.loss_from_prev_years,
+                               generated_files_dir=client_output_dir, dollar_ils_rate=_worker_dollar_ils_rate,
+                               run_report_file=os.path.join(client_output_dir, tax_generator.RUN_REPORT_FILE_NAME)
+                               if run_report else None)
+        except Exception:
+            error = traceback.format_exc()
+            print(error)
+    return ClientResult(client.name, client_output_dir, time.perf_counter() - start, error)
+
+
+def run_batch(clients, output_dir=BATCH_OUTPUT_DIR, workers=BATCH_WORKERS, dollar_ils_rate=None, run_report=False):
+    '''
+    Generate the files of all the clients. A failing client does not stop the others.
+    :param workers: number of worker processes. 1 - run in this process
+    :param dollar_ils_rate: USD/ILS rates. Default: parsed by dollar_ils_rate_calendar()
+    :param run_report: if True - write a run report to the directory of every client
+    :return: list of ClientResult, in the order of clients
+    '''
+    if dollar_ils_rate is None:
+        dollar_ils_rate = tax_generator.dollar_ils_rate_calendar()
+
+    if workers == 1:
+        _worker_init(dollar_ils_rate)
+        results = []
+        for client in clients:
+            results.append(run_client(client, output_dir, run_report))
+            print_progress(results[-1], len(results), len(clients))
+        return results
+
+    results = dict()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_worker_init, initargs=(dollar_ils_rate,)) as pool:
+        # Biggest clients first, so that a big client does not run alone at the end
+        futures = {pool.submit(run_client, client, output_dir, run_report): client.name
+                   for client in sorted(clients, key=lambda client: client.statements_size(), reverse=True)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            print_progress(results[futures[future]], len(results), len(clients))
+    return [results[client.name] for client in clients]
+
+
+def print_progress(result, done_num, clients_num):
+    status = 'ok' if result.error is None else 'FAILED'
+    print(f'[{done_num}/{clients_num}] {result.name}: {status} ({result.seconds:.2f}s) -> {result.output_dir}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('clients_dir', nargs='?', default=BATCH_CLIENTS_DIR, help='directory of the client directories')
+    parser.add_argument('--output-dir', default=BATCH_OUTPUT_DIR, help='directory to generate the client directories to')
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS, help='number of worker processes')
+    parser.add_argument('--report', action='store_true',
+                        help=f'write the time and memory of every stage to <client dir>/{tax_generator.RUN_REPORT_FILE_NAME}')
+    args = parser.parse_args(argv)
+
+    clients = find_clients(args.clients_dir)
+    if not clients:
+        print(f"No clients found in '{args.clients_dir}' (a client is a directory with a {CLIENT_CONFIG_FILE_NAME} file)")
+        return 1
+    start = time.perf_counter()
+    results = run_batch(clients, args.output_dir, args.workers, run_report=args.report)
+    failed = [result for result in results if result.error is not None]
+    print(f'\n{len(results) - len(failed)} clients succeeded, {len(failed)} failed, '
+          f'in {time.perf_counter() - start:.2f}s')
+    for result in failed:
+        print(f"{result.name}: see '{os.path.join(result.output_dir, CLIENT_REPORT_FILE_NAME)}'")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
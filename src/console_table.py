@@ -0,0 +1,77 @@
+import datetime
+import itertools
+import sys
+
+CONSOLE_TABLE_SAMPLE_ROWS = 1000  # Rows used to compute the column widths
+FLOAT_PRECISION = 3
+
+
+def format_cell(value):
+    if type(value) is float:
+        return f'{value:.{FLOAT_PRECISION}f}'
+    if type(value) is datetime.datetime:
+        return value.__str__().split(' 00:00:00')[0]
+    return str(value)
+
+
+def is_number(value):
+    return type(value) in (int, float)
+
+
+def print_table(header_list, rows, row_limit=None, sample_rows=CONSOLE_TABLE_SAMPLE_ROWS, out=None):
+    '''
+    Print a table to the console, row by row.
+    The column widths are computed once, from the header and the first sample_rows rows, and every
+    row is written as soon as it is formatted - so printing is linear in the number of rows.
+    A cell wider than its column (only possible after the sample) is printed in full.
+    :param header_list: list of column names
+    :param rows: iterable of rows (lists of values)
+    :param row_limit: print at most row_limit rows, and only count the rest. None - print all the rows,
+                      0 - print only the number of rows
+    :param out: file to print to. Default: sys.stdout
+    :return: number of rows in the table
+    '''
+    if out is None:
+        out = sys.stdout
+    rows = iter(rows)
+    if row_limit is not None:
+        sample_rows = min(sample_rows, row_limit)
+
+    sample = [[(format_cell(value), is_number(value)) for value in row]
+              for row in itertools.islice(rows, sample_rows)]
+    widths = [len(name) for name in header_list]
+    for row in sample:
+        for col, (text, _) in enumerate(row):
+            if len(text) > widths[col]:
+                widths[col] = len(text)
+
+    border = '+' + '+'.join('-' * (width + 2) for width in widths) + '+\n'
+    header_border = '+' + '+'.join('=' * (width + 2) for width in widths) + '+\n'
+
+    def format_row(cells):
+        return '| ' + ' | '.join(text.rjust(width) if number else text.ljust(width)
+                                 for (text, number), width in zip(cells, widths)) + ' |\n'
+
+    rows_num = 0
+    if row_limit != 0:
+        out.write(border)
+        out.write(format_row([(name, False) for name in header_list]))
+        out.write(header_border)
+        for row in sample:
+            out.write(format_row(row))
+        rows_num = len(sample)
+        if row_limit is None:
+            for row in rows:
+                out.write(format_row([(format_cell(value), is_number(value)) for value in row]))
+                rows_num += 1
+        out.write(border)
+
+    # Rows that are not printed are only counted
+    if row_limit is not None:
+        not_printed = sum(1 for _ in rows)
+        rows_num += not_printed
+        if row_limit == 0:
+            out.write(f'({rows_num} rows)\n')
+        elif not_printed:
+            out.write(f'... {not_printed} more rows not printed ({rows_num} rows)\n')
+    return rows_num
@@ -1,8 +1,11 @@
-import xlsxwriter
 import datetime
 import os
+import weakref
 
-from .user_data_helper import user_data
+from .user_data_helper import get_user_data
+
+# workbook -> {normalized format properties: Format}
+_workbook_formats = weakref.WeakKeyDictionary()
 
 
 def translate(text):
@@ -41,6 +44,22 @@ def translate(text):
     return translated_str
 
 
+def get_format(workbook, format_dict):
+    '''
+    Format of format_dict, created only once per workbook.
+    Creating a Format for every formatted cell costs both time and memory on big appendixes
+    '''
+    formats = _workbook_formats.setdefault(workbook, {})
+    # True and 1 are the same format
+    key = tuple(sorted((k, int(v) if type(v) is bool else v) for k, v in format_dict.items()))
+    try:
+        return formats[key]
+    except KeyError:
+        cell_format = workbook.add_format(dict(format_dict))
+        formats[key] = cell_format
+        return cell_format
+
+
 def write_row(worksheet, row_number, values_list, workbook, bold=False, underline=False, font_size=None, align=None,
               highlighted_cols=None):
     if highlighted_cols is None:
@@ -66,7 +85,7 @@ def write_row(worksheet, row_number, values_list, workbook, bold=False, underlin
             format_dict['bg_color'] = 'yellow'
 
         if format_dict:
-            worksheet_extra_args = [workbook.add_format(format_dict)]
+            worksheet_extra_args = [get_format(workbook, format_dict)]
 
         worksheet.write(row_number, col_num, val, *worksheet_extra_args)
 
@@ -75,42 +94,72 @@ def write_row(worksheet, row_number, values_list, workbook, bold=False, underlin
         worksheet_extra_args = []
     return  row_number + 1
 
-# Return (worksheet/None, next_row)
-def gen_excel_file(file_name, header_list, values_matrix, description, close_workbook=True):
-    from .tax_generator import GENERATED_FILES_DIR
-    def get_personal_info_str():
-        name = user_data['name'][::-1]
-        name_heb = 'שם'[::-1]
-        id_number = user_data['id-number'][::-1]
-        id_heb = 'ת"ז'[::-1]
-        tax_file_number = id_number
-        tax_file_number_heb = 'מספר תיק'[::-1]
-        phone_number = user_data['phone-number'][::-1]
-        phone_heb = 'טלפון'[::-1]
-
-        s = f'{phone_number} :{phone_heb} ,{tax_file_number} :{tax_file_number_heb} ,{id_number} :{id_heb} ,{name} :{name_heb}'
-
-        return s[::-1]
-
-    complete_filename = os.path.join(GENERATED_FILES_DIR, file_name + '.xlsx')
-
-    # Create an new Excel file and add a worksheet.
-    workbook = xlsxwriter.Workbook(complete_filename)
-    try:
-        worksheet = workbook.add_worksheet()
+EXCEL_MAX_ROWS = 1048576  # Rows per worksheet
+
+
+def get_personal_info_str():
+    user_data = get_user_data()
+    name = user_data['name'][::-1]
+    name_heb = 'שם'[::-1]
+    id_number = user_data['id-number'][::-1]
+    id_heb = 'ת"ז'[::-1]
+    tax_file_number = id_number
+    tax_file_number_heb = 'מספר תיק'[::-1]
+    phone_number = user_data['phone-number'][::-1]
+    phone_heb = 'טלפון'[::-1]
+
+    s = f'{phone_number} :{phone_heb} ,{tax_file_number} :{tax_file_number_heb} ,{id_number} :{id_heb} ,{name} :{name_heb}'
+
+    return s[::-1]
+
+
+class AppendixWriter:
+    '''
+    Writes an appendix Excel file row by row, in xlsxwriter's constant_memory mode, so the rows
+    can come from an iterator and are never all held in memory.
+    When a worksheet is full (max_rows) the writing continues on a new worksheet, which starts
+    with the personal info and the column header again.
+    Rows must be written in order - a row cannot be changed once the next row is written.
+    '''
+    def __init__(self, file_name, header_list, description, max_rows=EXCEL_MAX_ROWS, generated_files_dir=None):
+        '''
+        :param generated_files_dir: directory of the file. Default: GENERATED_FILES_DIR
+        '''
+        import xlsxwriter
+        if generated_files_dir is None:
+            from .tax_generator import GENERATED_FILES_DIR
+            generated_files_dir = GENERATED_FILES_DIR
+
+        self.header_list = header_list
+        self.description = description
+        self.max_rows = max_rows
+        complete_filename = os.path.join(generated_files_dir, file_name + '.xlsx')
+        # Create an new Excel file
+        self.workbook = xlsxwriter.Workbook(complete_filename, {'constant_memory': True})
+        self.worksheet = None
+        self.next_row = 0
+        try:
+            self._add_worksheet()
+        except Exception as e:
+            self.workbook.close()
+            print('Error in Excel file generation')
+            raise e
+
+    def _add_worksheet(self):
+        self.worksheet = self.workbook.add_worksheet()
 
         # Write personal info at top of worksheet
-        merge_format = workbook.add_format({
+        merge_format = get_format(self.workbook, {
             'bold': 1,
             'font_size': 14,
             'align': 'center',
             'valign': 'vcenter'
         })
 
-        worksheet.merge_range('A1:I2', get_personal_info_str(), merge_format)
+        self.worksheet.merge_range('A1:I2', get_personal_info_str(), merge_format)
 
         # Write file description
-        merge_format = workbook.add_format({
+        merge_format = get_format(self.workbook, {
             'bold': 1,
             'underline': 1,
             'font_size': 22,
@@ -118,24 +167,57 @@ def gen_excel_file(file_name, header_list, values_matrix, description, close_wor
             'valign': 'vcenter'
         })
 
-        worksheet.merge_range('C3:E4', description, merge_format)
+        self.worksheet.merge_range('C3:E4', self.description, merge_format)
 
         # Write header
         header_row_number = 5
-        next_row = write_row(worksheet, header_row_number, header_list, workbook, bold=True, underline=True)
+        self.next_row = write_row(self.worksheet, header_row_number, self.header_list, self.workbook, bold=True,
+                                  underline=True)
+
+    def write_row(self, values_list, **kwargs):
+        '''Write a row after the last row written. kwargs are passed to write_row()'''
+        if self.next_row >= self.max_rows:
+            self._add_worksheet()
+        self.next_row = write_row(self.worksheet, self.next_row, values_list, self.workbook, **kwargs)
+
+    def write_rows(self, values_matrix):
+        '''
+        :param values_matrix: iterable of rows (lists of values)
+        '''
+        for values_list in values_matrix:
+            self.write_row(values_list)
+
+    def skip_rows(self, rows_num):
+        self.next_row += rows_num
+
+    def close(self):
+        self.workbook.close()
+
+    def __enter__(self):
+        return self
 
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            print('Error in Excel file generation')
+        self.close()
+        return False
+
+
+# Return (worksheet/None, next_row)
+def gen_excel_file(file_name, header_list, values_matrix, description, close_workbook=True):
+    writer = AppendixWriter(file_name, header_list, description)
+    try:
         # Write data
-        values_row_number = 6
-        for row_number in range(values_row_number, len(values_matrix) + values_row_number):
-            next_row = write_row(worksheet, row_number, values_matrix[row_number - values_row_number], workbook)
+        writer.write_rows(values_matrix)
 
+        workbook = writer.workbook
         if close_workbook:
             workbook.close()
             workbook = None
 
-        return workbook, worksheet, next_row
+        return workbook, writer.worksheet, writer.next_row
     except Exception as e:
-        workbook.close()
+        writer.close()
         print('Error in Excel file generation')
         raise e
 
@@ -0,0 +1,134 @@
+'''
+Reader of IB Flex Query XML exports - the statements downloaded with the Flex Web Service - as an
+alternative to the activity statement CSV files. parse_statement() reads a statement with the
+FLEX_STATEMENT_EXTENSION with parse_flex_statement().
+
+The export is read with iterparse, element by element, and every element is removed from the tree
+once read: the memory is that of the ParsedStatement, however large the export is.
+The elements read are:
+    <Trade>            - the trades (Trades section of the CSV), levelOfDetail EXECUTION
+    <CashTransaction>  - the dividends, withholding tax and interests, by their type
+    <CorporateAction>  - the stock splits (Corporate Actions section)
+Their attributes are turned into the fields of the rows of the CSV sections, and parsed by the same
+row parsers of tax_generator.py - the trades in batches of FLEX_TRADES_BATCH rows.
+Dates are yyyyMMdd or yyyy-MM-dd, with an optional time of day after them (the date format of the Flex query).
+'''
+from xml.etree import ElementTree
+
+from .statement_decoder import DayCache
+from .tax_generator import ParsedStatement, STATEMENT_SECTIONS, _parse_trade_rows, _parse_dividend_rows, \
+    _parse_withholding_tax_rows, _parse_interest_rows, _parse_corporate_action_rows
+
+FLEX_QUERY_RESPONSE_TAG = 'FlexQueryResponse'
+FLEX_TRADE_DETAIL = 'EXECUTION'  # levelOfDetail of the trades. Summaries (and the <Order> and <Lot> elements) are not read
+FLEX_CASH_SUMMARY = 'SUMMARY'  # levelOfDetail of the cash transactions not read
+FLEX_TRADES_BATCH = 4096  # Trade rows parsed at once
+# CashTransaction type -> section of the CSV
+FLEX_CASH_TRANSACTION_SECTIONS = {
+    'Dividends': 'Dividends',
+    'Withholding Tax': 'Withholding Tax',
+    'Broker Interest Received': 'Interest',
+    'Broker Interest Paid': 'Interest',
+    'Bond Interest Received': 'Interest',
+    'Bond Interest Paid': 'Interest',
+}
+
+
+def iter_flex_elements(flex_xml, tags):
+    '''
+    Generator of the elements of the export, as they end
+    :param tags: tags of the elements to generate
+    :return: generator of (tag, attributes dictionary) of the elements, in the order of the export
+    '''
+    parents = []
+    for event, element in ElementTree.iterparse(flex_xml, events=('start', 'end')):
+        if event == 'start':
+            if not parents and element.tag != FLEX_QUERY_RESPONSE_TAG:
+                raise Exception(f'{flex_xml} is not a Flex Query XML export (<{element.tag}> instead of '
+                                f'<{FLEX_QUERY_RESPONSE_TAG}>)')
+            parents.append(element)
+            continue
+        parents.pop()
+        if element.tag in tags:
+            yield element.tag, element.attrib
+        # Nothing is kept of the elements read - the tree never grows
+        element.clear()
+        if parents:
+            parents[-1].remove(element)
+
+
+def flex_statement_account(flex_xml):
+    ''':return: the account of the first FlexStatement of the export. None if it has none'''
+    with open(flex_xml, 'rb') as f:
+        for _, element in ElementTree.iterparse(f, events=('start',)):
+            if element.tag == 'FlexStatement':
+                return element.get('accountId')
+    return None
+
+
+class _FlexDates:
+    '''Flex dates (20190422;140429) as the dates of the CSV (2019-04-22), every day once'''
+    def __init__(self):
+        self._dates = dict()
+
+    def csv_date(self, value):
+        day = value[:10] if value[4:5] == '-' else value[:8]
+        date = self._dates.get(day)
+        if date is None:
+            date = self._dates[day] = day if len(day) == 10 else f'{day[:4]}-{day[4:6]}-{day[6:]}'
+        return date
+
+
+def parse_flex_statement(flex_xml, sections=STATEMENT_SECTIONS):
+    '''
+    Read a Flex Query XML export once, as parse_statement() reads an activity statement CSV.
+    All the FlexStatement elements of the export are read to one statement
+    :param sections: the sections of the CSV to parse (subset of STATEMENT_SECTIONS)
+    :return: ParsedStatement object
+    '''
+    statement = ParsedStatement()
+    dates = _FlexDates()
+    days = DayCache()
+    trade_rows = []
+    withholding_rows = []
+    tags = []
+    if 'Trades' in sections:
+        tags.append('Trade')
+    if any(section in sections for section in FLEX_CASH_TRANSACTION_SECTIONS.values()):
+        tags.append('CashTransaction')
+    if 'Corporate Actions' in sections:
+        tags.append('CorporateAction')
+
+    for tag, attributes in iter_flex_elements(flex_xml, tags):
+        get = attributes.get
+        if tag == 'Trade':
+            if get('levelOfDetail', FLEX_TRADE_DETAIL) != FLEX_TRADE_DETAIL:
+                continue
+            # The Code of the CSV is the open / close indicator and the notes (O;P)
+            code = ';'.join(filter(None, (get('openCloseIndicator', ''), get('notes', ''))))
+            trade_rows.append((code, get('symbol'), dates.csv_date(get('tradeDate') or get('dateTime')),
+                               get('quantity'), get('tradePrice'), get('ibCommission'), get('fifoPnlRealized')))
+            if len(trade_rows) == FLEX_TRADES_BATCH:
+                _parse_trade_rows(trade_rows, statement.trades, days)
+                trade_rows.clear()
+        elif tag == 'CashTransaction':
+            section = FLEX_CASH_TRANSACTION_SECTIONS.get(get('type'))
+            if section not in sections or get('levelOfDetail') == FLEX_CASH_SUMMARY:
+                continue
+            row = (get('currency'), dates.csv_date(get('dateTime') or get('reportDate')), get('description'),
+                   get('amount'))
+            if section == 'Dividends':
+                statement.dividends.extend(_parse_dividend_rows((row,), days))
+            elif section == 'Withholding Tax':
+                withholding_rows.append(row)
+            else:
+                statement.interests.extend(_parse_interest_rows((row,), days))
+        else:
+            row = (get('assetCategory'), dates.csv_date(get('reportDate')), get('description'))
+            _parse_corporate_action_rows((row,), statement.stock_splits)
+
+    _parse_trade_rows(trade_rows, statement.trades, days)
+    # Withholding tax rows refer to the dividends - the export may have them before the dividends
+    if withholding_rows:
+        _parse_withholding_tax_rows(withholding_rows, statement.dividends)
+    return statement
@@ -0,0 +1,164 @@
+'''
+Columnar computation of the Form 1325 entries with NumPy - the batch counterpart of the
+per-entry loop of form1325_obj_create(). The matched lots are laid out as columns
+(MatchedLots), the rates are looked up for all of them at once, and every field of the
+entries is computed with array operations, in the same order of operations as the loop.
+'''
+import numpy as np
+
+from .rate_calendar import RateCalendar
+from .tax_generator import Form1325, Form1325Entry, get_existing_exchange_date
+
+TAX_CASE_NOT_HANDLED = "Encountered case that wasn't handled. Please fix bug"
+
+
+class MatchedLots:
+    '''
+    The (TradeClose, TradeOpen, num_of_shares) tuples of match_symbol_lots(), as columns.
+    Like the loop of form1325_obj_create(), the commission of a trade is counted in its first
+    tuple only, and the commissions of the trades are zeroed once they are taken.
+    '''
+    def __init__(self, opening_shares_lists):
+        self.closes = []
+        self.opens = []
+        covered = []
+        close_prices = []
+        open_prices = []
+        close_commissions = []
+        open_commissions = []
+        counted = set()  # (table id, row) of the trades whose commission was taken
+        # The trades are row views of trade tables (see trade_table.py) - the columns are read directly
+        for opening_shares_list in opening_shares_lists:
+            for closing_trade, opening_trade, shares in opening_shares_list:
+                self.closes.append(closing_trade)
+                self.opens.append(opening_trade)
+                covered.append(shares)
+                for trade, prices, commissions in ((closing_trade, close_prices, close_commissions),
+                                                   (opening_trade, open_prices, open_commissions)):
+                    table = trade._table
+                    row = trade._row
+                    prices.append(table.prices[row])
+                    key = (id(table), row)
+                    if key in counted:
+                        commissions.append(0)
+                    else:
+                        counted.add(key)
+                        commissions.append(table.commissions[row])
+                        table.commissions[row] = 0
+
+        self.covered = np.array(covered, dtype=np.float64)
+        self.close_prices = np.array(close_prices, dtype=np.float64)
+        self.open_prices = np.array(open_prices, dtype=np.float64)
+        self.close_commissions = np.array(close_commissions, dtype=np.float64)
+        self.open_commissions = np.array(open_commissions, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.closes)
+
+
+def exchange_dates_and_rates(dates, dollar_ils_rate):
+    '''
+    :param dollar_ils_rate: RateCalendar, or parsed exchanges dictionary
+    :return: (list of the exchange date of each of dates (see get_existing_exchange_date()),
+              numpy array with the rate of each of them)
+    '''
+    if isinstance(dollar_ils_rate, RateCalendar):
+        return dollar_ils_rate.exchange_dates_and_rates_for(dates)
+    exchange_dates = [get_existing_exchange_date(date, dollar_ils_rate) for date in dates]
+    return exchange_dates, np.array([dollar_ils_rate[date] for date in exchange_dates], dtype=np.float64)
+
+
+def tax_to_pay(nominal_profit_loss, inflational_profit_loss):
+    '''
+    Vectorized _tax_to_pay(): every case of its table is a mask
+    :param nominal_profit_loss: numpy array
+    :param inflational_profit_loss: numpy array
+    :return: numpy array of the taxable profit / loss
+    '''
+    real_profit_loss = nominal_profit_loss - inflational_profit_loss
+    nominal_profit = nominal_profit_loss >= 0
+    inflational_profit = inflational_profit_loss >= 0
+    real_profit = real_profit_loss >= 0
+    nominal_loss = ~nominal_profit
+    inflational_loss = ~inflational_profit
+    real_loss = ~real_profit
+
+    zero = np.zeros_like(real_profit_loss)
+    cases = [
+        (nominal_profit & inflational_profit & real_profit, real_profit_loss),
+        (nominal_profit & inflational_loss & real_profit, nominal_profit_loss),
+        (nominal_loss & inflational_loss & real_profit, zero),
+        (nominal_loss & inflational_loss & real_loss, real_profit_loss),  # This is according to example Meir
+        (nominal_loss & inflational_profit & real_loss, nominal_profit_loss),
+        (nominal_profit & inflational_profit & real_loss, zero),
+    ]
+    masks = [mask for mask, _ in cases]
+    if not np.logical_or.reduce(masks).all():
+        raise Exception(TAX_CASE_NOT_HANDLED)
+    return np.select(masks, [taxable for _, taxable in cases])
+
+
+def compute_entry_columns(lots, sell_rates, buy_rates):
+    '''
+    :param lots: MatchedLots
+    :param sell_rates: numpy array with the rate of the sale date of every lot
+    :param buy_rates: numpy array with the rate of the purchase date of every lot
+    :return: dictionary of Form1325Entry field -> numpy array, and 'realized' -> array of the nominal profit / loss
+    '''
+    sale_value_usd = lots.close_prices * lots.covered
+    orig_price_ils = lots.open_prices * lots.covered * buy_rates
+    orig_price_ils += lots.close_commissions * sell_rates + lots.open_commissions * buy_rates
+    sale_value = sale_value_usd * sell_rates
+    rate = sell_rates / buy_rates
+
+    realized = sale_value - orig_price_ils  # hon nominali
+    inflation = orig_price_ils * (rate - 1)
+    profit_loss = tax_to_pay(realized, inflation)
+    adjusted_price = sale_value - profit_loss
+    if (orig_price_ils == 0).any():
+        raise ZeroDivisionError('float division by zero')
+    usd_sale_to_purchase_rate = adjusted_price / orig_price_ils
+    return {'sale_value_usd': sale_value_usd,
+            'orig_price_ils': orig_price_ils,
+            'usd_sale_to_purchase_rate': usd_sale_to_purchase_rate,
+            'adjusted_price': adjusted_price,
+            'sale_value': sale_value,
+            'profit_loss': profit_loss,
+            'realized': realized}
+
+
+def form1325_from_matches(opening_shares_lists, dollar_ils_rate):
+    '''
+    Form 1325 of the matched lots - same as the loop of form1325_obj_create(), without its debug prints
+    :param opening_shares_lists: lists of tuples (TradeClose, TradeOpen, num_of_shares), from match_symbol_lots()
+    :param dollar_ils_rate: RateCalendar, or parsed exchanges dictionary
+    :return: Form1325 object
+    '''
+    lots = MatchedLots(opening_shares_lists)
+    sale_dates, sell_rates = exchange_dates_and_rates([trade.date for trade in lots.closes], dollar_ils_rate)
+    _, buy_rates = exchange_dates_and_rates([trade.date for trade in lots.opens], dollar_ils_rate)
+    columns = compute_entry_columns(lots, sell_rates, buy_rates)
+
+    entries = []
+    rows = zip(lots.closes, lots.opens, sale_dates, *(columns[name].tolist() for name in
+               ('sale_value_usd', 'orig_price_ils', 'usd_sale_to_purchase_rate', 'adjusted_price', 'sale_value',
+                'profit_loss', 'realized')))
+    for closing_trade, opening_trade, sale_date, sale_value_usd, orig_price_ils, usd_sale_to_purchase_rate, \
+            adjusted_price, sale_value, profit_loss, realized in rows:
+        entry = Form1325Entry()
+        entry.symbol = closing_trade.symbol
+        entry.sale_value_usd = sale_value_usd
+        entry.purchase_date = opening_trade.date
+        entry.orig_price_ils = orig_price_ils
+        entry.usd_sale_to_purchase_rate = usd_sale_to_purchase_rate
+        entry.adjusted_price = adjusted_price
+        entry.sale_date = sale_date
+        entry.sale_value = sale_value
+        entry.profit_loss = profit_loss
+        closing_trade.realized = realized
+        entries.append(entry)
+
+    form = Form1325()
+    form.entry_list = entries
+    form.add_totals()
+    return form
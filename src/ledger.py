@@ -0,0 +1,322 @@
+'''
+Local SQLite ledger of IB activity statements - an alternative input to the statement CSV files.
+
+Statements are imported once (import_statement). Every trade, dividend, interest and stock split is
+stored with its account, and is de-duplicated by its natural key: importing the same statement again
+adds nothing, and statements that overlap add the rows they share once.
+The runs then read the ledger instead of scanning the CSV files: Ledger.parsed_statement() gives
+the ParsedStatement of a tax year, with the trades of every symbol read from the ledger when the
+symbol is first used (LedgerTrades), through the (account, symbol, day) index.
+
+Usage:
+    python import_statements.py <ledger file> <statement csv> [<statement csv> ...] [--account U1234567]
+'''
+import argparse
+import collections.abc
+import datetime
+import os
+import sqlite3
+
+from .rate_cache import file_sha256
+from .statement_decoder import section_rows
+from .tax_generator import parse_statement, _read_statement_sections, ParsedStatement, AllStockSplits, StockSplit, \
+    Dividend, Interest, FLEX_STATEMENT_EXTENSION
+from .trade_table import TradeTable, NO_SPLITS_APPLIED
+
+LEDGER_VERSION = 1  # SQLite user_version of the ledger schema
+ACCOUNT_INFORMATION_SECTION = 'Account Information'
+# Every row has the statement it was imported from and its row number in the statement (per symbol for trades),
+# to keep the order of the statements. occurrence is the number of rows with the same key before it in its statement:
+# identical fills of one statement are all kept, the same fills in another statement are not added again
+LEDGER_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS statements (
+    id INTEGER PRIMARY KEY,
+    account TEXT NOT NULL,
+    file TEXT NOT NULL,
+    sha256 TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS trades (
+    account TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    side INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    price REAL NOT NULL,
+    commission REAL NOT NULL,
+    realized REAL NOT NULL,
+    occurrence INTEGER NOT NULL,
+    statement_id INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    UNIQUE (account, symbol, day, side, quantity, price, commission, occurrence)
+);
+CREATE INDEX IF NOT EXISTS trades_account_symbol_day ON trades (account, symbol, day, statement_id, row);
+CREATE TABLE IF NOT EXISTS dividends (
+    account TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    amount REAL NOT NULL,
+    tax_deducted REAL NOT NULL,
+    occurrence INTEGER NOT NULL,
+    statement_id INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    UNIQUE (account, symbol, day, amount, occurrence)
+);
+CREATE INDEX IF NOT EXISTS dividends_account_day ON dividends (account, day);
+CREATE TABLE IF NOT EXISTS interests (
+    account TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    amount REAL NOT NULL,
+    occurrence INTEGER NOT NULL,
+    statement_id INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    UNIQUE (account, day, amount, occurrence)
+);
+CREATE INDEX IF NOT EXISTS interests_account_day ON interests (account, day);
+CREATE TABLE IF NOT EXISTS stock_splits (
+    account TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    ratio INTEGER NOT NULL,
+    UNIQUE (account, symbol, day, ratio)
+);
+'''
+
+
+def statement_account(statement_csv):
+    ''':return: the account of the Account Information section of the statement. None if it has none'''
+    if statement_csv.lower().endswith(FLEX_STATEMENT_EXTENSION):
+        from .flex_statement import flex_statement_account
+        return flex_statement_account(statement_csv)
+    lines = _read_statement_sections(statement_csv, (ACCOUNT_INFORMATION_SECTION,))[ACCOUNT_INFORMATION_SECTION]
+    for field_name, field_value in section_rows(lines, ('Field Name', 'Field Value')):
+        if field_name == 'Account':
+            return field_value
+    return None
+
+
+def _with_occurrences(keys):
+    ''':return: list of (key, number of the same keys before it)'''
+    seen = collections.Counter()
+    result = []
+    for key in keys:
+        result.append((key, seen[key]))
+        seen[key] += 1
+    return result
+
+
+def _day_range(start_year=None, end_year=None):
+    ''':return: (first day ordinal of start_year, first day ordinal after end_year). None years - no limit'''
+    return (0 if start_year is None else datetime.date(start_year, 1, 1).toordinal(),
+            1 << 62 if end_year is None else datetime.date(end_year + 1, 1, 1).toordinal())
+
+
+class Ledger:
+    def __init__(self, ledger_file):
+        ledger_dir = os.path.dirname(ledger_file)
+        if ledger_dir:
+            os.makedirs(ledger_dir, exist_ok=True)
+        self.ledger_file = ledger_file
+        self.connection = sqlite3.connect(ledger_file)
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version == 0:
+            with self.connection:
+                self.connection.executescript(LEDGER_SCHEMA)
+                self.connection.execute(f'PRAGMA user_version = {LEDGER_VERSION}')
+        elif version != LEDGER_VERSION:
+            self.connection.close()
+            raise Exception(f'Ledger {ledger_file} is of version {version}, expected version {LEDGER_VERSION}. '
+                            f'Import the statements to a new ledger')
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def import_statement(self, statement_csv, account=None):
+        '''
+        Add the rows of a statement that are not in the ledger yet
+        :param account: account of the statement. Default: from its Account Information section
+        :return: dictionary of 'trades', 'dividends', 'interests', 'stock_splits' -> number of rows added.
+                 None if the statement (the same file content) was already imported
+        '''
+        sha256 = file_sha256(statement_csv)
+        if self.connection.execute('SELECT 1 FROM statements WHERE sha256 = ?', (sha256,)).fetchone():
+            return None
+        account = statement_account(statement_csv) if account is None else account
+        if account is None:
+            raise Exception(f'No account in the {ACCOUNT_INFORMATION_SECTION} section of {statement_csv}. '
+                            f'Give the account of the statement')
+        statement = parse_statement(statement_csv)
+
+        added = dict()
+        with self.connection:
+            statement_id = self.connection.execute('INSERT INTO statements (account, file, sha256) VALUES (?, ?, ?)',
+                                                   (account, os.path.abspath(statement_csv), sha256)).lastrowid
+
+            def insert(name, sql, rows):
+                changes = self.connection.total_changes
+                self.connection.executemany(sql, rows)
+                added[name] = self.connection.total_changes - changes
+
+            trades = []
+            for symbol, table in statement.trades.items():
+                keys = zip(table.days, table.sides, table.total_shares, table.prices, table.commissions)
+                for row, ((day, side, quantity, price, commission), occurrence) in enumerate(_with_occurrences(keys)):
+                    trades.append((account, symbol, day, side, quantity, price, commission, table.realized[row],
+                                   occurrence, statement_id, row))
+            insert('trades', 'INSERT OR IGNORE INTO trades VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', trades)
+
+            keys = ((dividend.symbol, dividend.date.toordinal(), dividend.value_usd) for dividend in statement.dividends)
+            insert('dividends', 'INSERT OR IGNORE INTO dividends VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                   [(account, symbol, day, amount, dividend.tax_deducted_usd, occurrence, statement_id, row)
+                    for row, (((symbol, day, amount), occurrence), dividend) in
+                    enumerate(zip(_with_occurrences(keys), statement.dividends))])
+
+            keys = ((interest.date.toordinal(), interest.value_usd) for interest in statement.interests)
+            insert('interests', 'INSERT OR IGNORE INTO interests VALUES (?, ?, ?, ?, ?, ?)',
+                   [(account, day, amount, occurrence, statement_id, row)
+                    for row, ((day, amount), occurrence) in enumerate(_with_occurrences(keys))])
+
+            insert('stock_splits', 'INSERT OR IGNORE INTO stock_splits VALUES (?, ?, ?, ?)',
+                   [(account, stock_split.symbol, stock_split.date.toordinal(), stock_split.ratio)
+                    for stock_split in statement.stock_splits])
+        return added
+
+    def accounts(self):
+        return [account for account, in self.connection.execute('SELECT DISTINCT account FROM statements ORDER BY account')]
+
+    def statements(self, account):
+        ''':return: list of the statement files imported for account, in the order they were imported'''
+        return [file for file, in self.connection.execute('SELECT file FROM statements WHERE account = ? ORDER BY id',
+                                                          (account,))]
+
+    def symbols(self, account, start_year=None, end_year=None):
+        '''
+        :param start_year, end_year: only symbols traded from the start of start_year up to the end of end_year.
+                                     None - no limit
+        :return: list of the symbols of the trades of account, in the order they were first imported
+        '''
+        return [symbol for symbol, in self.connection.execute(
+            'SELECT symbol FROM trades WHERE account = ? AND day >= ? AND day < ? GROUP BY symbol ORDER BY MIN(rowid)',
+            (account, *_day_range(start_year, end_year)))]
+
+    def trade_table(self, account, symbol, start_year=None, end_year=None):
+        '''
+        :param start_year, end_year: only trades from the start of start_year up to the end of end_year. None - no limit
+        :return: TradeTable of the trades of symbol, in chronological order - fills of the same day in the order
+                 of the statements they were imported from (as merge_trade_tables() orders them)
+        '''
+        rows = self.connection.execute(
+            'SELECT side, day, price, quantity, commission, realized FROM trades '
+            'WHERE account = ? AND symbol = ? AND day >= ? AND day < ? ORDER BY day, statement_id, row',
+            (account, symbol, *_day_range(start_year, end_year))).fetchall()
+        table = TradeTable(symbol)
+        if rows:
+            sides, days, prices, quantities, commissions, realized = zip(*rows)
+            table.sides.extend(sides)
+            table.days.extend(days)
+            table.prices.extend(prices)
+            table.total_shares.extend(quantities)
+            table.shares_left.extend(quantities)
+            table.commissions.extend(commissions)
+            table.realized.extend(realized)
+            table.splits_applied.extend([NO_SPLITS_APPLIED] * len(rows))
+        return table
+
+    def trades(self, account, start_year=None, end_year=None):
+        ''':return: LedgerTrades - dictionary of symbol -> TradeTable of account, as trades_parse() returns'''
+        return LedgerTrades(self, account, start_year, end_year)
+
+    def dividends(self, account, year=None):
+        ''':return: list of the Dividend objects of account (of year, if given), as parsed from the statements'''
+        dividend_list = []
+        for symbol, day, amount, tax_deducted in self._select(
+                'SELECT symbol, day, amount, tax_deducted FROM dividends', account, year):
+            dividend = Dividend()
+            dividend.symbol = symbol
+            dividend.date = datetime.datetime.fromordinal(day)
+            dividend.value_usd = amount
+            dividend.tax_deducted_usd = tax_deducted
+            dividend_list.append(dividend)
+        return dividend_list
+
+    def interests(self, account, year=None):
+        ''':return: list of the Interest objects of account (of year, if given)'''
+        return [Interest(datetime.datetime.fromordinal(day), amount)
+                for day, amount in self._select('SELECT day, amount FROM interests', account, year)]
+
+    def stock_splits(self, account, year=None):
+        ''':return: AllStockSplits of account (of year, if given)'''
+        stock_splits = AllStockSplits()
+        for symbol, day, ratio in self.connection.execute(
+                'SELECT symbol, day, ratio FROM stock_splits WHERE account = ? AND day >= ? AND day < ? ORDER BY rowid',
+                (account, *_day_range(year, year))):
+            stock_splits.add_stock_split(StockSplit(symbol, datetime.datetime.fromordinal(day), ratio))
+        return stock_splits
+
+    def parsed_statement(self, account, tax_year, start_year=None):
+        '''
+        The ParsedStatement parse_statements() returns for the statements of the years up to tax_year:
+        the trades of the years, and the dividends, interests and stock splits of tax_year
+        :param start_year: first year of the trades. None - all the years
+        '''
+        statement = ParsedStatement()
+        statement.trades = self.trades(account, start_year, tax_year)
+        statement.dividends = self.dividends(account, tax_year)
+        statement.interests = self.interests(account, tax_year)
+        statement.stock_splits = self.stock_splits(account, tax_year)
+        return statement
+
+    def _select(self, select, account, year):
+        return self.connection.execute(f'{select} WHERE account = ? AND day >= ? AND day < ? '
+                                       f'ORDER BY day, statement_id, row', (account, *_day_range(year, year)))
+
+
+class LedgerTrades(collections.abc.Mapping):
+    '''
+    Trades of an account in the ledger, as a dictionary of symbol -> TradeTable.
+    The table of a symbol is read from the ledger when the symbol is first used, and kept -
+    the same table is returned every time (matching changes the tables)
+    '''
+    def __init__(self, ledger, account, start_year=None, end_year=None):
+        self._ledger = ledger
+        self._account = account
+        self._years = (start_year, end_year)
+        self._symbols = dict.fromkeys(ledger.symbols(account, start_year, end_year))
+        self._tables = dict()
+
+    def __getitem__(self, symbol):
+        table = self._tables.get(symbol)
+        if table is None:
+            if symbol not in self._symbols:
+                raise KeyError(symbol)
+            table = self._tables[symbol] = self._ledger.trade_table(self._account, symbol, *self._years)
+        return table
+
+    def __iter__(self):
+        return iter(self._symbols)
+
+    def __len__(self):
+        return len(self._symbols)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import IB activity statements to a SQLite ledger (see src/ledger.py)')
+    parser.add_argument('ledger_file', help='SQLite ledger file. Created if it does not exist')
+    parser.add_argument('statements', nargs='+', help='IB activity statement CSV files')
+    parser.add_argument('--account', default=None,
+                        help=f'account of the statements. Default: from their {ACCOUNT_INFORMATION_SECTION} section')
+    args = parser.parse_args(argv)
+
+    with Ledger(args.ledger_file) as ledger:
+        for statement_csv in args.statements:
+            added = ledger.import_statement(statement_csv, args.account)
+            if added is None:
+                print(f'{statement_csv}: already imported')
+            else:
+                print(f'{statement_csv}: ' + ', '.join(f'{count} {name}' for name, count in added.items()) + ' added')
+    return 0
@@ -0,0 +1,121 @@
+'''
+Lot matching of the symbols on a pool of worker processes - the parallel counterpart of the
+per-symbol loop of form1325_obj_create(). Matching is independent per symbol, so the symbols
+are sharded across the workers, balanced by their number of fills.
+
+A worker matches copies of the trades. The state matching changes (shares left, and the shares,
+price and splits applied of split lots) is copied back to the trades of trade_dic, and the matches
+are rebuilt with them, in the order of trade_dic - the result is the same as matching serially.
+'''
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .tax_generator import match_symbol_lots, AllStockSplits, TradeOpen, TradeClose, TradeTable
+
+# Columns of a TradeTable that matching may change
+MATCHED_TABLE_COLUMNS = ('prices', 'total_shares', 'shares_left', 'splits_applied')
+
+
+def shard_symbols(trade_dic, shards_num):
+    '''
+    Split the symbols to shards of about the same number of fills: the symbols with the most fills first,
+    each to the shard with the fewest fills so far
+    :param trade_dic: dictionary of symbol -> trades of the symbol
+    :return: list of up to shards_num lists of symbols, in the order of trade_dic within every shard
+    '''
+    order = {symbol: i for i, symbol in enumerate(trade_dic)}
+    shards = [[] for _ in range(min(shards_num, len(trade_dic)))]
+    loads = [(0, i) for i in range(len(shards))]  # Heap of (fills, shard)
+    for symbol in sorted(trade_dic, key=lambda symbol: (-len(trade_dic[symbol]), order[symbol])):
+        fills, i = heapq.heappop(loads)
+        shards[i].append(symbol)
+        heapq.heappush(loads, (fills + len(trade_dic[symbol]), i))
+    for shard in shards:
+        shard.sort(key=order.get)
+    return [shard for shard in shards if shard]
+
+
+def _symbol_stock_splits(stock_splits, symbol):
+    ''':return: AllStockSplits with the splits of symbol only - all a worker needs to match it'''
+    symbol_stock_splits = AllStockSplits()
+    for stock_split in stock_splits.get_stock_splits_for_symbol(symbol):
+        symbol_stock_splits.add_stock_split(stock_split)
+    return symbol_stock_splits
+
+
+def _match_shard(shard):
+    '''
+    Worker: match the symbols of a shard
+    :param shard: list of (symbol, trades of the symbol, AllStockSplits)
+    :return: list of (symbol, matched trades, matches as (closing trade index, opening trade index, num_of_shares))
+    '''
+    results = []
+    for symbol, trade_list, stock_splits in shard:
+        opening_shares_lists = match_symbol_lots(trade_list, stock_splits)
+        if isinstance(trade_list, TradeTable):
+            index_of = lambda trade: trade._row
+        else:
+            indexes = {id(trade): i for i, trade in enumerate(trade_list)}
+            index_of = lambda trade: indexes[id(trade)]
+        matches = [[(index_of(closing_trade), index_of(opening_trade), shares)
+                    for closing_trade, opening_trade, shares in opening_shares_list]
+                   for opening_shares_list in opening_shares_lists]
+        results.append((symbol, trade_list, matches))
+    return results
+
+
+def _restore_matched_state(trade_list, matched_trade_list):
+    '''Copy the state changed by matching from the trades matched by a worker to the trades of trade_list'''
+    if isinstance(trade_list, TradeTable):
+        for column in MATCHED_TABLE_COLUMNS:
+            getattr(trade_list, column)[:] = getattr(matched_trade_list, column)
+        return
+    for trade, matched_trade in zip(trade_list, matched_trade_list):
+        trade.shares_left = matched_trade.shares_left
+        trade.total_shares_num = matched_trade.total_shares_num
+        trade.transaction_price = matched_trade.transaction_price
+        if type(trade) is TradeOpen:
+            trade.splits_applied = matched_trade.splits_applied
+
+
+def _rebuild_matches(trade_list, matches):
+    ''':return: the matches of a worker, as tuples (TradeClose, TradeOpen, num_of_shares) of the trades of trade_list'''
+    if isinstance(trade_list, TradeTable):
+        # Views of the rows, as _match_table_lots() creates them
+        close_view = TradeClose._view
+        open_view = TradeOpen._view
+        return [[(close_view(trade_list, close_row), open_view(trade_list, open_row), shares)
+                 for close_row, open_row, shares in opening_shares_list]
+                for opening_shares_list in matches]
+    return [[(trade_list[close_index], trade_list[open_index], shares)
+             for close_index, open_index, shares in opening_shares_list]
+            for opening_shares_list in matches]
+
+
+def match_lots_parallel(trade_dic, stock_splits, workers):
+    '''
+    match_symbol_lots() of every symbol of trade_dic, on worker processes
+    :param trade_dic: dictionary of symbol -> trades of the symbol (TradeTable or list), from trades_parse()
+    :param stock_splits: AllStockSplits object
+    :param workers: number of worker processes. 0 or None - the number of CPUs
+    :return: list of lists of tuples (TradeClose, TradeOpen, num_of_shares) of all the symbols, in the order of
+             trade_dic - the same as concatenating match_symbol_lots() of the symbols
+    '''
+    shards = shard_symbols(trade_dic, workers or os.cpu_count())
+    if not shards:
+        return []
+    tasks = [[(symbol, trade_dic[symbol], _symbol_stock_splits(stock_splits, symbol)) for symbol in shard]
+             for shard in shards]
+    matches_of_symbol = dict()
+    with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+        for results in pool.map(_match_shard, tasks):
+            for symbol, matched_trade_list, matches in results:
+                trade_list = trade_dic[symbol]
+                _restore_matched_state(trade_list, matched_trade_list)
+                matches_of_symbol[symbol] = _rebuild_matches(trade_list, matches)
+
+    opening_shares_lists_for_all_symbols = []
+    for symbol in trade_dic:
+        opening_shares_lists_for_all_symbols += matches_of_symbol[symbol]
+    return opening_shares_lists_for_all_symbols
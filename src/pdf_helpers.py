@@ -1,21 +1,144 @@
-import json
-import os
-
-from reportlab.lib.units import inch
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+import copy
 import io
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from PyPDF2 import PdfFileWriter, PdfFileReader
-
-from .user_data_helper import user_data
+from functools import lru_cache
+
+from .user_data_helper import get_user_data
+
+HEBREW_FONT_FILE = 'Arial.ttf'
+PAGE_PARENT_KEY = '/Parent'
+PAGE_CONTENTS_KEY = '/Contents'
+
+
+@lru_cache(maxsize=None)
+def register_fonts():
+    '''Register the Hebrew font with reportlab. Done once per process, by the first form generated'''
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    pdfmetrics.registerFont(TTFont('Hebrew', HEBREW_FONT_FILE))
+
+
+class PageObjectsCopy:
+    '''
+    Copy of the objects a template page refers to. PyPDF2's writer rewrites the references inside the
+    objects it writes, so the parsed template objects are never given to a writer - the page and all
+    the objects it refers to are copied (the stream data itself is shared, it is never modified).
+    Acts as the PDF of the copied objects, so that the copied references resolve to the copies.
+    '''
+    def __init__(self, reader):
+        self.pdf_header = reader.pdf_header
+        self._objects = []
+        self._references = dict()  # (idnum, generation) of a template object -> reference to its copy
+
+    def get_object(self, reference):
+        return self._objects[reference.idnum - 1]
+
+    def _add_object(self, obj):
+        from PyPDF2.generic import IndirectObject
+        self._objects.append(obj)
+        return IndirectObject(len(self._objects), 0, self)
+
+    def copy_page(self, page, skip_keys=()):
+        '''
+        :param skip_keys: page keys that are not copied. The parent is never copied - the writer sets
+                          the parent of the pages it writes
+        '''
+        from PyPDF2 import PageObject
+        page_copy = PageObject(self)
+        if page.indirect_ref is not None:
+            self._references[page.indirect_ref.idnum, page.indirect_ref.generation] = self._add_object(page_copy)
+        for key, value in page.items():
+            if key != PAGE_PARENT_KEY and key not in skip_keys:
+                page_copy[key] = self._copy(value)
+        return page_copy
+
+    def _copy(self, obj):
+        from PyPDF2.generic import IndirectObject, DictionaryObject, ArrayObject, StreamObject
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            if key not in self._references:
+                # Reserve the reference first - the object may refer back to itself
+                reference = self._add_object(None)
+                self._references[key] = reference
+                self._objects[reference.idnum - 1] = self._copy(obj.get_object())
+            return self._references[key]
+        if isinstance(obj, StreamObject):
+            # Shallow copy - the (encoded and decoded) data is shared, the dictionary entries are copied below
+            stream_copy = copy.copy(obj)
+            for key, value in obj.items():
+                stream_copy[key] = self._copy(value)
+            return stream_copy
+        if isinstance(obj, DictionaryObject):
+            dict_copy = DictionaryObject()
+            for key, value in obj.items():
+                dict_copy[key] = self._copy(value)
+            return dict_copy
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self._copy(value) for value in obj)
+        # Names, numbers, strings - never modified
+        return obj
+
+
+class PdfTemplate:
+    '''
+    Template PDF form. The file is read into memory and closed right away, and parsed once.
+    The content of every page is parsed and serialized once too - merging an overlay on a page
+    with PyPDF2 parses and serializes the whole page content again, for every form.
+    '''
+    def __init__(self, template_file):
+        from PyPDF2 import PdfFileReader
+        with open(template_file, 'rb') as f:
+            self.reader = PdfFileReader(io.BytesIO(f.read()))
+        self.pages = [self.reader.getPage(page_num) for page_num in range(self.reader.getNumPages())]
+        self._contents_data = dict()  # page number -> serialized page content
+
+    def get_page(self, page_num):
+        '''
+        :return: copy of the page, that can be written without changing the template
+        '''
+        return PageObjectsCopy(self.reader).copy_page(self.pages[page_num])
+
+    def get_contents_data(self, page_num):
+        '''
+        :return: the page content as PyPDF2 writes it when merging a page on it - between q and Q operators
+        '''
+        from PyPDF2.generic import ContentStream
+        if page_num not in self._contents_data:
+            contents = self.pages[page_num].getContents()
+            data = b''
+            if contents is not None:
+                # Isolated from the graphics state changes of the overlay, as PyPDF2 isolates it
+                stream = ContentStream(contents, self.reader)
+                stream.operations.insert(0, ([], 'q'))
+                stream.operations.append(([], 'Q'))
+                data = stream.get_data()
+            self._contents_data[page_num] = data
+        return self._contents_data[page_num]
+
+    def merge_page(self, page_num, overlay_page):
+        '''
+        Same as merging overlay_page on a copy of the template page with PyPDF2, but only the content
+        of overlay_page is parsed
+        :return: the merged page
+        '''
+        from PyPDF2.generic import DecodedStreamObject, NameObject
+        page = PageObjectsCopy(self.reader).copy_page(self.pages[page_num], skip_keys=(PAGE_CONTENTS_KEY,))
+        page.mergePage(overlay_page)
+        contents = DecodedStreamObject()
+        contents.set_data(self.get_contents_data(page_num) + page.getContents().get_data())
+        page[NameObject(PAGE_CONTENTS_KEY)] = contents
+        return page
+
+
+@lru_cache(maxsize=None)
+def get_pdf_template(template_file):
+    '''Parsed template PDF - parsed once per process and shared by all the forms generated from it'''
+    return PdfTemplate(template_file)
 
-pdfmetrics.registerFont(TTFont('Hebrew', 'Arial.ttf'))
 
 class PdfText:
     def __init__(self, text, x, y, space_between_chars=False, direction=None, empty_string_if_zero=False, reverse_text=True):
         '''For coordinate system where origin is top left and x and y are in inches.'''
+        from reportlab.lib.units import inch
         self.x = x * inch
         self.y = y * inch
         if type(text) is str:
@@ -46,6 +169,7 @@ class PdfText:
             self.text = ' '.join(self.text)
         self.convert_top_left_origin_to_bottom_left_origin()
     def convert_top_left_origin_to_bottom_left_origin(self):
+        from reportlab.lib.units import inch
         self.y = 11.69 * inch - self.y
 
 class XMark(PdfText):
@@ -53,21 +177,28 @@ class XMark(PdfText):
         super().__init__('x', x, y)
 
 # Form 1322 marks
-form_1322_data = [PdfText(user_data['name'], 7.25, 1.82),
-                  PdfText(user_data['id-number'], 1.61, 1.83, space_between_chars=True, reverse_text=False),
-                  XMark(0.95, 1.77), # mehira letzad kashur - no
-                  XMark(0.95, 2.23), # mehira metzad kashur - no
-                  XMark(7.34, 2.23), # My ownership - yes
-                  XMark(6.71, 2.67),
-                  PdfText(user_data['name'], 4.64, 10),
-                  PdfText(user_data['date'], 6.25, 10, direction='LTR'),
-                  ]
-
-foriegn_assets_1322 = XMark(2.45, 2.24)
-non_foriegn_assets_1322 = XMark(2.03, 2.24)
-tax_deducted_by_broker_1322 = [XMark(5.82, 2.48)]
-tax_not_deducted_1_1322 = [ XMark(3.61, 2.48), XMark(3.42, 2.62)]
-tax_not_deducted_2_1322 = [ XMark(3.61, 2.48), XMark(3.42, 2.79)]
+def get_form_1322_data():
+    user_data = get_user_data()
+    return [PdfText(user_data['name'], 7.25, 1.82),
+            PdfText(user_data['id-number'], 1.61, 1.83, space_between_chars=True, reverse_text=False),
+            XMark(0.95, 1.77), # mehira letzad kashur - no
+            XMark(0.95, 2.23), # mehira metzad kashur - no
+            XMark(7.34, 2.23), # My ownership - yes
+            XMark(6.71, 2.67),
+            PdfText(user_data['name'], 4.64, 10),
+            PdfText(user_data['date'], 6.25, 10, direction='LTR'),
+            ]
+
+def get_foriegn_assets_1322():
+    return XMark(2.45, 2.24)
+def get_non_foriegn_assets_1322():
+    return XMark(2.03, 2.24)
+def get_tax_deducted_by_broker_1322():
+    return [XMark(5.82, 2.48)]
+def get_tax_not_deducted_1_1322():
+    return [ XMark(3.61, 2.48), XMark(3.42, 2.62)]
+def get_tax_not_deducted_2_1322():
+    return [ XMark(3.61, 2.48), XMark(3.42, 2.79)]
 
 
 def iterate_and_draw(pdftext_list, canvas):
@@ -77,6 +208,37 @@ def iterate_and_draw(pdftext_list, canvas):
         else:
             canvas.drawString(rec.x, rec.y, rec.text)
 
+def create_overlay_page(pdftext_list):
+    '''Draw pdftext_list on a new page, in memory'''
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import letter
+    from PyPDF2 import PdfFileReader
+
+    register_fonts()
+    packet = io.BytesIO()
+    can = canvas.Canvas(packet, pagesize=letter)
+    can.setFont('Hebrew', 14)
+    iterate_and_draw(pdftext_list, can)
+    can.save()
+    packet.seek(0)
+    return PdfFileReader(packet).getPage(0)
+
+
+def write_form_pdf(template_file, pages_pdftext_lists, output_file):
+    '''
+    Write a filled form: the text of every page is merged on a copy of the template page.
+    :param pages_pdftext_lists: list of the PdfText list of every page - page i is merged on template page i
+    '''
+    from PyPDF2 import PdfFileWriter
+
+    template = get_pdf_template(template_file)
+    output = PdfFileWriter()
+    for page_num, pdftext_list in enumerate(pages_pdftext_lists):
+        output.addPage(template.merge_page(page_num, create_overlay_page(pdftext_list)))
+    with open(output_file, 'wb') as output_stream:
+        output.write(output_stream)
+
+
 def try_to_deduct(deduct_from, detuct_credits):
     if detuct_credits == 0:
         return deduct_from, 0, 0
@@ -99,23 +261,17 @@ def generate_form1322_pdf(form_1325, input_file, output_file, tax_deduction='by_
     if tax_deduction not in ('by_broker', 'not_deducted_1', 'not_deducted_2'):
         raise Exception("tax_deduction arg must be one of ('by_broker', 'not_deducted_1', 'not_deducted_2')")
 
-    packet = io.BytesIO()
-    # create a new PDF with Reportlab
-    can = canvas.Canvas(packet, pagesize=letter)
-    can.setFont('Hebrew', 14)
-
-
     if is_foreign_asset:
-        form_1322_list = form_1322_data + [foriegn_assets_1322]
+        form_1322_list = get_form_1322_data() + [get_foriegn_assets_1322()]
     else:
-        form_1322_list = form_1322_data + [non_foriegn_assets_1322]
+        form_1322_list = get_form_1322_data() + [get_non_foriegn_assets_1322()]
 
     if tax_deduction == 'by_broker':
-        form_1322_list += tax_deducted_by_broker_1322
+        form_1322_list += get_tax_deducted_by_broker_1322()
     elif tax_deduction == 'not_deducted_1':
-        form_1322_list += tax_not_deducted_1_1322
+        form_1322_list += get_tax_not_deducted_1_1322()
     else:
-        form_1322_list += tax_not_deducted_2_1322
+        form_1322_list += get_tax_not_deducted_2_1322()
 
     # Profit from stocks without losses
     form_1322_list += [PdfText(form_1325.total_profits, 2.9, 5)]
@@ -156,37 +312,23 @@ def generate_form1322_pdf(form_1325, input_file, output_file, tax_deduction='by_
         dividends_and_interest_profits_including_deduction = total_dividends_and_cash_interest - credits_used_from_stock
         form_1322_list += [PdfText(dividends_and_interest_profits_including_deduction, 1.54, 9.21)]
 
-    iterate_and_draw(form_1322_list, can)
-
-    can.save()
-    # move to the beginning of the StringIO buffer
-    packet.seek(0)
-    new_pdf = PdfFileReader(packet)
-    # read your existing PDF
-    existing_pdf = PdfFileReader(open(input_file, "rb"))
-    output = PdfFileWriter()
-    # add the "watermark" (which is the new pdf) on the existing page
-    page = existing_pdf.getPage(0)
-    page.mergePage(new_pdf.getPage(0))
-    output.addPage(page)
-    # finally, write "output" to a real file
-    output_stream = open(output_file, "wb")
-    output.write(output_stream)
-    output_stream.close()
+    write_form_pdf(input_file, [form_1322_list], output_file)
 
     return deduct_credits_left_from_prev, detuct_credits_left_from_stock, dividends_and_interest_profits_including_deduction
 
-form_1324_data = [PdfText(user_data['first-name'], 7.6, 2.77),
-                  PdfText(user_data['last-name'], 5.85, 2.77),
-                  PdfText(user_data['id-number'], 2.7, 2.77, space_between_chars=True, reverse_text=False),
-                  ]
+def get_form_1324_data():
+    user_data = get_user_data()
+    return [PdfText(user_data['first-name'], 7.6, 2.77),
+            PdfText(user_data['last-name'], 5.85, 2.77),
+            PdfText(user_data['id-number'], 2.7, 2.77, space_between_chars=True, reverse_text=False),
+            ]
 
 
 def generate_form1324_pdf(template_pdf, output_pdf, form1325, dividends, dividends_profits_including_deduction):
-
+    user_data = get_user_data()
 
     # Page 1
-    form_1324_page1_list = form_1324_data + [PdfText(dividends_profits_including_deduction, 1.89, 8.02)]
+    form_1324_page1_list = get_form_1324_data() + [PdfText(dividends_profits_including_deduction, 1.89, 8.02)]
     form_1324_page1_list += [PdfText(dividends.get_total_ils_deducted(), 0.44, 8.02)]
     form_1324_page1_list += [PdfText(form1325.total_sales, 1.89, 10.37)]
 
@@ -196,29 +338,4 @@ def generate_form1324_pdf(template_pdf, output_pdf, form1325, dividends, dividen
     form_1324_page2_list += [PdfText(user_data['date'], 6.41, 9.48, direction='LTR')]
 
 
-    packet = [None] * 2
-    output = PdfFileWriter()
-    for page_num, form_page_list in enumerate([form_1324_page1_list, form_1324_page2_list]):
-
-        packet[page_num] = io.BytesIO()
-        # create a new PDF with Reportlab
-        can = canvas.Canvas(packet[page_num], pagesize=letter)
-        can.setFont('Hebrew', 14)
-
-        iterate_and_draw(form_page_list, can)
-
-        can.save()
-        # move to the beginning of the StringIO buffer
-        packet[page_num].seek(0)
-        new_pdf = PdfFileReader(packet[page_num])
-        # read your existing PDF
-        existing_pdf = PdfFileReader(open(template_pdf, "rb"))
-
-        # add the "watermark" (which is the new pdf) on the existing page
-        page = existing_pdf.getPage(page_num)
-        page.mergePage(new_pdf.getPage(0))
-        output.addPage(page)
-    # finally, write "output" to a real file
-    output_stream = open(output_pdf, "wb")
-    output.write(output_stream)
-    output_stream.close()
\ No newline at end of file
+    write_form_pdf(template_pdf, [form_1324_page1_list, form_1324_page2_list], output_pdf)
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import numpy as np  # pip install numpy
+
+from .rate_calendar import RateCalendar
+
+RATE_CACHE_DIR_NAME = '.rate_cache'  # Created next to the rates file
+RATE_CACHE_VERSION = 1
+RATE_CACHE_DTYPE = np.dtype([('ordinal', '<i8'), ('rate', '<f8')])
+
+
+def file_sha256(file):
+    sha = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class RateCache:
+    '''
+    On-disk cache of a parsed USD/ILS rates file.
+    The parsed rates are kept as a binary array of (day ordinal, rate) pairs that is memory-mapped
+    on load, so later runs do not parse the rates file at all.
+
+    The cache is keyed by the hash of the rates file. Its mtime and size are remembered too,
+    so the file is only hashed again when it was touched. A changed file is parsed again and
+    replaces the cached arrays.
+    '''
+    def __init__(self, source_file, cache_dir=None):
+        self.source_file = source_file
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(source_file)), RATE_CACHE_DIR_NAME)
+        self.cache_dir = cache_dir
+        self._base_name = os.path.basename(source_file)
+        self._index_file = os.path.join(cache_dir, self._base_name + '.json')
+
+    def _array_file(self, sha256):
+        return os.path.join(self.cache_dir, f'{self._base_name}.{sha256[:16]}.npy')
+
+    def _read_index(self):
+        try:
+            with open(self._index_file, encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if index.get('version') != RATE_CACHE_VERSION:
+            return None
+        return index
+
+    def _write_index(self, stat, sha256):
+        index = {'version': RATE_CACHE_VERSION, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': sha256}
+        tmp_file = self._index_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_file, self._index_file)
+
+    def _write_array(self, sha256, dollar_ils_rate):
+        array = np.empty(len(dollar_ils_rate), dtype=RATE_CACHE_DTYPE)
+        array['ordinal'] = [date.toordinal() for date in dollar_ils_rate.keys()]
+        array['rate'] = list(dollar_ils_rate.values())
+        array.sort(order='ordinal')
+
+        # Remove arrays of older versions of the rates file
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.startswith(self._base_name + '.') and file_name.endswith('.npy'):
+                os.remove(os.path.join(self.cache_dir, file_name))
+
+        array_file = self._array_file(sha256)
+        tmp_file = array_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_file, array_file)
+        return array
+
+    def load(self):
+        '''
+        :return: the cached (day ordinal, rate) array of the rates file, or None if not cached
+        '''
+        stat = os.stat(self.source_file)
+        index = self._read_index()
+        if index is None:
+            return None
+
+        if index['mtime_ns'] != stat.st_mtime_ns or index['size'] != stat.st_size:
+            # The file was touched - it is still cached if its content did not change
+            if file_sha256(self.source_file) != index['sha256']:
+                return None
+            self._write_index(stat, index['sha256'])
+
+        try:
+            return np.load(self._array_file(index['sha256']), mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+
+    def store(self, dollar_ils_rate):
+        '''
+        :param dollar_ils_rate: parsed rates file - dictionary of date -> USD/ILS rate
+        :return: the stored (day ordinal, rate) array
+        '''
+        os.makedirs(self.cache_dir, exist_ok=True)
+        stat = os.stat(self.source_file)
+        sha256 = file_sha256(self.source_file)
+        array = self._write_array(sha256, dollar_ils_rate)
+        self._write_index(stat, sha256)
+        return array
+
+
+def cached_rate_calendar(source_file, parse_func, cache_dir=None):
+    '''
+    RateCalendar of a USD/ILS rates file, parsed only if the file is not in the cache
+    :param source_file: the rates file
+    :param parse_func: function parsing source_file to a dictionary of date -> USD/ILS rate
+    :param cache_dir: directory of the cache. Default: RATE_CACHE_DIR_NAME next to the rates file
+    :return: RateCalendar object
+    '''
+    cache = RateCache(source_file, cache_dir)
+    array = cache.load()
+    if array is None:
+        array = cache.store(parse_func(source_file))
+    return RateCalendar.from_arrays(array['ordinal'], array['rate'])
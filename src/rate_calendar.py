@@ -0,0 +1,139 @@
+import datetime
+import numpy as np  # pip install numpy
+
+# If there is no USD/ILS rate for a date, there must be vacation in Israel - so the rate
+# of an earlier day is used. This is the number of days searched (the date itself included)
+EXCHANGE_RATE_SEARCH_RANGE = 5
+
+
+def exchange_rate_not_found(date):
+    return Exception('USD/ILS exchange rate not found near closing date: {}'.format(date))
+
+
+class RateCalendar:
+    '''
+    USD/ILS rates of every calendar day, indexed by day ordinal.
+    Days without a rate (weekends, vacations) are filled from the last previous business day,
+    so finding the rate of a date is an array lookup instead of probing day after day.
+
+    Behaves like the dictionary returned by dollar_ils_rate_parse() for dates that have a rate:
+    calendar[date] returns the rate of that exact date.
+    '''
+    def __init__(self, dollar_ils_rate, search_range=EXCHANGE_RATE_SEARCH_RANGE):
+        '''
+        :param dollar_ils_rate: dictionary of date/datetime -> USD/ILS rate. from dollar_ils_rate_parse()
+        :param search_range: number of days to search back for a rate (the date itself included)
+        '''
+        ordinals = np.fromiter((date.toordinal() for date in dollar_ils_rate.keys()), dtype=np.int64,
+                               count=len(dollar_ils_rate))
+        rates = np.fromiter(dollar_ils_rate.values(), dtype=np.float64, count=len(dollar_ils_rate))
+        self._build(ordinals, rates, search_range)
+
+    @classmethod
+    def from_arrays(cls, ordinals, rates, search_range=EXCHANGE_RATE_SEARCH_RANGE):
+        '''
+        :param ordinals: day ordinals (date.toordinal()) of the business days
+        :param rates: USD/ILS rate of each of the days in ordinals
+        '''
+        calendar = cls.__new__(cls)
+        calendar._build(np.asarray(ordinals, dtype=np.int64), np.asarray(rates, dtype=np.float64), search_range)
+        return calendar
+
+    def _build(self, ordinals, rates, search_range):
+        if len(ordinals) == 0:
+            raise Exception('No USD/ILS exchange rates to build the rate calendar from')
+        order = np.argsort(ordinals, kind='stable')
+        ordinals = ordinals[order]
+        rates = rates[order]
+
+        self.search_range = search_range
+        self.first_ordinal = int(ordinals[0])
+        # Leave room after the last rate for the days that may still use it
+        size = int(ordinals[-1]) - self.first_ordinal + search_range
+        index = ordinals - self.first_ordinal
+
+        # For every day - the index of the last day (up to and including it) that has a rate
+        last_business_day = np.full(size, -1, dtype=np.int64)
+        last_business_day[index] = index
+        last_business_day = np.maximum.accumulate(last_business_day)
+
+        dense_rates = np.empty(size, dtype=np.float64)
+        dense_rates[index] = rates
+        self.rates = dense_rates[last_business_day]
+        # Number of days since the last business day
+        self.lags = np.arange(size, dtype=np.int64) - last_business_day
+        self.ordinals = ordinals
+
+        # Python lists for the scalar lookups - indexing them is faster than indexing numpy arrays
+        self._rates_list = self.rates.tolist()
+        self._lags_list = self.lags.tolist()
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def _index(self, date):
+        i = date.toordinal() - self.first_ordinal
+        if i < 0 or i >= len(self._lags_list) or self._lags_list[i] >= self.search_range:
+            raise exchange_rate_not_found(date)
+        return i
+
+    def exchange_date(self, date):
+        '''
+        :return: date/datetime object as close as possible to date (but no later than date) with a rate.
+                 Same as get_existing_exchange_date()
+        '''
+        return date - datetime.timedelta(self._lags_list[self._index(date)])
+
+    def rate(self, date):
+        '''
+        :return: the rate of date, or of the last business day before it
+        '''
+        return self._rates_list[self._index(date)]
+
+    def _indexes(self, dates):
+        ''':param dates: list of date/datetime objects'''
+        index = np.fromiter((date.toordinal() for date in dates), dtype=np.int64, count=len(dates))
+        index -= self.first_ordinal
+        in_range = (index >= 0) & (index < len(self.lags))
+        found = in_range.copy()
+        found[in_range] = self.lags[index[in_range]] < self.search_range
+        if not found.all():
+            raise exchange_rate_not_found(dates[int(np.argmin(found))])
+        return index
+
+    def rates_for(self, dates):
+        '''
+        Vectorized rate()
+        :param dates: iterable of date/datetime objects
+        :return: numpy array with the rate of each of the dates
+        '''
+        return self.rates[self._indexes(list(dates))]
+
+    def exchange_dates_and_rates_for(self, dates):
+        '''
+        Vectorized exchange_date() and rate()
+        :param dates: iterable of date/datetime objects
+        :return: (list of the exchange date of each of the dates, numpy array with the rate of each of the dates)
+        '''
+        dates = list(dates)
+        index = self._indexes(dates)
+        lags = [datetime.timedelta(lag) for lag in range(self.search_range)]
+        exchange_dates = [date - lags[lag] for date, lag in zip(dates, self.lags[index].tolist())]
+        return exchange_dates, self.rates[index]
+
+    def __getitem__(self, date):
+        i = date.toordinal() - self.first_ordinal
+        if i < 0 or i >= len(self._lags_list) or self._lags_list[i] != 0:
+            raise KeyError(date)
+        return self._rates_list[i]
+
+    def __contains__(self, date):
+        i = date.toordinal() - self.first_ordinal
+        return 0 <= i < len(self._lags_list) and self._lags_list[i] == 0
+
+    def __str__(self):
+        return f'(RateCalendar: {len(self)} rates, ' \
+               f'{datetime.date.fromordinal(self.first_ordinal)} - {datetime.date.fromordinal(int(self.ordinals[-1]))})'
+
+    def __repr__(self):
+        return self.__str__()
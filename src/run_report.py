@@ -0,0 +1,142 @@
+import datetime
+import json
+import os
+import platform
+import time
+from contextlib import contextmanager
+
+RUN_REPORT_VERSION = 1
+
+
+class StageRecord:
+    def __init__(self, name):
+        self.name = name
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_memory_bytes = None  # Peak of the memory traced by tracemalloc during the stage
+        self.memory_growth_bytes = None  # Traced memory at the end of the stage minus at its start
+        self.counts = dict()  # Rows / entries handled by the stage, set by the stage
+        self.profile = None  # cProfile.Profile of the stage, in profile mode
+
+    def to_dict(self):
+        return {'name': self.name,
+                'wall_seconds': self.wall_seconds,
+                'cpu_seconds': self.cpu_seconds,
+                'peak_memory_bytes': self.peak_memory_bytes,
+                'memory_growth_bytes': self.memory_growth_bytes,
+                'counts': self.counts}
+
+
+class RunReport:
+    '''
+    Opt-in instrumentation of the stages of a run. Every stage records its wall time, CPU time,
+    the peak of the memory traced by tracemalloc and the counts of the rows it handled:
+
+        report = RunReport(enabled=True)
+        with report.stage('parse') as stage:
+            statement = parse_statements(...)
+            stage.counts['trades'] = ...
+        report.write('run_report.json')
+
+    When disabled, stage() only hands out a record for the counts, and measures nothing.
+    Memory tracing slows Python down - trace_memory=False records the times only.
+    In profile mode every stage runs under cProfile, and the stats of the stage with the longest
+    wall time (the hottest stage) are dumped by write() (times are inflated by the profiler).
+    '''
+    def __init__(self, enabled=False, trace_memory=True, profile=False):
+        self.enabled = enabled or profile
+        self.trace_memory = trace_memory and self.enabled
+        self.profile = profile
+        self.stages = []
+        self.started = datetime.datetime.now()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._started_tracing = False
+        if self.trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+
+    @contextmanager
+    def stage(self, name):
+        record = StageRecord(name)
+        if not self.enabled:
+            yield record
+            return
+
+        if self.trace_memory:
+            import tracemalloc
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        if self.profile:
+            import cProfile
+            record.profile = cProfile.Profile()
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        if record.profile is not None:
+            record.profile.enable()
+        try:
+            yield record
+        finally:
+            if record.profile is not None:
+                record.profile.disable()
+            record.wall_seconds = time.perf_counter() - start_wall
+            record.cpu_seconds = time.process_time() - start_cpu
+            if self.trace_memory:
+                current_memory, peak_memory = tracemalloc.get_traced_memory()
+                record.peak_memory_bytes = peak_memory
+                record.memory_growth_bytes = current_memory - start_memory
+            self.stages.append(record)
+
+    def hottest_stage(self):
+        '''
+        :return: StageRecord of the stage with the longest wall time, None if no stage was recorded
+        '''
+        return max(self.stages, key=lambda record: record.wall_seconds, default=None)
+
+    def to_dict(self):
+        hottest = self.hottest_stage()
+        return {'version': RUN_REPORT_VERSION,
+                'started': self.started.isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'trace_memory': self.trace_memory,
+                'profile': self.profile,
+                'wall_seconds': time.perf_counter() - self._start_wall,
+                'cpu_seconds': time.process_time() - self._start_cpu,
+                'hottest_stage': hottest.name if hottest else None,
+                'stages': [record.to_dict() for record in self.stages]}
+
+    def write(self, report_file, profile_stats_file=None):
+        '''
+        Write the JSON run report to report_file. In profile mode, the cProfile stats of the
+        hottest stage are dumped to profile_stats_file (default: report_file with a .prof extension)
+        :return: the profile stats file, None if not in profile mode
+        '''
+        if not self.enabled:
+            return None
+        report_dir = os.path.dirname(report_file)
+        if report_dir:
+            os.makedirs(report_dir, exist_ok=True)
+        report = self.to_dict()
+
+        hottest = self.hottest_stage()
+        if self.profile and hottest is not None:
+            if profile_stats_file is None:
+                profile_stats_file = os.path.splitext(report_file)[0] + '.prof'
+            hottest.profile.dump_stats(profile_stats_file)
+            report['profile_stats_file'] = profile_stats_file
+        else:
+            profile_stats_file = None
+
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        return profile_stats_file
+
+    def close(self):
+        '''Stop tracing the memory, if this report started it'''
+        if self._started_tracing:
+            import tracemalloc
+            tracemalloc.stop()
+            self._started_tracing = False
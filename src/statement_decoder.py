@@ -0,0 +1,85 @@
+'''
+Fast decoding of the rows of IB activity statement sections. Instead of a dictionary per row
+(csv.DictReader), the indices of the columns a parser needs are resolved from the header of the
+section once, and every row is decoded into a tuple of just these columns.
+Dates repeat in many rows (all the fills of a day) - DayCache parses every date string once.
+'''
+import csv
+import datetime
+from operator import itemgetter
+
+
+class SectionDecoder:
+    '''
+    Decoder of the rows of a statement section into tuples of the requested columns.
+    Like csv.DictReader, the header is the first line of the section (later header lines are decoded as rows),
+    a column that appears more than once in the header is taken from its last position, and the columns
+    missing from a short row are None.
+    '''
+    def __init__(self, header, columns):
+        '''
+        :param header: fields of the header line of the section
+        :param columns: names of the columns to decode
+        '''
+        positions = {name: i for i, name in enumerate(header)}
+        missing = [column for column in columns if column not in positions]
+        if missing:
+            raise KeyError(f'Columns {missing} not in the header of the section: {header}')
+        self.columns = tuple(columns)
+        self.indices = tuple(positions[column] for column in columns)
+        self._min_fields = max(self.indices) + 1
+        getter = itemgetter(*self.indices)
+        # itemgetter of a single index returns the value itself - keep the rows tuples
+        self._get = getter if len(self.indices) > 1 else lambda fields: (getter(fields),)
+
+    def decode(self, fields):
+        ''':return: tuple of the requested columns of a row (list of fields)'''
+        if len(fields) < self._min_fields:
+            fields = fields + [None] * (self._min_fields - len(fields))
+        return self._get(fields)
+
+    def rows(self, reader):
+        ''':return: iterator of the tuples of the rows of a csv reader'''
+        get = self._get
+        min_fields = self._min_fields
+        for fields in reader:
+            if not fields:
+                continue  # Skipped by csv.DictReader too
+            yield get(fields) if len(fields) >= min_fields else self.decode(fields)
+
+
+def section_rows(lines, columns):
+    '''
+    Decode the lines of a statement section
+    :param lines: lines of the section, the header line first
+    :param columns: names of the columns to decode
+    :return: iterator of tuples of the columns of every row after the header, in the order of columns.
+             KeyError (on the first row, as with csv.DictReader) if a column is not in the header
+    '''
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    for fields in reader:
+        if fields:
+            decoder = SectionDecoder(header, columns)
+            yield decoder.decode(fields)
+            yield from decoder.rows(reader)
+            return
+
+
+class DayCache:
+    '''
+    Date strings (like 2019-04-22) parsed to datetime objects, every string once.
+    Rows of the same day share the datetime object
+    '''
+    def __init__(self, date_format='%Y-%m-%d'):
+        self.date_format = date_format
+        self._days = dict()
+
+    def parse(self, date_string):
+        day = self._days.get(date_string)
+        if day is None:
+            day = self._days[date_string] = datetime.datetime.strptime(date_string, self.date_format)
+        return day
+
+    def __len__(self):
+        return len(self._days)
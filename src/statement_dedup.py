@@ -0,0 +1,161 @@
+'''
+De-duplication of the rows of overlapping IB activity statements. Statements of overlapping periods
+(a partial statement and the statement of the whole year, or every monthly / daily statement there is)
+repeat the same fills, dividends, withholding and interests - a row of a statement is dropped if an
+earlier statement already had it.
+
+A row is kept as a 64-bit fingerprint of its fields and of the number of identical rows before it in
+its statement: the same fill twice in one statement is two fills, while the fills a later statement
+repeats are dropped. Only the fingerprints are kept, not the rows: a sorted uint64 array of them and
+an int32 array of the statement each was first seen in - 12 bytes per distinct row, whatever the
+width of the rows. The fingerprints of a statement are computed, looked up (searchsorted) and merged
+into the sorted array at once (numpy).
+'''
+import hashlib
+import struct
+
+import numpy as np  # pip install numpy
+
+from .tax_generator import ParsedStatement, AllStockSplits
+from .trade_table import TradeTable, TRADE_TABLE_COLUMNS
+
+# Odd constants of the splitmix64 finalizer, mixing every bit of the input into the output
+_MIX_MULTIPLIER_1 = np.uint64(0xbf58476d1ce4e5b9)
+_MIX_MULTIPLIER_2 = np.uint64(0x94d049bb133111eb)
+
+
+def _mix(x):
+    ''':return: splitmix64 finalizer of the uint64 array (or scalar) x'''
+    x = (x ^ (x >> np.uint64(30))) * _MIX_MULTIPLIER_1
+    x = (x ^ (x >> np.uint64(27))) * _MIX_MULTIPLIER_2
+    return x ^ (x >> np.uint64(31))
+
+
+def fingerprint(*fields):
+    ''':return: 64-bit fingerprint of the fields (their repr) - the same in every process, unlike hash()'''
+    return struct.unpack('<Q', hashlib.blake2b(repr(fields).encode(), digest_size=8).digest())[0]
+
+
+def _occurrences(fingerprints):
+    ''':return: array of the number of the same fingerprints before each one'''
+    order = np.argsort(fingerprints, kind='stable')
+    sorted_fingerprints = fingerprints[order]
+    positions = np.arange(len(fingerprints))
+    group_starts = np.ones(len(fingerprints), dtype=bool)
+    group_starts[1:] = sorted_fingerprints[1:] != sorted_fingerprints[:-1]
+    occurrences = np.empty(len(fingerprints), dtype=np.int64)
+    occurrences[order] = positions - np.maximum.accumulate(np.where(group_starts, positions, 0))
+    return occurrences
+
+
+def table_fingerprints(table):
+    ''':return: uint64 array of the fingerprints of the trades of the TradeTable (with their occurrences)'''
+    with np.errstate(over='ignore'):
+        fingerprints = np.full(len(table), np.uint64(fingerprint(table.symbol)))
+        for column in (table.days, table.sides, table.total_shares):
+            fingerprints = _mix(fingerprints ^ np.frombuffer(column, dtype=column.typecode).astype(np.uint64))
+        for column in (table.prices, table.commissions):
+            fingerprints = _mix(fingerprints ^ np.frombuffer(column, dtype=np.float64).view(np.uint64))
+    return _with_occurrences(fingerprints)
+
+
+def _with_occurrences(fingerprints):
+    ''':return: uint64 array of the fingerprints (uint64 array) combined with the number of the same fingerprints
+                before each one'''
+    with np.errstate(over='ignore'):
+        return _mix(fingerprints ^ _mix(_occurrences(fingerprints).astype(np.uint64)))
+
+
+class StatementDeduplicator:
+    '''
+    Add the ParsedStatement of every statement, in statement order (see add()).
+    overlaps - dictionary of (earlier statement, statement) -> dictionary of row kind ('trades', 'dividends',
+               'interests', 'stock_splits') -> number of the rows of statement that were in earlier statement
+    '''
+    def __init__(self):
+        self._fingerprints = np.empty(0, dtype=np.uint64)  # Sorted fingerprints of the rows seen
+        self._owners = np.empty(0, dtype=np.int32)  # Index of the first statement that had each of _fingerprints
+        self._added = []  # Fingerprint arrays of the new rows of the statement being added (see _merge_added)
+        self.statements = []
+        self.overlaps = dict()
+
+    def __len__(self):
+        ''':return: number of distinct rows seen'''
+        return len(self._fingerprints)
+
+    def _keep(self, kind, fingerprints):
+        ''':return: bool array - True for the rows seen first in the statement being added, False for the duplicates'''
+        index = len(self.statements) - 1
+        if not len(self._fingerprints):
+            keep = np.ones(len(fingerprints), dtype=bool)
+        else:
+            # Looked up in sorted order, the array is read sequentially
+            order = np.argsort(fingerprints)
+            positions = np.empty(len(fingerprints), dtype=np.intp)
+            positions[order] = np.searchsorted(self._fingerprints, fingerprints[order])
+            keep = self._fingerprints[np.minimum(positions, len(self._fingerprints) - 1)] != fingerprints
+            owner_counts = np.bincount(self._owners[positions[~keep]], minlength=index)
+            for owner in np.flatnonzero(owner_counts):
+                counts = self.overlaps.setdefault((self.statements[owner], self.statements[index]), dict())
+                counts[kind] = counts.get(kind, 0) + int(owner_counts[owner])
+        self._added.append(fingerprints[keep])
+        return keep
+
+    def _merge_added(self):
+        '''Merge the fingerprints of the statement being added into the sorted fingerprints'''
+        added = np.sort(np.concatenate(self._added)) if self._added else self._fingerprints[:0]
+        self._added = []
+        # A fingerprint twice in the statement is one distinct row
+        added = added[np.concatenate(([True], added[1:] != added[:-1]))] if len(added) else added
+        positions = np.searchsorted(self._fingerprints, added)
+        self._fingerprints = np.insert(self._fingerprints, positions, added)
+        self._owners = np.insert(self._owners, positions, len(self.statements) - 1)
+
+    def add(self, statement_csv, parsed):
+        '''
+        :param parsed: ParsedStatement of statement_csv. Not changed
+        :return: ParsedStatement of the rows of statement_csv that no statement added before had
+        '''
+        self.statements.append(statement_csv)
+        result = ParsedStatement()
+        for symbol, table in parsed.trades.items():
+            keep = self._keep('trades', table_fingerprints(table))
+            if keep.all():
+                result.trades[symbol] = table
+            elif keep.any():
+                result.trades[symbol] = _table_rows(table, np.flatnonzero(keep))
+
+        # The withholding tax of a dividend was joined to it by parse_statement, and goes with it
+        keep = self._keep('dividends', _with_occurrences(np.fromiter(
+            (fingerprint('dividend', dividend.symbol, dividend.date.toordinal(), dividend.value_usd)
+             for dividend in parsed.dividends), dtype=np.uint64, count=len(parsed.dividends))))
+        result.dividends = [dividend for dividend, kept in zip(parsed.dividends, keep) if kept]
+        keep = self._keep('interests', _with_occurrences(np.fromiter(
+            (fingerprint('interest', interest.date.toordinal(), interest.value_usd) for interest in parsed.interests),
+            dtype=np.uint64, count=len(parsed.interests))))
+        result.interests = [interest for interest, kept in zip(parsed.interests, keep) if kept]
+
+        stock_splits = list(parsed.stock_splits)
+        keep = self._keep('stock_splits', np.fromiter(
+            (fingerprint('split', stock_split.symbol, stock_split.date.toordinal(), stock_split.ratio)
+             for stock_split in stock_splits), dtype=np.uint64, count=len(stock_splits)))
+        result.stock_splits = AllStockSplits()
+        for stock_split, kept in zip(stock_splits, keep):
+            if kept:
+                result.stock_splits.add_stock_split(stock_split)
+        self._merge_added()
+        return result
+
+    def print_overlaps(self):
+        for (earlier_statement, statement), counts in self.overlaps.items():
+            print(f'{statement} overlaps {earlier_statement} - ignoring its rows that are in both: ' +
+                  ', '.join(f'{count} {kind}' for kind, count in counts.items()))
+
+
+def _table_rows(table, rows):
+    ''':return: TradeTable of the rows (index array) of table'''
+    result = TradeTable(table.symbol, table.date_class)
+    for column in TRADE_TABLE_COLUMNS:
+        values = getattr(table, column)
+        getattr(result, column).frombytes(np.frombuffer(values, dtype=values.typecode)[rows].tobytes())
+    return result
@@ -1,16 +1,24 @@
 import re
+import bisect
+import math
 from copy import deepcopy
-from xlrd import open_workbook, XL_CELL_TEXT, XL_CELL_DATE  # pip install xlrd==1.2.0
-from xlrd import xldate
-import csv
+from itertools import accumulate
 import datetime
-import texttable as tt
-from .excel_helper import gen_excel_file, write_row, close_workbook
+from .excel_helper import AppendixWriter
+from .console_table import print_table
 import os
-import requests
-import win32com.client  # pip install pypiwin32
-import io
 from .pdf_helpers import generate_form1322_pdf, generate_form1324_pdf
+from .rate_calendar import RateCalendar, EXCHANGE_RATE_SEARCH_RANGE, exchange_rate_not_found
+from .rate_cache import cached_rate_calendar
+from .bank_of_israel import dollar_ils_rate_from_bank_of_israel
+from .run_report import RunReport
+from .statement_decoder import section_rows, DayCache
+from .trade_table import TradeTable, TradeOpen, TradeClose, TRADE_SIDE_OPEN, TRADE_SIDE_CLOSE, merge_trade_tables, \
+    TRADE_TABLE_COLUMNS
+
+# Statement of the tax year that stands for all the statements: the dividends, interests and splits of the tax year
+# are taken from all of them (see parse_statements)
+ALL_STATEMENTS = object()
 
 # Input parameters with default values:
 TAX_YEAR = 2020
@@ -18,16 +26,29 @@ LOSS_FROM_PREV_YEARS = 0
 IB_ACTIVITY_STATEMENT_CSV = 'adam_ibkr_2019.csv'  # IB activity statement CSV file for the entire year (must include trades and dividends)
 IB_ACTIVITY_STATEMENT_CSV_LIST = [os.path.join('annual-statements', '2019.csv'),
                                   os.path.join('annual-statements', '2020.csv')]
-IB_ACTIVITY_STATEMENT_CSV_OF_TAX_YEAR = os.path.join('annual-statements', '2020.csv')
+IB_ACTIVITY_STATEMENT_CSV_OF_TAX_YEAR = os.path.join('annual-statements', '2020.csv')  # ALL_STATEMENTS - the dividends, interests and splits of the tax year from all of IB_ACTIVITY_STATEMENT_CSV_LIST
+DEDUPLICATE_STATEMENTS = True  # Ignore the rows of a statement that an earlier statement of IB_ACTIVITY_STATEMENT_CSV_LIST already had (see statement_dedup.py)
 GET_EXCHANGE_RATES_FROM_WEB = False  # If False - use the BANK_OF_ISRAEL_DOLLAR_ILS_EXCHANGE_XLS file
 EXCHANGE_RATES_FROM_WEB_START_DATE = '30-12-2018'  # All trades must be no earlier than this date
 EXCHANGE_RATES_FROM_WEB_END_DATE = '31-12-2020'  # All trades must be no later than this date
+USE_RATE_CACHE = True  # Cache the parsed BANK_OF_ISRAEL_DOLLAR_ILS_EXCHANGE_XLS file between runs
 GENERATE_EXCEL_FILES = True  # Generate Excel files for appendixes. If False - just print the tables
+CONSOLE_TABLE_ROW_LIMIT = None  # Max rows of each appendix printed to the console. None - all, 0 - only the totals
 GENERATED_FILES_DIR = 'generated_files'  # Dir to generate the files to
 SPLIT_125_FORM = True
+VECTORIZED_FORM1325 = False  # If True - compute the Form 1325 entries with NumPy, without printing every entry
+PARSING_WORKERS = 1  # Processes to parse the statements on, a statement per process. 1 - this process, 0 - the number of CPUs
+PREV_YEAR_END_SNAPSHOT_FILE = None  # Year-end snapshot of the previous tax year (see year_end_snapshot.py). If given - only IB_ACTIVITY_STATEMENT_CSV_OF_TAX_YEAR is parsed (only the trades of the tax year for ALL_STATEMENTS)
+YEAR_END_SNAPSHOT_FILE = None  # File to save the year-end snapshot of the tax year to, for the next tax year. None - not saved
+TRADE_LEDGER_FILE = None  # SQLite ledger to read the trades, dividends and interests from instead of the statements (see ledger.py). None - the statements
+LEDGER_ACCOUNT = None  # Account of the taxpayer in TRADE_LEDGER_FILE. None - the only account of the ledger
+MATCHING_WORKERS = 1  # Processes to match the lots of the symbols on (see parallel_matching.py). 1 - this process, 0 - the number of CPUs
+RUN_REPORT_FILE = None  # JSON file to write the time and memory of every stage of the run to. None - no report
+PROFILE_RUN = False  # If True - dump the cProfile stats of the slowest stage next to the run report
 
 # Constants:
 BANK_OF_ISRAEL_DOLLAR_ILS_EXCHANGE_XLS = 'ExchangeRates.xlsx'
+BANK_OF_ISRAEL_RATE_STORE = os.path.join('.rate_cache', 'bank_of_israel_usd_ils.json')  # Rates downloaded so far
 BANK_OF_ISRAEL_DATE_COL = 0
 BANK_OF_ISRAEL_RATE_COL = 1
 IB_CODE_OPEN = 'O'
@@ -39,12 +60,17 @@ INTEREST_FILE_DESCRIPTION = 'סיכום ריבית'
 FORM_1325_APPENDIX_FILE_NAME = 'stocks_and_summary'
 STOCK_FILE_DESCRIPTION = 'סיכום ניירות ערך'
 FORM_1322_TEMPLATE_PDF = 'itc1322_18.pdf'
-FORM_1322_DEDUCTED_OUTPUT_PDF = os.path.join(GENERATED_FILES_DIR, 'Form1322_deducted.pdf')
-FORM_1322_NOT_DEDUCTED_1_OUTPUT_PDF = os.path.join(GENERATED_FILES_DIR, 'Form1322_not_deducted_1st_half.pdf')
-FORM_1322_NOT_DEDUCTED_2_OUTPUT_PDF = os.path.join(GENERATED_FILES_DIR, 'Form1322_not_deducted_2nd_half.pdf')
+FORM_1322_DEDUCTED_OUTPUT_FILE_NAME = 'Form1322_deducted.pdf'
+FORM_1322_NOT_DEDUCTED_1_OUTPUT_FILE_NAME = 'Form1322_not_deducted_1st_half.pdf'
+FORM_1322_NOT_DEDUCTED_2_OUTPUT_FILE_NAME = 'Form1322_not_deducted_2nd_half.pdf'
+FORM_1322_DEDUCTED_OUTPUT_PDF = os.path.join(GENERATED_FILES_DIR, FORM_1322_DEDUCTED_OUTPUT_FILE_NAME)
+FORM_1322_NOT_DEDUCTED_1_OUTPUT_PDF = os.path.join(GENERATED_FILES_DIR, FORM_1322_NOT_DEDUCTED_1_OUTPUT_FILE_NAME)
+FORM_1322_NOT_DEDUCTED_2_OUTPUT_PDF = os.path.join(GENERATED_FILES_DIR, FORM_1322_NOT_DEDUCTED_2_OUTPUT_FILE_NAME)
 
 FORM_1324_TEMPLATE_PDF = 'itc1324_18.pdf'
-FORM_1324_OUTPUT_PDF = os.path.join(GENERATED_FILES_DIR, 'Form1324.pdf')
+FORM_1324_OUTPUT_FILE_NAME = 'Form1324.pdf'
+FORM_1324_OUTPUT_PDF = os.path.join(GENERATED_FILES_DIR, FORM_1324_OUTPUT_FILE_NAME)
+RUN_REPORT_FILE_NAME = 'run_report.json'
 
 
 def get_existing_exchange_date(date, dollar_ils_rate):
@@ -52,23 +78,27 @@ def get_existing_exchange_date(date, dollar_ils_rate):
     If exchange date does not exist in dict, there must be vacation in Israel
     So try a day earlier - until one exists
     :param date: date to search around
-    :param dollar_ils_rate: parsed exchanges dictionary
+    :param dollar_ils_rate: parsed exchanges dictionary, or RateCalendar built from it
     :return: datetime object as close as possible to date (but no later than date)
              with a rate that exists in dollar_ils_rate
     """
+    if isinstance(dollar_ils_rate, RateCalendar):
+        return dollar_ils_rate.exchange_date(date)
 
-    search_range = 5
+    search_range = EXCHANGE_RATE_SEARCH_RANGE
     exchange_date = None
     for i in range(0, search_range):
         if date - datetime.timedelta(i) in dollar_ils_rate:
             exchange_date = date - datetime.timedelta(i)
             break
     if exchange_date is None:
-        raise Exception('USD/ILS exchange rate not found near closing date: {}'.format(date))
+        raise exchange_rate_not_found(date)
     return exchange_date
 
 
 def dollar_ils_rate_parse_from_excel_file(file):
+    from xlrd import open_workbook, XL_CELL_TEXT, XL_CELL_DATE  # pip install xlrd==1.2.0
+    from xlrd import xldate
     book = open_workbook(file)
     sheet = book.sheet_by_index(0)
 
@@ -97,39 +127,13 @@ def dollar_ils_rate_parse_from_excel_file(file):
 
 
 def dollar_ils_rate_parse_from_bank_of_israel_site():
-    def convert_date(date_str):
-        return date_str.replace('-', '%2F')
-
-    def fetch_corrupted_excel_file():
-        url = f'https://www.boi.org.il/Boi.ashx?Command=DownloadExcel&Currency=3&' \
-              f'DateStart={convert_date(EXCHANGE_RATES_FROM_WEB_START_DATE)}' \
-              f'&DateEnd={convert_date(EXCHANGE_RATES_FROM_WEB_END_DATE)}&webUrl=%2Fhe%2FMarkets%2FExchangeRates'
-        return requests.get(url)
-
-    def fix_corrupted_excel_file(temp_filename, filename):
-        o = win32com.client.Dispatch("Excel.Application")
-        o.Visible = False
-
-        wb = o.Workbooks.Open(temp_filename)
-        wb.ActiveSheet.SaveAs(filename, 51)
-        try:
-            wb.Close()
-        except Exception:
-            print(f'Error closing Excel file: {filename}. Continuing with script anyway')
-
-    temp_filename = os.getcwd() + '/' + '_tmp_exchanges.xls'
-    filename = os.getcwd() + '/' + '_exchanges.xlsx'
-    if os.path.exists(temp_filename):
-        os.remove(temp_filename)
-    if os.path.exists(filename):
-        os.remove(filename)
-
-    response = fetch_corrupted_excel_file()
-    with open(temp_filename, 'wb') as temp:
-        temp.write(response.content)
-
-    fix_corrupted_excel_file(temp_filename, filename)
-    return dollar_ils_rate_parse_from_excel_file(filename)
+    '''
+    USD/ILS rates between EXCHANGE_RATES_FROM_WEB_START_DATE and EXCHANGE_RATES_FROM_WEB_END_DATE.
+    Rates already downloaded are kept in BANK_OF_ISRAEL_RATE_STORE, so only the missing days are downloaded
+    '''
+    start_date = datetime.datetime.strptime(EXCHANGE_RATES_FROM_WEB_START_DATE, '%d-%m-%Y').date()
+    end_date = datetime.datetime.strptime(EXCHANGE_RATES_FROM_WEB_END_DATE, '%d-%m-%Y').date()
+    return dollar_ils_rate_from_bank_of_israel(start_date, end_date, BANK_OF_ISRAEL_RATE_STORE)
 
 
 def dollar_ils_rate_parse():
@@ -138,41 +142,14 @@ def dollar_ils_rate_parse():
     return dollar_ils_rate_parse_from_bank_of_israel_site()
 
 
-class Trade():
-    def __init__(self):
-        self.symbol = ''
-        self.commission = 0
-        self.transaction_price = 0
-        self.date = None
-        self.total_shares_num = 0
-        self.shares_left = 0
-
-    def __str__(self):
-        return 'Trade: symbol:{}, date:{} comm:{}, price:{}'.format(self.symbol, self.date, self.commission, self.transaction_price)
-
-
-class TradeOpen(Trade):
-    def __init__(self, **kwargs):
-        super().__init__()
-        for key, value in kwargs.items():  # kwargs is a regular dictionary
-            setattr(self, key, value)
-    def __repr__(self):
-        return self.__str__()
-
-
-class TradeClose(Trade):
-    def __init__(self, **kwargs):
-        super().__init__()
-        self.realized = 0.0
-        self.shares_covered = 0
-        for key, value in kwargs.items():  # kwargs is a regular dictionary
-            setattr(self, key, value)
-
-    def __str__(self):
-        return '{}, realized:{}'.format(super().__str__(), self.realized)
-
-    def __repr__(self):
-        return self.__str__()
+def dollar_ils_rate_calendar():
+    '''
+    RateCalendar of the USD/ILS rates. The BANK_OF_ISRAEL_DOLLAR_ILS_EXCHANGE_XLS file is
+    only parsed if it changed since it was last cached (see rate_cache.py)
+    '''
+    if not GET_EXCHANGE_RATES_FROM_WEB and USE_RATE_CACHE:
+        return cached_rate_calendar(BANK_OF_ISRAEL_DOLLAR_ILS_EXCHANGE_XLS, dollar_ils_rate_parse_from_excel_file)
+    return RateCalendar(dollar_ils_rate_parse())
 
 
 class StockSplit:
@@ -188,98 +165,196 @@ class StockSplit:
         return self.__str__()
 
 
+class SplitIndex:
+    '''
+    The stock splits of a single symbol, sorted by date, with the products of their ratios:
+    cumulative_ratios[i] is the product of the ratios of the first i splits.
+    The splits between any two dates are found by bisect, in O(log k) for k splits.
+    '''
+    def __init__(self, splits):
+        self.splits = sorted(splits, key=lambda split: split.date)
+        self.dates = [split.date for split in self.splits]
+        self.cumulative_ratios = [1]
+        for split in self.splits:
+            self.cumulative_ratios.append(self.cumulative_ratios[-1] * split.ratio)
+
+    def position_after(self, date):
+        ''':return: index of the first split later than date'''
+        return bisect.bisect_right(self.dates, date)
+
+    def position_before(self, date):
+        ''':return: index of the first split on date or later - the splits before it are earlier than date'''
+        return bisect.bisect_left(self.dates, date)
+
+    def ratio(self, start, end):
+        ''':return: product of the ratios of the splits start, ..., end - 1 (positions)'''
+        if end <= start:
+            return 1
+        if self.cumulative_ratios[start] == 0:
+            # A reverse split (ratio truncated to 0 by StockSplit) before start - no prefix to divide by
+            return math.prod(split.ratio for split in self.splits[start:end])
+        return self.cumulative_ratios[end] // self.cumulative_ratios[start]
+
+    def ratio_between(self, start_date, end_date):
+        ''':return: product of the ratios of the splits strictly between start_date and end_date'''
+        return self.ratio(self.position_after(start_date), self.position_before(end_date))
+
+
 class AllStockSplits:
     def __init__(self):
         self._d = {}
+        self._indexes = {}  # symbol -> SplitIndex, built on first use
 
     def add_stock_split(self, stock_split):
-        def sort_key(stock_split):
-            return stock_split.date
+        self._d.setdefault(stock_split.symbol, []).append(stock_split)
+        self._indexes.pop(stock_split.symbol, None)
 
-        if stock_split.symbol not in self._d:
-            self._d[stock_split.symbol] = [stock_split]
-        else:
-            self._d[stock_split.symbol].append(stock_split)
-            self._d[stock_split.symbol].sort(key=sort_key)
+    def get_split_index(self, symbol):
+        ''':return: SplitIndex of the splits of symbol'''
+        index = self._indexes.get(symbol)
+        if index is None:
+            index = self._indexes[symbol] = SplitIndex(self._d.get(symbol, []))
+        return index
 
     def get_stock_splits_for_symbol(self, symbol):
-        try:
-            return self._d[symbol]
-        except KeyError:
+        ''':return: list of the splits of symbol, sorted by date'''
+        if symbol not in self._d:
             return []
+        return self.get_split_index(symbol).splits
+
+    def __iter__(self):
+        ''':return: iterator of the splits of all the symbols, sorted by date'''
+        stock_splits = (stock_split for symbol in self._d for stock_split in self.get_stock_splits_for_symbol(symbol))
+        return iter(sorted(stock_splits, key=lambda stock_split: stock_split.date))
 
     def __str__(self):
-        return f'{self._d}'
+        return f'{ {symbol: self.get_stock_splits_for_symbol(symbol) for symbol in self._d} }'
 
     def __repr__(self):
         return self.__str__()
 
 
+STATEMENT_SECTIONS = ('Trades', 'Dividends', 'Withholding Tax', 'Interest', 'Corporate Actions')
+# Columns of the sections read by the section parsers (see statement_decoder.py)
+TRADES_COLUMNS = ('Code', 'Symbol', 'Date/Time', 'Quantity', 'T. Price', 'Comm/Fee', 'Realized P/L')
+CASH_COLUMNS = ('Currency', 'Date', 'Description', 'Amount')  # Dividends, Withholding Tax and Interest
+CORPORATE_ACTIONS_COLUMNS = ('Asset Category', 'Report Date', 'Description')
+FLEX_STATEMENT_EXTENSION = '.xml'  # Statements with this extension are Flex Query XML exports (see flex_statement.py)
+
+
+class ParsedStatement:
+    '''
+    Everything the tax calculation needs from IB activity statement(s),
+    collected in a single pass over each file:
+    trades - dictionary of the TradeTable of every symbol (see trades_parse)
+    dividends - list of Dividend objects, tax_deducted_usd taken from the withholding section
+    interests - list of Interest objects
+    stock_splits - AllStockSplits object
+    overlaps - dictionary of (earlier statement, statement) -> dictionary of row kind -> number of the rows
+               of statement that were ignored, as earlier statement had them (see statement_dedup.py)
+    '''
+    def __init__(self):
+        self.trades = dict()
+        self.dividends = []
+        self.interests = []
+        self.stock_splits = AllStockSplits()
+        self.overlaps = dict()
+
+    def __str__(self):
+        return f'(ParsedStatement: {sum(len(l) for l in self.trades.values())} trades, ' \
+               f'{len(self.dividends)} dividends, {len(self.interests)} interests, splits: {self.stock_splits})'
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def _read_statement_sections(statement_csv, sections=STATEMENT_SECTIONS):
+    '''
+    Scan the statement once and bucket the lines of the requested sections
+    :return: dictionary of section name -> list of the section's lines (header line included)
+    '''
+    section_lines = {section: [] for section in sections}
+    prefixes = tuple(section + ',' for section in sections)
+    with open(statement_csv) as ib_csv_file:
+        for ln in ib_csv_file:
+            if ln.startswith(prefixes):
+                section_lines[ln[:ln.index(',')]].append(ln)
+    return section_lines
+
+
 '''
 The trades will be held in the following data structure:
 {
-    'AMZN': [
+    'AMZN': TradeTable([
         Trade0,
         Trade1,
         ...
         Traden
-    ],
-    'GOOGL': [
+    ]),
+    'GOOGL': TradeTable([
         Trade0,
         Trade1,
         ...
         Traden
-    ]
+    ])
 }
+A TradeTable keeps the trades of a symbol as columns, and gives TradeOpen / TradeClose views of them
 '''
-def trades_parse(statements):
-    dic = dict()
-    transaction_list = []
-    for statement_csv in statements:
-        with open(statement_csv) as ib_csv_file:
-            id = []
-            for ln in ib_csv_file:
-                if ln.startswith("Trades,"):
-                    id.append(ln)
-
-            s = '\n'.join(id)
-
-            csv_reader = csv.DictReader(io.StringIO(s))
-
-            for row in csv_reader:
-                try:
-                    open_close = row['Code']
-                except Exception as e:
-                    print(e)
-                    continue
-
-                if open_close == IB_CODE_OPEN or IB_CODE_OPEN + ';' in open_close:
-                    trade = TradeOpen()
-                elif open_close == IB_CODE_CLOSE:
-                    trade = TradeClose()
-                    trade.realized = float(row['Realized P/L'])
-                else:
-                    continue
-
-                trade.symbol = row['Symbol']
-                # Commssion is represented by a negative number - store it as positive
-                # because we later add it to the original price
-                trade.commission = abs(float(row['Comm/Fee']))
-                trade.transaction_price = float(row['T. Price'])
-                # row['Date/Time'] looks like this 2019-04-22, 14:04:29
-                # We discard the part after the comma so the time is 0, as with the USD/ILS exchange file
-                trade.date = datetime.datetime.strptime(row['Date/Time'].split(',')[0], '%Y-%m-%d')
-                # Will be negative for sell transactions
-                trade.total_shares_num = int(row['Quantity'].replace(',', ''))
-                trade.shares_left = trade.total_shares_num
-                # If symbol not in dic - create empty list for it
-                if trade.symbol not in dic:
-                    dic[trade.symbol] = []
-
-                # Append the trade to the list of trades for this symbol
-                dic[trade.symbol].append(trade)
+def _parse_trades_section(lines, dic):
+    try:
+        _parse_trade_rows(section_rows(lines, TRADES_COLUMNS), dic)
+    except KeyError as e:
+        # Not a trades section we know
+        print(e)
+
+
+def _parse_trade_rows(rows, dic, days=None):
+    '''
+    :param rows: tuples of the TRADES_COLUMNS fields of the trades, as in the statement CSV
+    :param dic: dictionary of symbol -> TradeTable to add the trades to
+    '''
+    days = DayCache() if days is None else days
+    for open_close, symbol, date_time, quantity, price, commission, realized in rows:
+        if open_close == IB_CODE_OPEN or IB_CODE_OPEN + ';' in open_close:
+            side = TRADE_SIDE_OPEN
+            realized = 0.0
+        elif open_close == IB_CODE_CLOSE:
+            side = TRADE_SIDE_CLOSE
+            realized = float(realized)
+        else:
+            continue
+
+        # If symbol not in dic - create empty table for it
+        table = dic.get(symbol)
+        if table is None:
+            table = dic[symbol] = TradeTable(symbol)
+
+        # Append the trade to the trades of this symbol
+        table.append(side,
+                     # date_time looks like this 2019-04-22, 14:04:29
+                     # We discard the part after the comma so the time is 0, as with the USD/ILS exchange file
+                     days.parse(date_time.split(',')[0]),
+                     float(price),
+                     # Will be negative for sell transactions
+                     int(quantity.replace(',', '')),
+                     # Commssion is represented by a negative number - store it as positive
+                     # because we later add it to the original price
+                     abs(float(commission)),
+                     realized)
+
+
+def _merge_trades(dics):
+    '''
+    :param dics: dictionaries of symbol -> TradeTable, one per statement, in statement order
+    :return: dictionary of symbol -> TradeTable with the trades of all the statements, in chronological order
+             (see merge_trade_tables)
+    '''
+    tables_of_symbol = dict()
+    for dic in dics:
+        for symbol, table in dic.items():
+            tables_of_symbol.setdefault(symbol, []).append(table)
+    return {symbol: merge_trade_tables(tables) for symbol, tables in tables_of_symbol.items()}
 
-    return dic
 
 class Dividend():
     def __init__(self):
@@ -297,80 +372,79 @@ The dividends will be held in the following stucture:
     Dividendn,
 ]
 '''
-def dividends_parse():
+def _parse_dividends_section(lines):
+    return _parse_dividend_rows(section_rows(lines, CASH_COLUMNS))
+
+
+def _parse_dividend_rows(rows, days=None):
+    ''':param rows: tuples of the CASH_COLUMNS fields of the dividends, as in the statement CSV'''
     dividend_list = []
-    dividend_helper_dict = {}
-    with open(IB_ACTIVITY_STATEMENT_CSV_OF_TAX_YEAR) as ib_csv_file:
-        id = []
-        for ln in ib_csv_file:
-            if ln.startswith("Dividends,"):
-                id.append(ln)
+    days = DayCache() if days is None else days
 
-        s = '\n'.join(id)
+    for currency, date, description, amount in rows:
+        # If end of dividends
+        if currency == 'Total':
+            break
 
-        csv_reader = csv.DictReader(io.StringIO(s))
+        dividend = Dividend()
+        dividend.symbol = description.split('(')[0]
+        # date looks like this 2019-04-22
+        dividend.date = days.parse(date)
+        dividend.value_usd = float(amount)
+        dividend_list.append(dividend)
 
-        for row in csv_reader:
-            # If end of dividends
-            if row['Currency'] == 'Total':
-                break
+    return dividend_list
 
-            dividend = Dividend()
-            dividend.symbol = row['Description'].split('(')[0]
-            # row['Date/Time'] looks like this 2019-04-22
-            dividend.date = datetime.datetime.strptime(row['Date'], '%Y-%m-%d')
-            dividend.value_usd = float(row['Amount'])
-            dividend_list.append(dividend)
-            dividend_helper_dict[f'{dividend.symbol}-{dividend.date}'] = dividend
-
-    # Get tax deducted
-    with open(IB_ACTIVITY_STATEMENT_CSV_OF_TAX_YEAR) as ib_csv_file:
-        id = []
-        for ln in ib_csv_file:
-            if ln.startswith("Withholding Tax,"):
-                id.append(ln)
 
-        s = '\n'.join(id)
+def _parse_withholding_tax_section(lines, dividend_list):
+    _parse_withholding_tax_rows(section_rows(lines, CASH_COLUMNS), dividend_list)
 
-        csv_reader = csv.DictReader(io.StringIO(s))
 
-        for row in csv_reader:
-            # If end of dividends
-            if row['Currency'] == 'Total':
-                break
-            symbol = row['Description'].split('(')[0]
-            date = f'{row["Date"]} 00:00:00'
-            dividend_helper_dict[f'{symbol}-{date}'].tax_deducted_usd = 0 - float(row['Amount'])
+def _parse_withholding_tax_rows(rows, dividend_list):
+    ''':param rows: tuples of the CASH_COLUMNS fields of the withholding tax of dividend_list'''
+    dividend_helper_dict = {f'{dividend.symbol}-{dividend.date}': dividend for dividend in dividend_list}
 
-    return dividend_list
+    for currency, date, description, amount in rows:
+        # If end of dividends
+        if currency == 'Total':
+            break
+        symbol = description.split('(')[0]
+        date = f'{date} 00:00:00'
+        dividend_helper_dict[f'{symbol}-{date}'].tax_deducted_usd = 0 - float(amount)
 
 
 class Interest:
+    __slots__ = ('date', 'value_usd', 'usd_ils_rate', '_value_ils')
+
     def __init__(self, date, value_usd):
-        self.exchanges_dict = None
         self.date = date
         self.value_usd = value_usd
+        self.usd_ils_rate = None
+        self._value_ils = None
 
     @property
     def value_ils(self):
-        if self.exchanges_dict is None:
+        if self._value_ils is None:
             raise Exception('Interest object not populated')
-        return self.value_usd * self.exchanges_dict[get_existing_exchange_date(self.date, self.exchanges_dict)]
+        return self._value_ils
 
     def __str__(self):
         return 'date\tvalue_usd\tvalue_ils\tusd_ils_rate\n' \
-               '<{}\t{}\t{}\t{}>'.format(self.date, self.value_usd, self.value_ils,
-                                         self.exchanges_dict[get_existing_exchange_date(self.date, self.exchanges_dict)])
+               '<{}\t{}\t{}\t{}>'.format(self.date, self.value_usd, self.value_ils, self.usd_ils_rate)
 
     def __repr__(self):
         return self.__str__()
 
     def to_list(self):
-        return [self.date, self.value_usd, self.value_ils,
-                self.exchanges_dict[get_existing_exchange_date(self.date, self.exchanges_dict)]]
+        return [self.date, self.value_usd, self.value_ils, self.usd_ils_rate]
 
     def populate(self, usd_ils_rate_dict):
-        self.exchanges_dict = usd_ils_rate_dict
+        self.set_rate(usd_ils_rate_dict[get_existing_exchange_date(self.date, usd_ils_rate_dict)])
+
+    def set_rate(self, usd_ils_rate):
+        '''Convert to ILS with the rate of the date, once'''
+        self.usd_ils_rate = usd_ils_rate
+        self._value_ils = self.value_usd * usd_ils_rate
 
     
 '''
@@ -382,66 +456,195 @@ The interests will be held in the following stucture:
     Interestn,
 ]
 '''
-def interest_parse():
-    interest_list = []
-    with open(IB_ACTIVITY_STATEMENT_CSV_OF_TAX_YEAR) as ib_csv_file:
-        id = []
-        for ln in ib_csv_file:
-            if ln.startswith("Interest,"):
-                id.append(ln)
+def _parse_interest_section(lines):
+    return _parse_interest_rows(section_rows(lines, CASH_COLUMNS))
 
-        s = '\n'.join(id)
 
-        csv_reader = csv.DictReader(io.StringIO(s))
+def _parse_interest_rows(rows, days=None):
+    ''':param rows: tuples of the CASH_COLUMNS fields of the interests, as in the statement CSV'''
+    interest_list = []
+    days = DayCache() if days is None else days
 
-        for row in csv_reader:
-            # If end of interests
-            if row['Currency'] == 'Total':
-                break
+    for currency, date, _, amount in rows:
+        # If end of interests
+        if currency == 'Total':
+            break
 
-            # interest.symbol = row['Description'].split('(')[0]
-            # row['Date/Time'] looks like this 2019-04-22
-            date = datetime.datetime.strptime(row['Date'], '%Y-%m-%d')
-            value_usd = float(row['Amount'])
-            interest_list.append(Interest(date, value_usd))
+        # date looks like this 2019-04-22
+        interest_list.append(Interest(days.parse(date), float(amount)))
 
     return interest_list
 
 
-def stock_splits_parse():
-    splits = AllStockSplits()
-    with open(IB_ACTIVITY_STATEMENT_CSV_OF_TAX_YEAR) as ib_csv_file:
-        id = []
-        for ln in ib_csv_file:
-            if ln.startswith("Corporate Actions,"):
-                id.append(ln)
+def _parse_corporate_actions_section(lines, splits):
+    _parse_corporate_action_rows(section_rows(lines, CORPORATE_ACTIONS_COLUMNS), splits)
+
 
-        s = '\n'.join(id)
+def _parse_corporate_action_rows(rows, splits):
+    ''':param rows: tuples of the CORPORATE_ACTIONS_COLUMNS fields of the corporate actions, as in the statement CSV'''
+    for row in rows:
+        asset_category, report_date, description = row
+        # If end of interests
+        if asset_category == 'Total':
+            break
 
-        csv_reader = csv.DictReader(io.StringIO(s))
+        try:
+            # report_date looks like this 2019-04-22
+            date = datetime.datetime.strptime(report_date, '%Y-%m-%d')
+            r = r"([A-Z]+)\(.+Split (\d+) for (\d+)"
+            m = re.match(r, description)
+            symbol = m.groups()[0]
+            after_split = int(m.groups()[1])
+            before_split = int(m.groups()[2])
+
+            stock_split = StockSplit(symbol, date, after_split / before_split)
+            splits.add_stock_split(stock_split)
+        except Exception as e:
+            print(f'Ignoring Corporate Actions row: {dict(zip(CORPORATE_ACTIONS_COLUMNS, row))}. Is not stock split')
+            pass
+
+
+def parse_statement(statement_csv, sections=STATEMENT_SECTIONS):
+    '''
+    Read an IB activity statement once and parse each of the requested sections
+    with its own parser
+    :param statement_csv: path of the IB activity statement CSV file, or of a Flex Query XML export
+                          (FLEX_STATEMENT_EXTENSION)
+    :param sections: the sections to parse (subset of STATEMENT_SECTIONS)
+    :return: ParsedStatement object
+    '''
+    if statement_csv.lower().endswith(FLEX_STATEMENT_EXTENSION):
+        from .flex_statement import parse_flex_statement
+        return parse_flex_statement(statement_csv, sections)
+    section_lines = _read_statement_sections(statement_csv, sections)
+    statement = ParsedStatement()
+    if 'Trades' in section_lines:
+        _parse_trades_section(section_lines['Trades'], statement.trades)
+    if 'Dividends' in section_lines:
+        statement.dividends = _parse_dividends_section(section_lines['Dividends'])
+    # Withholding tax rows refer to the dividends - parse them after the dividends
+    if 'Withholding Tax' in section_lines:
+        _parse_withholding_tax_section(section_lines['Withholding Tax'], statement.dividends)
+    if 'Interest' in section_lines:
+        statement.interests = _parse_interest_section(section_lines['Interest'])
+    if 'Corporate Actions' in section_lines:
+        _parse_corporate_actions_section(section_lines['Corporate Actions'], statement.stock_splits)
+    return statement
+
+
+def _parse_statement_files(statements, sections=STATEMENT_SECTIONS, workers=None):
+    '''
+    :param workers: number of processes to parse the statements on, a statement per process.
+                    1 - this process, 0 - the number of CPUs. Default: PARSING_WORKERS
+    :return: list of the ParsedStatement of every statement, in the order of statements
+    '''
+    workers = PARSING_WORKERS if workers is None else workers
+    if workers == 1 or len(statements) <= 1:
+        return [parse_statement(statement_csv, sections) for statement_csv in statements]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(statements))) as pool:
+        return list(pool.map(parse_statement, statements, [sections] * len(statements)))
+
+
+def _deduplicate_statements(statements, parsed_statements):
+    '''
+    :return: (list of the ParsedStatement of the rows of every statement that no earlier statement had,
+              overlaps - see ParsedStatement)
+    '''
+    from .statement_dedup import StatementDeduplicator
+    deduplicator = StatementDeduplicator()
+    unique_statements = [deduplicator.add(statement_csv, statement)
+                         for statement_csv, statement in zip(statements, parsed_statements)]
+    deduplicator.print_overlaps()
+    return unique_statements, deduplicator.overlaps
+
+
+def _trades_from_year(trade_dic, start_year):
+    ''':return: dictionary of symbol -> TradeTable of the trades of trade_dic from the start of start_year'''
+    start_day = datetime.date(start_year, 1, 1).toordinal()
+    trades = dict()
+    for symbol, table in trade_dic.items():
+        # The merged tables are chronological
+        first_row = bisect.bisect_left(table.days, start_day)
+        if first_row == 0:
+            trades[symbol] = table
+        elif first_row < len(table):
+            year_table = TradeTable(symbol, table.date_class)
+            for column in TRADE_TABLE_COLUMNS:
+                getattr(year_table, column).extend(getattr(table, column)[first_row:])
+            trades[symbol] = year_table
+    return trades
+
+
+def parse_statements(statements, tax_year_statement, workers=None, deduplicate=None, tax_year=None, start_year=None):
+    '''
+    Parse all the statements, reading each file only once
+    :param statements: list of IB activity statement CSV files. Trades are taken from all of them, and merged
+                       chronologically - trades of the same day in the order of statements
+    :param tax_year_statement: statement of the tax year. Dividends, interests and stock splits are taken from it.
+                               ALL_STATEMENTS - those of tax_year, from all the statements
+    :param workers: number of processes to parse the statements on (see _parse_statement_files)
+    :param deduplicate: if True - the rows of a statement that an earlier statement had are ignored
+                        (see statement_dedup.py). Default: DEDUPLICATE_STATEMENTS
+    :param start_year: only the trades from the start of start_year are taken (the trades before it are in a
+                       year-end snapshot). None - all the trades
+    :return: ParsedStatement object
+    '''
+    deduplicate = DEDUPLICATE_STATEMENTS if deduplicate is None else deduplicate
+    statements = list(statements)
+    parsed_statements = _parse_statement_files(statements, workers=workers)
+    parsed = ParsedStatement()
+    unique_statements = parsed_statements
+    if deduplicate:
+        unique_statements, parsed.overlaps = _deduplicate_statements(statements, parsed_statements)
+    parsed.trades = _merge_trades(statement.trades for statement in unique_statements)
+    if start_year is not None:
+        parsed.trades = _trades_from_year(parsed.trades, start_year)
+    if tax_year_statement is ALL_STATEMENTS:
+        if tax_year is None:
+            raise Exception('Give the tax year to take its dividends, interests and stock splits from all the statements')
+        for statement in unique_statements:
+            parsed.dividends.extend(dividend for dividend in statement.dividends if dividend.date.year == tax_year)
+            parsed.interests.extend(interest for interest in statement.interests if interest.date.year == tax_year)
+            for stock_split in statement.stock_splits:
+                if stock_split.date.year == tax_year:
+                    parsed.stock_splits.add_stock_split(stock_split)
+        return parsed
+
+    if tax_year_statement in statements:
+        tax_year_parsed = parsed_statements[statements.index(tax_year_statement)]
+    else:
+        tax_year_parsed = parse_statement(tax_year_statement, sections=STATEMENT_SECTIONS[1:])
+
+    parsed.dividends = tax_year_parsed.dividends
+    parsed.interests = tax_year_parsed.interests
+    parsed.stock_splits = tax_year_parsed.stock_splits
+    return parsed
+
+
+def trades_parse(statements, workers=None, deduplicate=None):
+    '''
+    :param deduplicate: if True - the fills of a statement that an earlier statement had are ignored.
+                        Default: DEDUPLICATE_STATEMENTS
+    '''
+    deduplicate = DEDUPLICATE_STATEMENTS if deduplicate is None else deduplicate
+    statements = list(statements)
+    parsed_statements = _parse_statement_files(statements, sections=('Trades',), workers=workers)
+    if deduplicate:
+        parsed_statements, _ = _deduplicate_statements(statements, parsed_statements)
+    return _merge_trades(statement.trades for statement in parsed_statements)
+
+
+def dividends_parse():
+    return parse_statement(IB_ACTIVITY_STATEMENT_CSV_OF_TAX_YEAR, sections=('Dividends', 'Withholding Tax')).dividends
 
-        for row in csv_reader:
-            # If end of interests
-            if row['Asset Category'] == 'Total':
-                break
 
-            try:
-                # interest.symbol = row['Description'].split('(')[0]
-                # row['Date/Time'] looks like this 2019-04-22
-                date = datetime.datetime.strptime(row['Report Date'], '%Y-%m-%d')
-                r = r"([A-Z]+)\(.+Split (\d+) for (\d+)"
-                m = re.match(r, row['Description'])
-                symbol = m.groups()[0]
-                after_split = int(m.groups()[1])
-                before_split = int(m.groups()[2])
+def interest_parse():
+    return parse_statement(IB_ACTIVITY_STATEMENT_CSV_OF_TAX_YEAR, sections=('Interest',)).interests
 
-                stock_split = StockSplit(symbol, date, after_split / before_split)
-                splits.add_stock_split(stock_split)
-            except Exception as e:
-                print(f'Ignoring Corporate Actions row: {row}. Is not stock split')
-                pass
 
-    return splits
+def stock_splits_parse():
+    return parse_statement(IB_ACTIVITY_STATEMENT_CSV_OF_TAX_YEAR, sections=('Corporate Actions',)).stock_splits
 
 class Form1325Entry():
     def __init__(self):
@@ -469,14 +672,63 @@ class Form1325Entry():
 
 
 class Form1325:
+    '''
+    Form 1325 entries, in the order they were created (entry_list), and their totals.
+    add_totals() also indexes the entries by sale date, with prefix sums of the profits, losses and sales,
+    so the totals of any date range take two binary searches (see date_range())
+    '''
     def __init__(self):
         self.entry_list = []
 
     def add_totals(self):
+        '''Sum and index entry_list. Call again after entry_list changes'''
         self.total_profits = sum([entry.profit_loss for entry in self.entry_list if entry.profit_loss >= 0])
         self.total_losses = sum([entry.profit_loss for entry in self.entry_list if entry.profit_loss < 0])
         self.total_sales = sum([entry.sale_value for entry in self.entry_list])
 
+        self.entries_by_sale_date = sorted(self.entry_list, key=lambda entry: entry.sale_date)
+        self.sale_dates = [entry.sale_date for entry in self.entries_by_sale_date]
+        # x_prefix[i] is the total of the first i entries by sale date
+        self.profits_prefix = list(accumulate((entry.profit_loss if entry.profit_loss >= 0 else 0
+                                               for entry in self.entries_by_sale_date), initial=0))
+        self.losses_prefix = list(accumulate((entry.profit_loss if entry.profit_loss < 0 else 0
+                                              for entry in self.entries_by_sale_date), initial=0))
+        self.sales_prefix = list(accumulate((entry.sale_value for entry in self.entries_by_sale_date), initial=0))
+
+    def date_range(self, start_date, end_date):
+        ''':return: Form1325Period of the entries sold from start_date (including) to end_date (excluding)'''
+        return Form1325Period(self, bisect.bisect_left(self.sale_dates, start_date),
+                              bisect.bisect_left(self.sale_dates, end_date))
+
+    def periods(self, boundaries):
+        '''
+        :param boundaries: ascending dates, e.g. the first days of the months of a year and of the next year
+        :return: list of Form1325Period, one between every two consecutive boundaries
+        '''
+        return [self.date_range(start_date, end_date) for start_date, end_date in zip(boundaries, boundaries[1:])]
+
+
+class Form1325Period:
+    '''
+    View of the entries of a Form1325 sold in a date range - positions start to end of entries_by_sale_date.
+    The totals are differences of the prefix sums of the form. Nothing is copied: entry_list is sliced on access,
+    and is ordered by sale date
+    '''
+    def __init__(self, form1325, start, end):
+        self.form1325 = form1325
+        self.start = start
+        self.end = max(start, end)
+        self.total_profits = form1325.profits_prefix[self.end] - form1325.profits_prefix[start]
+        self.total_losses = form1325.losses_prefix[self.end] - form1325.losses_prefix[start]
+        self.total_sales = form1325.sales_prefix[self.end] - form1325.sales_prefix[start]
+
+    @property
+    def entry_list(self):
+        return self.form1325.entries_by_sale_date[self.start:self.end]
+
+    def __len__(self):
+        return self.end - self.start
+
 def _tax_to_pay(nominal_profit_loss, inflational_profit_loss):
     taxable = 0
     real_profit_lost = nominal_profit_loss - inflational_profit_loss
@@ -528,74 +780,192 @@ def _tax_to_pay(nominal_profit_loss, inflational_profit_loss):
 
 
 def handle_stock_split(opening_trade, closing_trade, stock_splits):
-    symbol = opening_trade.symbol
-    splits_for_symbol = stock_splits.get_stock_splits_for_symbol(symbol)
-    x = 1
-    for split in splits_for_symbol:
-        if split.date > opening_trade.date and split.date < closing_trade.date:
-            opening_trade.shares_left *= split.ratio
-            opening_trade.total_shares_num *= split.ratio
-            opening_trade.transaction_price /= split.ratio
+    '''
+    Adjust the shares and price of opening_trade to the splits between it and closing_trade.
+    Every split is applied to a lot exactly once: the lot keeps the position (in the SplitIndex
+    of its symbol) of the first split not applied to it yet, so closing the lot with several
+    trades does not apply the same split again.
+    '''
+    apply_stock_splits(opening_trade, closing_trade.date, stock_splits)
+
+
+def apply_stock_splits(opening_trade, date, stock_splits):
+    '''Adjust the shares and price of opening_trade to the splits after it and before date (see handle_stock_split)'''
+    index = stock_splits.get_split_index(opening_trade.symbol)
+    if not index.dates:
+        return
+    applied = opening_trade.splits_applied
+    if applied is None:
+        applied = index.position_after(opening_trade.date)
+    end = index.position_before(date)
+    if end > applied:
+        ratio = index.ratio(applied, end)
+        opening_trade.shares_left *= ratio
+        opening_trade.total_shares_num *= ratio
+        opening_trade.transaction_price /= ratio
+        opening_trade.splits_applied = end
+    elif opening_trade.splits_applied is None:
+        opening_trade.splits_applied = applied
+
+
+class OpenLotQueue:
+    '''
+    FIFO queue of the opening trades (lots) of a single symbol.
+    Lots are consumed from the head of the queue, and fully consumed lots are never
+    visited again, so closing all the trades of a symbol is linear in the number of trades.
+    '''
+    def __init__(self, trade_list):
+        self._lots = [trade for trade in trade_list if type(trade) is TradeOpen]
+        # Index of the first lot that may still have shares left
+        self._head = 0
+
+    def close(self, closing_trade, stock_splits):
+        '''
+        Cover closing_trade with the oldest lots that still have shares left
+        :return: list of tuples (TradeClose, TradeOpen, num_of_shares)
+        '''
+        opening_shares_list = []
+        lots = self._lots
+        i = self._head
+        while i < len(lots):
+            opening_trade = lots[i]
+            # If no shares left in opening trade - skip to next trade
+            if opening_trade.shares_left == 0:
+                if i == self._head:
+                    self._head += 1
+                i += 1
+                continue
+            covered = 0
+
+            handle_stock_split(opening_trade, closing_trade, stock_splits)
+            # If opening trade shares cover all closing trade shares
+            if opening_trade.shares_left + closing_trade.shares_left >= 0:
+                covered += abs(closing_trade.shares_left)
+                opening_trade.shares_left += closing_trade.shares_left
+                closing_trade.shares_left = 0
+            # If all opening shares cover some closing shared
+            elif opening_trade.shares_left > 0 and opening_trade.shares_left + closing_trade.shares_left < 0:
+                covered += abs(opening_trade.shares_left)
+                closing_trade.shares_left += opening_trade.shares_left
+                opening_trade.shares_left = 0
+
+            opening_shares_list.append((closing_trade, opening_trade, covered))
+
+            # Lots that are used up are dropped from the head of the queue.
+            # (A lot with negative shares is never used up, and stays in the queue)
+            if opening_trade.shares_left == 0 and i == self._head:
+                self._head += 1
+
+            # If nothing left to cover - stop and let the next closing trade continue from here
+            if closing_trade.shares_left == 0:
+                break
+            i += 1
+
+        return opening_shares_list
+
+
+def _match_table_lots(table, stock_splits):
+    '''
+    match_symbol_lots() of a TradeTable: the FIFO lot queue of OpenLotQueue, on the rows of the table.
+    The shares are read and written in the shares_left column - views are only created for the result
+    '''
+    shares_left = table.shares_left
+    has_splits = bool(stock_splits.get_split_index(table.symbol).dates)
+    open_view = TradeOpen._view
+    close_view = TradeClose._view
+    lots = [row for row, side in enumerate(table.sides) if side == TRADE_SIDE_OPEN]
+    head = 0
+    opening_shares_lists = []
+    for close_row, side in enumerate(table.sides):
+        if side != TRADE_SIDE_CLOSE:
+            continue
+        closing_trade = close_view(table, close_row)
+        opening_shares_list = []
+        i = head
+        while i < len(lots):
+            row = lots[i]
+            if shares_left[row] == 0:
+                if i == head:
+                    head += 1
+                i += 1
+                continue
+            opening_trade = open_view(table, row)
+            if has_splits:
+                handle_stock_split(opening_trade, closing_trade, stock_splits)
+            open_left = shares_left[row]
+            close_left = shares_left[close_row]
+            covered = 0
+            if open_left + close_left >= 0:
+                covered += abs(close_left)
+                shares_left[row] = open_left + close_left
+                shares_left[close_row] = 0
+            elif open_left > 0 and open_left + close_left < 0:
+                covered += abs(open_left)
+                shares_left[close_row] = close_left + open_left
+                shares_left[row] = 0
+
+            opening_shares_list.append((closing_trade, opening_trade, covered))
+
+            if shares_left[row] == 0 and i == head:
+                head += 1
+            if shares_left[close_row] == 0:
+                break
+            i += 1
+        if len(opening_shares_list) > 0:
+            opening_shares_lists.append(opening_shares_list)
+    return opening_shares_lists
+
 
+def match_symbol_lots(trade_list, stock_splits):
+    '''
+    Match every closing trade of a single symbol with the opening trades covering it (FIFO)
+    :param trade_list: chronologically ordered list of the trades of the symbol, or its TradeTable
+    :param stock_splits: AllStockSplits object
+    :return: list of lists of tuples (TradeClose, TradeOpen, num_of_shares), one list per closing trade.
+             Summing num_of_shares of all the tuples of a list will equal the closing trade shares.
+    '''
+    if isinstance(trade_list, TradeTable):
+        return _match_table_lots(trade_list, stock_splits)
+    lot_queue = OpenLotQueue(trade_list)
+    opening_shares_lists = []
+    for closing_trade in trade_list:
+        if type(closing_trade) is TradeClose:
+            opening_shares_list = lot_queue.close(closing_trade, stock_splits)
+            if len(opening_shares_list) > 0:
+                opening_shares_lists.append(opening_shares_list)
+    return opening_shares_lists
 
 
-def form1325_obj_create(trade_dic, dollar_ils_rate, stock_splits=None):
+def form1325_obj_create(trade_dic, dollar_ils_rate, stock_splits=None, vectorized=None, matching_workers=None):
     '''
     Create Tofes 1325 nispah hey (5)
     Summery of selling of stock which were not taxed
     :param trade_dic: retrieved dictionary from trades_parse()
     :param dollar_ils_rate: retrieved list of usd/ils for each date. from dollar_ils_rate_parse()
+    :param vectorized: if True - compute the entries with NumPy (see form1325_vectorized.py).
+                       Default: VECTORIZED_FORM1325
+    :param matching_workers: number of processes to match the lots of the symbols on (see parallel_matching.py).
+                             1 - this process, 0 - the number of CPUs. Default: MATCHING_WORKERS
     :return: list of Entry1325 objects
     '''
     # list of all lists of tuples of symbol. Each list of tuples corresponds to
     # one form1325 entry
     if stock_splits is None:
         stock_splits = AllStockSplits()
+    vectorized = VECTORIZED_FORM1325 if vectorized is None else vectorized
+    matching_workers = MATCHING_WORKERS if matching_workers is None else matching_workers
 
-    opening_shares_lists_for_all_symbols = []
-    for symbol, trade_list in trade_dic.items():
-        # Go to last transaction that is a closing position
-        reversed_trade_list = reversed(trade_list)
-        for closing_trade in trade_list:
-            # opening_shares_list is list of tuples (TradeClose, TradeOpen, num_of_shares)
-            # summing num_of_shares of all these tuples will equal to closing_trade.
-            # In all tuples in the list, TradeClose will be the same
-            opening_shares_list = []
-            # The number of shares in opening_shares_list[-1] that were not used
-            # to cover the closing.
-            # residue_shares = 0
-            if type(closing_trade) is TradeClose:
-                # Found closing position, remember it, then iterate from start
-                # of ordered list, to find enough opening shares
-                # Those will be the shares closing the
-                for opening_trade in trade_list:
-                    if type(opening_trade) is TradeOpen:
-                        # If no shares left in opening trade - skip to next trade
-                        if opening_trade.shares_left == 0:
-                            continue
-                        covered = 0
-
-                        handle_stock_split(opening_trade, closing_trade, stock_splits)
-                        # If opening trade shares cover all closing trade shares
-                        if opening_trade.shares_left + closing_trade.shares_left >= 0:
-                            covered += abs(closing_trade.shares_left)
-                            opening_trade.shares_left += closing_trade.shares_left
-                            closing_trade.shares_left = 0
-                        # If all opening shares cover some closing shared
-                        elif opening_trade.shares_left > 0 and opening_trade.shares_left + closing_trade.shares_left < 0:
-                            covered += abs(opening_trade.shares_left)
-                            closing_trade.shares_left += opening_trade.shares_left
-                            opening_trade.shares_left = 0
-
-                        opening_shares_list.append((closing_trade, opening_trade, covered))
-
-                        # If nothing left to cover - exit loop and find earlier closing trade
-                        if closing_trade.shares_left == 0:
-                            break
-            # At this point we have a list of tuples of opening trades covering closing_trade
-            # Append it to the list of lists of the symbol
-            if len(opening_shares_list) > 0:
-                opening_shares_lists_for_all_symbols.append(opening_shares_list[:])
+    if matching_workers != 1 and len(trade_dic) > 1:
+        from .parallel_matching import match_lots_parallel
+        opening_shares_lists_for_all_symbols = match_lots_parallel(trade_dic, stock_splits, matching_workers)
+    else:
+        opening_shares_lists_for_all_symbols = []
+        for symbol, trade_list in trade_dic.items():
+            opening_shares_lists_for_all_symbols += match_symbol_lots(trade_list, stock_splits)
+
+    if vectorized:
+        from .form1325_vectorized import form1325_from_matches
+        return form1325_from_matches(opening_shares_lists_for_all_symbols, dollar_ils_rate)
 
     entries = []
     # Now opening_shares_lists_for_all_symbols is populated
@@ -673,6 +1043,8 @@ def form1325_obj_create(trade_dic, dollar_ils_rate, stock_splits=None):
 
 
 class Form1322AppendixEntry():
+    __slots__ = ('symbol', 'date', 'value_usd', 'rate', 'value_ils', 'tax_deducted_usd', 'tax_deducted_ils')
+
     def __init__(self, dividend):
         self.symbol = dividend.symbol
         self.date = dividend.date
@@ -683,10 +1055,13 @@ class Form1322AppendixEntry():
         self.tax_deducted_ils = 0
 
     def populate(self, dollar_ils_rate):
-        self.rate = dollar_ils_rate[get_existing_exchange_date(self.date, dollar_ils_rate)]
-        self.value_ils = self.value_usd * self.rate
-        self.tax_deducted_ils = self.tax_deducted_usd * dollar_ils_rate[
-            get_existing_exchange_date(self.date, dollar_ils_rate)]
+        self.set_rate(dollar_ils_rate[get_existing_exchange_date(self.date, dollar_ils_rate)])
+
+    def set_rate(self, rate):
+        '''Convert to ILS with the rate of the date, once'''
+        self.rate = rate
+        self.value_ils = self.value_usd * rate
+        self.tax_deducted_ils = self.tax_deducted_usd * rate
 
     @staticmethod
     def to_header_list():
@@ -709,40 +1084,33 @@ def print_broker_form1099_retrieval_instructions():
     print('\nBroker tax form 1099:')
     print('In your Interactive Brokers account go to Reports > Tax > Tax Forms')
 
-def print_form1325_list(form1325, form1325_1st_half, form1325_2nd_half, dividends, interests, loss_remaining_from_stock):
+def print_form1325_list(form1325, form1325_1st_half, form1325_2nd_half, dividends, interests, loss_remaining_from_stock,
+                        generated_files_dir=None):
     if form1325.entry_list:
-        tab = tt.Texttable()
         header_list = Form1325Entry.to_header_list()
-        tab.header(header_list)
-        values_list = []
         print('\nForm 1325 appendix 3 (nispah gimmel):')
-        for entry in form1325.entry_list:
-            #for row in zip(entry.to_list()):
-            tab.add_row(entry.to_list())
-            s = tab.draw()
-            values_list += [entry.to_list()]
-        print(s)
+        print_table(header_list, (entry.to_list() for entry in form1325.entry_list), row_limit=CONSOLE_TABLE_ROW_LIMIT)
         print(f'Total profits: {form1325.total_profits}\tTotal losses: {form1325.total_losses}')
         print(f'Total sales {form1325.total_sales}')
         if GENERATE_EXCEL_FILES:
-            workbook, worksheet, next_row = gen_excel_file(FORM_1325_APPENDIX_FILE_NAME, header_list, values_list,
-                                                           STOCK_FILE_DESCRIPTION, close_workbook=False)
-            # Skip row
-            next_row += 1
-            next_row = write_row(worksheet, next_row, ['Total profits', form1325.total_profits], workbook)
-            next_row = write_row(worksheet, next_row, ['Total losses', form1325.total_losses], workbook)
-            next_row = write_row(worksheet, next_row, ['Total sales', form1325.total_sales], workbook)
-
-            next_row += 2
-            next_row = write_row(worksheet, next_row, ['מכירות ינואר-יוני', form1325_1st_half.total_sales], workbook, highlighted_cols=[1])
-            next_row = write_row(worksheet, next_row, ['מכירות יולי-דצמבר', form1325_2nd_half.total_sales], workbook, highlighted_cols=[1])
-            next_row = write_row(worksheet, next_row, ['סכום מכירות', form1325.total_sales], workbook)
-
-            next_row += 2
-            next_row = write_row(worksheet, next_row, ['הפסדים להעברה מני"ע', 'רווח-הפסד ני"ע', 'סה"כ ריבית', 'סה"כ דיבידנדים'], workbook)
-            next_row = write_row(worksheet, next_row, [loss_remaining_from_stock, form1325.total_profits + form1325.total_losses ,
-                                                       interests.get_total_ils(), dividends.get_total_ils()], workbook, highlighted_cols=[0])
-            close_workbook(workbook)
+            with AppendixWriter(FORM_1325_APPENDIX_FILE_NAME, header_list, STOCK_FILE_DESCRIPTION,
+                                generated_files_dir=generated_files_dir) as writer:
+                writer.write_rows(entry.to_list() for entry in form1325.entry_list)
+                # Skip row
+                writer.skip_rows(1)
+                writer.write_row(['Total profits', form1325.total_profits])
+                writer.write_row(['Total losses', form1325.total_losses])
+                writer.write_row(['Total sales', form1325.total_sales])
+
+                writer.skip_rows(2)
+                writer.write_row(['מכירות ינואר-יוני', form1325_1st_half.total_sales], highlighted_cols=[1])
+                writer.write_row(['מכירות יולי-דצמבר', form1325_2nd_half.total_sales], highlighted_cols=[1])
+                writer.write_row(['סכום מכירות', form1325.total_sales])
+
+                writer.skip_rows(2)
+                writer.write_row(['הפסדים להעברה מני"ע', 'רווח-הפסד ני"ע', 'סה"כ ריבית', 'סה"כ דיבידנדים'])
+                writer.write_row([loss_remaining_from_stock, form1325.total_profits + form1325.total_losses ,
+                                  interests.get_total_ils(), dividends.get_total_ils()], highlighted_cols=[0])
     else:
         print(f'Warning: No sales in stock found. If sales were actually made - make sure the corrct .csv file was\n'
               f'provided (In this case {IB_ACTIVITY_STATEMENT_CSV_OF_TAX_YEAR} was provided as the input file). If the file is\n'
@@ -750,92 +1118,111 @@ def print_form1325_list(form1325, form1325_1st_half, form1325_2nd_half, dividend
 
 
 
-def print_form1322_appendix_list(dividends):
-    values_list = []
+def print_form1322_appendix_list(dividends, generated_files_dir=None):
     header_list = Form1322AppendixEntry.to_header_list()
-    tab = tt.Texttable()
-    tab.header(header_list)
     print('\nForm 1322 appendix:')
-    for div in dividends.dividend_list:
-        # for row in zip(entry.to_list()):
-        tab.add_row(div.to_list())
-        s = tab.draw()
-        values_list += [div.to_list()]
-    print(s)
+    print_table(header_list, (div.to_list() for div in dividends.dividend_list), row_limit=CONSOLE_TABLE_ROW_LIMIT)
     total_usd = dividends.get_total_usd()
     total_ils = dividends.get_total_ils()
     total_ils_deducted = dividends.get_total_ils_deducted()
     print(f'total_usd: {total_usd}\ttotal_ils: {total_ils}\ttotal_ils_deducted: {total_ils_deducted}')
 
     if GENERATE_EXCEL_FILES:
-        workbook, worksheet, next_row = gen_excel_file(FORM_1322_FILE_NAME, header_list, values_list,
-                                                       DIVIDENDS_FILE_DESCRIPTION, close_workbook=False)
-        #rows = ('total_usd: {total_usd}\ttotal_ils: {total_ils}\ttotal_ils_deducted: {total_ils_deducted}')
-        next_row = write_row(worksheet, next_row, ['Total', '', total_usd, '', total_ils, total_ils_deducted], workbook,
-                             highlighted_cols=[4, 5])
-        close_workbook(workbook)
-
-def print_interests_appendix(interests):
-    values_list = []
+        with AppendixWriter(FORM_1322_FILE_NAME, header_list, DIVIDENDS_FILE_DESCRIPTION,
+                            generated_files_dir=generated_files_dir) as writer:
+            writer.write_rows(div.to_list() for div in dividends.dividend_list)
+            #rows = ('total_usd: {total_usd}\ttotal_ils: {total_ils}\ttotal_ils_deducted: {total_ils_deducted}')
+            writer.write_row(['Total', '', total_usd, '', total_ils, total_ils_deducted], highlighted_cols=[4, 5])
+
+def print_interests_appendix(interests, generated_files_dir=None):
     header_list = Interests.to_header_list()
-    tab = tt.Texttable()
-    tab.header(header_list)
     print('\nInterests appendix:')
-    for interest in interests.interest_list:
-        # for row in zip(entry.to_list()):
-        tab.add_row(interest.to_list())
-        s = tab.draw()
-        values_list += [interest.to_list()]
-    print(s)
+    print_table(header_list, (interest.to_list() for interest in interests.interest_list),
+                row_limit=CONSOLE_TABLE_ROW_LIMIT)
     total_usd = interests.get_total_usd()
     total_ils = interests.get_total_ils()
     print(f'total_usd: {total_usd}\ttotal_ils: {total_ils}')
 
     if GENERATE_EXCEL_FILES:
-        workbook, worksheet, next_row = gen_excel_file(INTERESTS_FILE_NAME, header_list, values_list,
-                                                       INTEREST_FILE_DESCRIPTION, close_workbook=False)
-        #rows = ('total_usd: {total_usd}\ttotal_ils: {total_ils}\ttotal_ils_deducted: {total_ils_deducted}')
-        next_row = write_row(worksheet, next_row, ['Total', total_usd, total_ils], workbook, highlighted_cols=[2])
-        close_workbook(workbook)
+        with AppendixWriter(INTERESTS_FILE_NAME, header_list, INTEREST_FILE_DESCRIPTION,
+                            generated_files_dir=generated_files_dir) as writer:
+            writer.write_rows(interest.to_list() for interest in interests.interest_list)
+            #rows = ('total_usd: {total_usd}\ttotal_ils: {total_ils}\ttotal_ils_deducted: {total_ils_deducted}')
+            writer.write_row(['Total', total_usd, total_ils], highlighted_cols=[2])
 
-def create_gen_dir():
+def create_gen_dir(generated_files_dir=GENERATED_FILES_DIR):
     if GENERATE_EXCEL_FILES:
-        if not os.path.exists(GENERATED_FILES_DIR):
-            os.makedirs(GENERATED_FILES_DIR)
+        if not os.path.exists(generated_files_dir):
+            os.makedirs(generated_files_dir)
 
 
 def create_form1325_from_date_range(original_form1325, start_date, end_date):
-    f = Form1325()
-    f.entry_list = [rec for rec in original_form1325.entry_list if rec.sale_date >= start_date and rec.sale_date < end_date]
-    f.add_totals()
-    return f
+    ''':return: Form1325Period of the entries of original_form1325 sold in [start_date, end_date)'''
+    return original_form1325.date_range(start_date, end_date)
+
+
+def usd_ils_rates(dates, dollar_ils_rate):
+    '''
+    :param dollar_ils_rate: RateCalendar, or parsed exchanges dictionary
+    :return: list of the USD/ILS rate of each of dates (see get_existing_exchange_date()),
+             looked up in a single batch if dollar_ils_rate is a RateCalendar
+    '''
+    if isinstance(dollar_ils_rate, RateCalendar):
+        return dollar_ils_rate.rates_for(dates).tolist()
+    return [dollar_ils_rate[get_existing_exchange_date(date, dollar_ils_rate)] for date in dates]
 
 
 class Dividends:
+    '''
+    Form1322AppendixEntry of every dividend, converted to ILS once.
+    The totals are kept up to date as dividends are added (add_dividend), instead of summed on every call
+    '''
     def __init__(self, dividends_list, dollar_ils_rate):
         self.dividend_list = []
-        for div in dividends_list:
+        self.total_usd = 0
+        self.total_ils = 0
+        self.total_ils_deducted = 0
+        for div, rate in zip(dividends_list, usd_ils_rates([div.date for div in dividends_list], dollar_ils_rate)):
             entry = Form1322AppendixEntry(div)
-            entry.populate(dollar_ils_rate)
-            self.dividend_list.append(entry)
+            entry.set_rate(rate)
+            self.add_dividend(entry)
+
+    def add_dividend(self, entry):
+        ''':param entry: populated Form1322AppendixEntry'''
+        self.dividend_list.append(entry)
+        self.total_usd += entry.value_usd
+        self.total_ils += entry.value_ils
+        self.total_ils_deducted += entry.tax_deducted_ils
 
     def get_total_usd(self):
-        return sum([div.value_usd for div in self.dividend_list])
+        return self.total_usd
     def get_total_ils(self):
-        return sum([div.value_ils for div in self.dividend_list])
+        return self.total_ils
     def get_total_ils_deducted(self):
-        return sum([div.tax_deducted_ils for div in self.dividend_list])
+        return self.total_ils_deducted
 
 class Interests:
+    '''
+    Interests converted to ILS once, with totals kept up to date as interests are added (add_interest)
+    '''
     def __init__(self, interest_list, usd_ils_rate_dict):
-        for i in interest_list:
-            i.populate(usd_ils_rate_dict)
-        self.interest_list = interest_list
+        self.interest_list = []
+        self.total_usd = 0
+        self.total_ils = 0
+        for i, rate in zip(interest_list, usd_ils_rates([i.date for i in interest_list], usd_ils_rate_dict)):
+            i.set_rate(rate)
+            self.add_interest(i)
+
+    def add_interest(self, interest):
+        ''':param interest: populated Interest'''
+        self.interest_list.append(interest)
+        self.total_usd += interest.value_usd
+        self.total_ils += interest.value_ils
 
     def get_total_usd(self):
-        return sum([i.value_usd for i in self.interest_list])
+        return self.total_usd
     def get_total_ils(self):
-        return sum([i.value_ils for i in self.interest_list])
+        return self.total_ils
 
     @staticmethod
     def to_header_list():
@@ -846,22 +1233,50 @@ def create_interests_excel():
     pass
 
 
-def main():
-    create_gen_dir()
-    dollar_ils_rate = dollar_ils_rate_parse()
-    trade_dic = trades_parse(IB_ACTIVITY_STATEMENT_CSV_LIST)
-    dividends_list = dividends_parse()
-    interest_list = interest_parse()
-    interests = Interests(interest_list, dollar_ils_rate)
-    stock_splits = stock_splits_parse()
+def _run_stages(report, statements, tax_year_statement, tax_year, loss_from_prev_years, generated_files_dir,
+                dollar_ils_rate, parsing_workers, matching_workers, prev_snapshot, snapshot_file, ledger, account):
+    create_gen_dir(generated_files_dir)
+    with report.stage('rates') as stage:
+        if dollar_ils_rate is None:
+            dollar_ils_rate = dollar_ils_rate_calendar()
+        stage.counts['rates'] = len(dollar_ils_rate)
+    with report.stage('parse') as stage:
+        if ledger is not None:
+            # The trades of every symbol are read from the ledger when the symbol is matched
+            statement = ledger.parsed_statement(account, tax_year,
+                                                start_year=None if prev_snapshot is None else tax_year)
+            statements = ledger.statements(account)
+        else:
+            # The trades before the tax year are in the snapshot - statements may have them with ALL_STATEMENTS
+            statement = parse_statements(statements, tax_year_statement, workers=parsing_workers, tax_year=tax_year,
+                                         start_year=None if prev_snapshot is None else tax_year)
+            stage.counts['duplicate_rows'] = sum(sum(counts.values()) for counts in statement.overlaps.values())
+        if prev_snapshot is not None:
+            # The lots left open by the previous tax years come before the trades of the tax year
+            statement.trades = _merge_trades([prev_snapshot.trades, statement.trades])
+            stage.counts['snapshot_trades'] = sum(len(table) for table in prev_snapshot.trades.values())
+        stage.counts['statements'] = len(statements)
+        stage.counts['symbols'] = len(statement.trades)
+        stage.counts['trades'] = sum(len(trade_list) for trade_list in statement.trades.values())
+        stage.counts['dividends'] = len(statement.dividends)
+        stage.counts['interests'] = len(statement.interests)
+    trade_dic = statement.trades
+    dividends_list = statement.dividends
+    stock_splits = statement.stock_splits
 
     print(f'stock splits: {stock_splits}')
-    form1325 = form1325_obj_create(trade_dic, dollar_ils_rate, stock_splits)
-    dividends = Dividends(dividends_list, dollar_ils_rate)
+    with report.stage('form1325') as stage:
+        form1325 = form1325_obj_create(trade_dic, dollar_ils_rate, stock_splits, matching_workers=matching_workers)
+        stage.counts['entries'] = len(form1325.entry_list)
+    with report.stage('dividends_interests') as stage:
+        interests = Interests(statement.interests, dollar_ils_rate)
+        dividends = Dividends(dividends_list, dollar_ils_rate)
+        stage.counts['interests'] = len(interests.interest_list)
+        stage.counts['dividends'] = len(dividends.dividend_list)
 
 
     if GENERATE_EXCEL_FILES:
-        print(f"\nCheck the '{GENERATED_FILES_DIR}' directory for the generated Excel files")
+        print(f"\nCheck the '{generated_files_dir}' directory for the generated Excel files")
 
     # not_deducted_1_1322_list = [rec for rec in form1322_appendix_list
     #                             if (rec.tax_deducted_ils == 0 and
@@ -871,36 +1286,131 @@ def main():
     #                                 rec.date >= datetime.datetime(TAX_YEAR, 7, 1))]
     # deducted_by_broker_1322_list = [rec for rec in form1322_appendix_list if rec.tax_deducted_ils != 0]
 
-    if SPLIT_125_FORM:
-        form1325_1st_half = create_form1325_from_date_range(form1325, datetime.datetime(TAX_YEAR, 1, 1),
-                                                            datetime.datetime(TAX_YEAR, 7, 1))
-        form1325_2nd_half = create_form1325_from_date_range(form1325, datetime.datetime(TAX_YEAR, 7, 1),
-                                                            datetime.datetime(TAX_YEAR + 1, 1, 1))
-
-        loss_remaining_from_prev = LOSS_FROM_PREV_YEARS
-        loss_remaining_from_stock = form1325.total_losses * -1  # Make positive
-        # loss_remaining = generate_form1322_pdf(deducted_by_broker_1322_list, FORM_1322_TEMPLATE_PDF, FORM_1322_DEDUCTED_OUTPUT_PDF,
-        #                       tax_deduction='by_broker', loss_remaining=loss_remaining)
-        loss_remaining_from_prev, loss_remaining_from_stock, _ = generate_form1322_pdf(form1325_1st_half, FORM_1322_TEMPLATE_PDF, FORM_1322_NOT_DEDUCTED_1_OUTPUT_PDF,
-                              tax_deduction='not_deducted_1', credits_from_prev=loss_remaining_from_prev, credits_from_stock=loss_remaining_from_stock)
-        loss_remaining_from_prev, loss_remaining_from_stock, dividends_and_interest_profits_including_deduction = generate_form1322_pdf(form1325_2nd_half, FORM_1322_TEMPLATE_PDF, FORM_1322_NOT_DEDUCTED_2_OUTPUT_PDF,
-                              tax_deduction='not_deducted_2', credits_from_prev=loss_remaining_from_prev, credits_from_stock=loss_remaining_from_stock, dividends=dividends, interests=interests)
-    else:
-        loss_remaining_from_prev = LOSS_FROM_PREV_YEARS
-        loss_remaining_from_stock = form1325.total_losses * -1  # Make positive
-        loss_remaining_from_prev, loss_remaining_from_stock, dividends_and_interest_profits_including_deduction = generate_form1322_pdf(form1325,
-                                                                                       FORM_1322_TEMPLATE_PDF,
-                                                                                       FORM_1322_DEDUCTED_OUTPUT_PDF,
-                                                                                       tax_deduction='not_deducted_2',
-                                                                                       credits_from_prev=loss_remaining_from_prev,
-                                                                                       credits_from_stock=loss_remaining_from_stock,
-                                                                                       dividends=dividends, interests=interests)
-
-    generate_form1324_pdf(FORM_1324_TEMPLATE_PDF, FORM_1324_OUTPUT_PDF, form1325, dividends, dividends_and_interest_profits_including_deduction)
-
-    print_interests_appendix(interests)
-    print_form1325_list(form1325, form1325_1st_half, form1325_2nd_half, dividends, interests, loss_remaining_from_stock)
-    print_form1322_appendix_list(dividends)
+    with report.stage('pdf') as stage:
+        if SPLIT_125_FORM:
+            form1325_1st_half = create_form1325_from_date_range(form1325, datetime.datetime(tax_year, 1, 1),
+                                                                datetime.datetime(tax_year, 7, 1))
+            form1325_2nd_half = create_form1325_from_date_range(form1325, datetime.datetime(tax_year, 7, 1),
+                                                                datetime.datetime(tax_year + 1, 1, 1))
+
+            loss_remaining_from_prev = loss_from_prev_years
+            loss_remaining_from_stock = form1325.total_losses * -1  # Make positive
+            # loss_remaining = generate_form1322_pdf(deducted_by_broker_1322_list, FORM_1322_TEMPLATE_PDF, FORM_1322_DEDUCTED_OUTPUT_PDF,
+            #                       tax_deduction='by_broker', loss_remaining=loss_remaining)
+            loss_remaining_from_prev, loss_remaining_from_stock, _ = generate_form1322_pdf(form1325_1st_half, FORM_1322_TEMPLATE_PDF, os.path.join(generated_files_dir, FORM_1322_NOT_DEDUCTED_1_OUTPUT_FILE_NAME),
+                                  tax_deduction='not_deducted_1', credits_from_prev=loss_remaining_from_prev, credits_from_stock=loss_remaining_from_stock)
+            loss_remaining_from_prev, loss_remaining_from_stock, dividends_and_interest_profits_including_deduction = generate_form1322_pdf(form1325_2nd_half, FORM_1322_TEMPLATE_PDF, os.path.join(generated_files_dir, FORM_1322_NOT_DEDUCTED_2_OUTPUT_FILE_NAME),
+                                  tax_deduction='not_deducted_2', credits_from_prev=loss_remaining_from_prev, credits_from_stock=loss_remaining_from_stock, dividends=dividends, interests=interests)
+            stage.counts['forms'] = 3
+        else:
+            loss_remaining_from_prev = loss_from_prev_years
+            loss_remaining_from_stock = form1325.total_losses * -1  # Make positive
+            loss_remaining_from_prev, loss_remaining_from_stock, dividends_and_interest_profits_including_deduction = generate_form1322_pdf(form1325,
+                                                                                           FORM_1322_TEMPLATE_PDF,
+                                                                                           os.path.join(generated_files_dir, FORM_1322_DEDUCTED_OUTPUT_FILE_NAME),
+                                                                                           tax_deduction='not_deducted_2',
+                                                                                           credits_from_prev=loss_remaining_from_prev,
+                                                                                           credits_from_stock=loss_remaining_from_stock,
+                                                                                           dividends=dividends, interests=interests)
+            stage.counts['forms'] = 2
+
+        generate_form1324_pdf(FORM_1324_TEMPLATE_PDF, os.path.join(generated_files_dir, FORM_1324_OUTPUT_FILE_NAME), form1325, dividends, dividends_and_interest_profits_including_deduction)
+
+    with report.stage('appendixes') as stage:
+        print_interests_appendix(interests, generated_files_dir)
+        print_form1325_list(form1325, form1325_1st_half, form1325_2nd_half, dividends, interests, loss_remaining_from_stock,
+                            generated_files_dir)
+        print_form1322_appendix_list(dividends, generated_files_dir)
+        stage.counts['rows'] = len(interests.interest_list) + len(form1325.entry_list) + len(dividends.dividend_list)
     print_broker_form1099_retrieval_instructions()
     print(f'Total loss from previous year remaining for the next tax year: {loss_remaining_from_prev }')
     print(f'Total loss from stock remaining for the next tax year: {loss_remaining_from_stock}')
+
+    if snapshot_file is not None:
+        with report.stage('snapshot') as stage:
+            from .year_end_snapshot import YearEndSnapshot
+            snapshot = YearEndSnapshot.from_run(tax_year, trade_dic, stock_splits, loss_remaining_from_prev,
+                                                loss_remaining_from_stock)
+            snapshot.save(snapshot_file)
+            stage.counts['trades'] = sum(len(table) for table in snapshot.trades.values())
+        print(f'Year-end snapshot for the next tax year: {snapshot_file}')
+
+
+def main(statements=None, tax_year_statement=None, tax_year=None, loss_from_prev_years=None, generated_files_dir=None,
+         dollar_ils_rate=None, run_report_file=None, profile=None, parsing_workers=None, matching_workers=None,
+         prev_snapshot_file=None, snapshot_file=None, ledger_file=None, account=None):
+    '''
+    Generate the forms and the appendixes of one taxpayer.
+    Arguments that are not given take the values of the input parameters above
+    (IB_ACTIVITY_STATEMENT_CSV_LIST, IB_ACTIVITY_STATEMENT_CSV_OF_TAX_YEAR, TAX_YEAR, LOSS_FROM_PREV_YEARS,
+    GENERATED_FILES_DIR, RUN_REPORT_FILE, PROFILE_RUN, PREV_YEAR_END_SNAPSHOT_FILE, YEAR_END_SNAPSHOT_FILE).
+    The personal details are taken from the config file of user_data_helper.
+    :param tax_year_statement: statement of the tax year, or ALL_STATEMENTS - the dividends, interests and splits of
+                               tax_year from all the statements (see parse_statements)
+    :param dollar_ils_rate: USD/ILS rates, already parsed (RateCalendar). Default: parsed by dollar_ils_rate_calendar()
+    :param run_report_file: JSON file to write the time, memory and counts of every stage of the run to
+                            (see run_report.py). None - no report
+    :param profile: if True - run every stage under cProfile and dump the stats of the hottest stage next to the
+                    run report (RUN_REPORT_FILE_NAME in the generated files dir if no run_report_file was given)
+    :param parsing_workers: number of processes to parse the statements on. Default: PARSING_WORKERS
+    :param matching_workers: number of processes to match the lots of the symbols on. Default: MATCHING_WORKERS
+    :param prev_snapshot_file: year-end snapshot of the previous tax year (see year_end_snapshot.py). If given -
+                               statements is ignored: the open lots are taken from the snapshot and only
+                               tax_year_statement is parsed. With ALL_STATEMENTS - all the statements are parsed,
+                               and only their trades from the start of tax_year are taken.
+                               loss_from_prev_years defaults to the loss the snapshot carries
+    :param snapshot_file: file to save the year-end snapshot of tax_year to. None - not saved
+    :param ledger_file: SQLite ledger of the imported statements (see ledger.py). If given - statements and
+                        tax_year_statement are ignored: everything is read from the ledger. Default: TRADE_LEDGER_FILE
+    :param account: account of the taxpayer in the ledger. Default: LEDGER_ACCOUNT, or the only account of the ledger
+    '''
+    statements = IB_ACTIVITY_STATEMENT_CSV_LIST if statements is None else statements
+    tax_year_statement = IB_ACTIVITY_STATEMENT_CSV_OF_TAX_YEAR if tax_year_statement is None else tax_year_statement
+    tax_year = TAX_YEAR if tax_year is None else tax_year
+    prev_snapshot_file = PREV_YEAR_END_SNAPSHOT_FILE if prev_snapshot_file is None else prev_snapshot_file
+    snapshot_file = YEAR_END_SNAPSHOT_FILE if snapshot_file is None else snapshot_file
+    prev_snapshot = None
+    if prev_snapshot_file is not None:
+        from .year_end_snapshot import YearEndSnapshot
+        prev_snapshot = YearEndSnapshot.load(prev_snapshot_file)
+        if prev_snapshot.tax_year != tax_year - 1:
+            raise Exception(f'Year-end snapshot {prev_snapshot_file} is of {prev_snapshot.tax_year}, '
+                            f'expected the end of {tax_year - 1}')
+        if tax_year_statement is not ALL_STATEMENTS:
+            statements = [tax_year_statement]
+        if loss_from_prev_years is None:
+            loss_from_prev_years = prev_snapshot.loss_from_prev_years
+    loss_from_prev_years = LOSS_FROM_PREV_YEARS if loss_from_prev_years is None else loss_from_prev_years
+    generated_files_dir = GENERATED_FILES_DIR if generated_files_dir is None else generated_files_dir
+    run_report_file = RUN_REPORT_FILE if run_report_file is None else run_report_file
+    profile = PROFILE_RUN if profile is None else profile
+    if profile and run_report_file is None:
+        run_report_file = os.path.join(generated_files_dir, RUN_REPORT_FILE_NAME)
+
+    ledger_file = TRADE_LEDGER_FILE if ledger_file is None else ledger_file
+    account = LEDGER_ACCOUNT if account is None else account
+    ledger = None
+    if ledger_file is not None:
+        from .ledger import Ledger
+        ledger = Ledger(ledger_file)
+        if account is None:
+            accounts = ledger.accounts()
+            if len(accounts) != 1:
+                ledger.close()
+                raise Exception(f'Ledger {ledger_file} has the accounts {accounts}. Give the account of the taxpayer')
+            account = accounts[0]
+
+    report = RunReport(enabled=run_report_file is not None, profile=profile)
+    try:
+        _run_stages(report, statements, tax_year_statement, tax_year, loss_from_prev_years, generated_files_dir,
+                    dollar_ils_rate, parsing_workers, matching_workers, prev_snapshot, snapshot_file, ledger, account)
+    finally:
+        if ledger is not None:
+            ledger.close()
+        # Written also when a stage fails - the failed stage is the last one in the report
+        if report.enabled:
+            profile_stats_file = report.write(run_report_file)
+            print(f'\nRun report: {run_report_file}')
+            if profile_stats_file:
+                print(f'Profile of the hottest stage ({report.hottest_stage().name}): {profile_stats_file}')
+        report.close()
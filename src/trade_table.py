@@ -0,0 +1,286 @@
+'''
+Array backed store of the trades of a symbol. A statement of many years has millions of fills -
+instead of an object (with a __dict__ and a datetime) per fill, every field of the trades of a
+symbol is a typed column of a TradeTable, and TradeOpen / TradeClose are light row views of it,
+with the attributes of the trade objects they replace.
+'''
+import datetime
+import heapq
+from array import array
+
+TRADE_SIDE_OPEN = 1
+TRADE_SIDE_CLOSE = -1
+NO_DATE = 0  # Day ordinal of a trade without a date (ordinals start at 1)
+NO_SPLITS_APPLIED = -1
+TRADE_TABLE_COLUMNS = ('sides', 'days', 'prices', 'total_shares', 'shares_left', 'commissions', 'realized',
+                       'splits_applied')
+
+
+class TradeTable:
+    '''
+    The trades of a single symbol, in statement order, as typed columns (one row per fill):
+    side, day ordinal, price, total / left shares, commission, realized P/L and splits applied.
+    Behaves like the list of trades it replaces: len(), indexing and iteration give TradeOpen / TradeClose
+    row views, and writing the attributes of a view writes the columns.
+    All the dates of a table are days of the same type (date_class: datetime.datetime or datetime.date)
+    '''
+    def __init__(self, symbol='', date_class=datetime.datetime):
+        self.symbol = symbol
+        self.date_class = date_class
+        self.sides = array('b')
+        self.days = array('l')
+        self.prices = array('d')
+        self.total_shares = array('q')
+        self.shares_left = array('q')
+        self.commissions = array('d')
+        self.realized = array('d')
+        self.splits_applied = array('l')
+        self._date_objects = dict()  # Day ordinal -> date_class object, shared by the rows of the day
+
+    def append(self, side, date, price, total_shares, commission=0.0, realized=0.0):
+        '''
+        Add a fill
+        :param side: TRADE_SIDE_OPEN or TRADE_SIDE_CLOSE
+        :param total_shares: shares of the fill - negative for sell transactions. shares_left starts from it
+        :return: row of the fill
+        '''
+        self.sides.append(side)
+        self.days.append(self._ordinal(date))
+        self.prices.append(price)
+        self.total_shares.append(total_shares)
+        self.shares_left.append(total_shares)
+        self.commissions.append(commission)
+        self.realized.append(realized)
+        self.splits_applied.append(NO_SPLITS_APPLIED)
+        return len(self.sides) - 1
+
+    def extend(self, trades):
+        '''Append trades after the trades of the table: a TradeTable of the same symbol, or trade views'''
+        if isinstance(trades, TradeTable):
+            self._check_date_class(trades)
+            if not len(self):
+                self.date_class = trades.date_class
+                self._date_objects = dict()
+            for column in TRADE_TABLE_COLUMNS:
+                getattr(self, column).extend(getattr(trades, column))
+            return
+        for trade in trades:
+            row = self.append(TRADE_SIDE_OPEN if type(trade) is TradeOpen else TRADE_SIDE_CLOSE, trade.date,
+                              trade.transaction_price, trade.total_shares_num, trade.commission,
+                              getattr(trade, 'realized', 0.0))
+            self.shares_left[row] = trade.shares_left
+
+    def _check_date_class(self, other):
+        if len(other) and len(self) and other.date_class is not self.date_class:
+            raise TypeError(f'Cannot merge trades dated by {other.date_class.__name__} into a trade table '
+                            f'dated by {self.date_class.__name__}')
+
+    def _ordinal(self, date):
+        if date is None:
+            return NO_DATE
+        if isinstance(date, datetime.datetime) and date.time() != datetime.time():
+            raise ValueError(f'Trade tables store days, got a time of day: {date}')
+        if type(date) is not self.date_class:
+            if len(self.sides) > 1:
+                raise TypeError(f'The dates of a trade table are all {self.date_class.__name__} objects, '
+                                f'got {type(date).__name__}')
+            # The only trade of the table decides the type
+            self.date_class = type(date)
+            self._date_objects = dict()
+        return date.toordinal()
+
+    def date(self, row):
+        ordinal = self.days[row]
+        if ordinal == NO_DATE:
+            return None
+        date = self._date_objects.get(ordinal)
+        if date is None:
+            date = self._date_objects[ordinal] = self.date_class.fromordinal(ordinal)
+        return date
+
+    def nbytes(self):
+        ''':return: bytes of the columns'''
+        return sum(getattr(self, column).itemsize * len(self) for column in TRADE_TABLE_COLUMNS)
+
+    def __len__(self):
+        return len(self.sides)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError('trade table index out of range')
+        return (TradeOpen if self.sides[row] == TRADE_SIDE_OPEN else TradeClose)._view(self, row)
+
+    def __iter__(self):
+        open_view = TradeOpen._view
+        close_view = TradeClose._view
+        for row, side in enumerate(self.sides):
+            yield open_view(self, row) if side == TRADE_SIDE_OPEN else close_view(self, row)
+
+    def __eq__(self, other):
+        if isinstance(other, TradeTable):
+            return list(self) == list(other)
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __str__(self):
+        return f'{list(self)}'
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def merge_trade_tables(tables):
+    '''
+    Chronological k-way merge of the trade tables of a symbol (one per statement): the rows are ordered by day,
+    and fills of the same day keep the order of the tables, then their order within the table -
+    the order of appending the tables one after another, for statements that do not overlap
+    :param tables: TradeTable objects of the same symbol, in statement order. Every table is in chronological order
+    :return: TradeTable with the rows of all the tables
+    '''
+    tables = [table for table in tables if len(table)]
+    if not tables:
+        return TradeTable()
+    for table in tables[1:]:
+        tables[0]._check_date_class(table)
+    merged = TradeTable(tables[0].symbol, tables[0].date_class)
+    # Statements that do not overlap (the usual case) - the merge is appending the tables
+    if all(max(previous.days) <= min(table.days) for previous, table in zip(tables, tables[1:])):
+        for table in tables:
+            merged.extend(table)
+        return merged
+
+    order = list(heapq.merge(*([(day, i, row) for row, day in enumerate(table.days)]
+                               for i, table in enumerate(tables))))
+    for column in TRADE_TABLE_COLUMNS:
+        values = [getattr(table, column) for table in tables]
+        setattr(merged, column, array(values[0].typecode, [values[i][row] for _, i, row in order]))
+    return merged
+
+
+class Trade:
+    '''
+    Row view of a TradeTable. A trade created on its own (TradeOpen(symbol=..., ...)) gets a table of its own.
+    Views are equal if they are views of the same row
+    '''
+    __slots__ = ('_table', '_row')
+    _side = None
+
+    def __init__(self, **kwargs):
+        self._table = TradeTable()
+        self._row = self._table.append(self._side, None, 0.0, 0)
+        for key, value in kwargs.items():  # kwargs is a regular dictionary
+            setattr(self, key, value)
+
+    @classmethod
+    def _view(cls, table, row):
+        trade = cls.__new__(cls)
+        trade._table = table
+        trade._row = row
+        return trade
+
+    # The columns are plain properties - faster to access than a generic column descriptor
+    @property
+    def commission(self):
+        return self._table.commissions[self._row]
+
+    @commission.setter
+    def commission(self, commission):
+        self._table.commissions[self._row] = commission
+
+    @property
+    def transaction_price(self):
+        return self._table.prices[self._row]
+
+    @transaction_price.setter
+    def transaction_price(self, transaction_price):
+        self._table.prices[self._row] = transaction_price
+
+    @property
+    def total_shares_num(self):
+        return self._table.total_shares[self._row]
+
+    @total_shares_num.setter
+    def total_shares_num(self, total_shares_num):
+        self._table.total_shares[self._row] = total_shares_num
+
+    @property
+    def shares_left(self):
+        return self._table.shares_left[self._row]
+
+    @shares_left.setter
+    def shares_left(self, shares_left):
+        self._table.shares_left[self._row] = shares_left
+
+    @property
+    def symbol(self):
+        return self._table.symbol
+
+    @symbol.setter
+    def symbol(self, symbol):
+        if symbol != self._table.symbol and len(self._table) > 1:
+            raise ValueError(f'All the trades of a trade table are of {self._table.symbol}, got {symbol}')
+        self._table.symbol = symbol
+
+    @property
+    def date(self):
+        table = self._table
+        ordinal = table.days[self._row]
+        date = table._date_objects.get(ordinal)
+        return table.date(self._row) if date is None else date
+
+    @date.setter
+    def date(self, date):
+        self._table.days[self._row] = self._table._ordinal(date)
+
+    def __eq__(self, other):
+        if not isinstance(other, Trade):
+            return NotImplemented
+        return self._table is other._table and self._row == other._row
+
+    def __hash__(self):
+        return hash((id(self._table), self._row))
+
+    def __str__(self):
+        return 'Trade: symbol:{}, date:{} comm:{}, price:{}'.format(self.symbol, self.date, self.commission, self.transaction_price)
+
+
+class TradeOpen(Trade):
+    __slots__ = ()
+    _side = TRADE_SIDE_OPEN
+
+    @property
+    def splits_applied(self):
+        '''Splits already applied to the lot (see handle_stock_split). None - not checked yet'''
+        splits_applied = self._table.splits_applied[self._row]
+        return None if splits_applied == NO_SPLITS_APPLIED else splits_applied
+
+    @splits_applied.setter
+    def splits_applied(self, splits_applied):
+        self._table.splits_applied[self._row] = NO_SPLITS_APPLIED if splits_applied is None else splits_applied
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class TradeClose(Trade):
+    __slots__ = ()
+    _side = TRADE_SIDE_CLOSE
+
+    @property
+    def realized(self):
+        return self._table.realized[self._row]
+
+    @realized.setter
+    def realized(self, realized):
+        self._table.realized[self._row] = realized
+
+    def __str__(self):
+        return '{}, realized:{}'.format(super().__str__(), self.realized)
+
+    def __repr__(self):
+        return self.__str__()
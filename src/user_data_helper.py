@@ -1,10 +1,34 @@
 import json
 import os
+from functools import lru_cache
 
-f = os.path.join(os.path.dirname(os.path.realpath(__file__)),'config.json')
-with open(f, encoding='utf-8') as json_data:
-    user_data_dict = json.load(json_data)
-    print(user_data_dict)
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'config.json')
+_config_file = CONFIG_FILE  # Set by set_config_file()
 
-user_data = {k: user_data_dict[k]['value'] for k in user_data_dict.keys() }
-user_data['name'] = user_data['first-name'] + ' ' + user_data['last-name']
\ No newline at end of file
+
+def set_config_file(config_file):
+    '''
+    Take the personal details from config_file from now on. Used by the batch mode, where every
+    client has a config file of its own
+    '''
+    global _config_file
+    _config_file = config_file
+
+
+def get_user_data(config_file=None):
+    '''
+    Personal details of the taxpayer from config_file. Read on first use, not on import
+    :param config_file: Default: the file set by set_config_file(), CONFIG_FILE if not set
+    :return: dictionary of config key -> value, plus 'name' (first name and last name)
+    '''
+    return _read_user_data(config_file or _config_file)
+
+
+@lru_cache(maxsize=None)
+def _read_user_data(config_file):
+    with open(config_file, encoding='utf-8') as json_data:
+        user_data_dict = json.load(json_data)
+
+    user_data = {k: user_data_dict[k]['value'] for k in user_data_dict.keys() }
+    user_data['name'] = user_data['first-name'] + ' ' + user_data['last-name']
+    return user_data
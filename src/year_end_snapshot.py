@@ -0,0 +1,107 @@
+'''
+Year-end snapshot of the state a tax year leaves to the next one: the lots still open (and the
+closing trades not covered yet), and the losses carried forward. The run of the next tax year loads
+the snapshot instead of parsing and matching the statements of all the previous years, so its time
+grows with the trades of one year, not with the history of the account.
+
+The snapshot is a JSON file:
+    {"version": 1, "tax_year": 2020,
+     "loss_remaining_from_prev": ..., "loss_remaining_from_stock": ...,
+     "trades": {"<symbol>": {"sides": [...], "days": [...], "prices": [...], "total_shares": [...],
+                             "shares_left": [...], "commissions": [...], "realized": [...]}, ...}}
+The trades are the rows of the trade tables (see trade_table.py) with shares left, days as day ordinals.
+The lots are adjusted to the splits of the tax year, and keep their commission if no Form 1325 entry used it yet.
+'''
+import datetime
+import json
+import os
+from array import array
+
+from .tax_generator import apply_stock_splits
+from .trade_table import TradeTable, TradeOpen, NO_SPLITS_APPLIED
+
+YEAR_END_SNAPSHOT_VERSION = 1
+# Columns of the trade tables kept in the snapshot. The splits applied are not kept - the lots are adjusted
+# to all the splits of the tax year, and the splits of the next tax year are all later than them
+SNAPSHOT_COLUMNS = ('sides', 'days', 'prices', 'total_shares', 'shares_left', 'commissions', 'realized')
+
+
+class YearEndSnapshot:
+    def __init__(self, tax_year, trades, loss_remaining_from_prev=0, loss_remaining_from_stock=0):
+        '''
+        :param tax_year: the tax year the snapshot is the end of
+        :param trades: dictionary of symbol -> TradeTable of the open trades
+        :param loss_remaining_from_prev: loss from the previous years, not used up to the end of the tax year
+        :param loss_remaining_from_stock: loss from stock of the tax year, not used in it
+        '''
+        self.tax_year = tax_year
+        self.trades = trades
+        self.loss_remaining_from_prev = loss_remaining_from_prev
+        self.loss_remaining_from_stock = loss_remaining_from_stock
+
+    @property
+    def loss_from_prev_years(self):
+        ''':return: loss from the previous years of the next tax year'''
+        return self.loss_remaining_from_prev + self.loss_remaining_from_stock
+
+    @classmethod
+    def from_run(cls, tax_year, trade_dic, stock_splits, loss_remaining_from_prev=0, loss_remaining_from_stock=0):
+        '''
+        Snapshot of the trades after the lots were matched (by form1325_obj_create())
+        :param trade_dic: dictionary of symbol -> TradeTable, after matching
+        :param stock_splits: AllStockSplits the lots were matched with
+        '''
+        next_year = datetime.datetime(tax_year + 1, 1, 1)
+        trades = dict()
+        for symbol, table in trade_dic.items():
+            open_rows = [row for row, shares_left in enumerate(table.shares_left) if shares_left != 0]
+            if not open_rows:
+                continue
+            open_table = TradeTable(symbol, table.date_class)
+            for column in SNAPSHOT_COLUMNS + ('splits_applied',):
+                values = getattr(table, column)
+                getattr(open_table, column).extend(values[row] for row in open_rows)
+            for lot in open_table:
+                if type(lot) is TradeOpen:
+                    apply_stock_splits(lot, next_year, stock_splits)
+            open_table.splits_applied = array('l', [NO_SPLITS_APPLIED] * len(open_table))
+            trades[symbol] = open_table
+        return cls(tax_year, trades, loss_remaining_from_prev, loss_remaining_from_stock)
+
+    def save(self, snapshot_file):
+        snapshot_dir = os.path.dirname(snapshot_file)
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+        data = {'version': YEAR_END_SNAPSHOT_VERSION,
+                'tax_year': self.tax_year,
+                'loss_remaining_from_prev': self.loss_remaining_from_prev,
+                'loss_remaining_from_stock': self.loss_remaining_from_stock,
+                'trades': {symbol: {column: getattr(table, column).tolist() for column in SNAPSHOT_COLUMNS}
+                           for symbol, table in self.trades.items()}}
+        tmp_file = snapshot_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_file, snapshot_file)
+
+    @classmethod
+    def load(cls, snapshot_file):
+        with open(snapshot_file, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != YEAR_END_SNAPSHOT_VERSION:
+            raise Exception(f'Year-end snapshot {snapshot_file} is of version {data.get("version")}, '
+                            f'expected version {YEAR_END_SNAPSHOT_VERSION}. Create it again from the statements')
+        trades = dict()
+        for symbol, columns in data['trades'].items():
+            table = TradeTable(symbol)
+            for column in SNAPSHOT_COLUMNS:
+                getattr(table, column).extend(columns[column])
+            table.splits_applied.extend([NO_SPLITS_APPLIED] * len(table))
+            trades[symbol] = table
+        return cls(data['tax_year'], trades, data['loss_remaining_from_prev'], data['loss_remaining_from_stock'])
+
+    def __str__(self):
+        return f'(YearEndSnapshot: {self.tax_year}, {sum(len(table) for table in self.trades.values())} open trades, ' \
+               f'loss from previous years: {self.loss_from_prev_years})'
+
+    def __repr__(self):
+        return self.__str__()
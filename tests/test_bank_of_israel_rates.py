@@ -0,0 +1,93 @@
+from ..src.bank_of_israel import dollar_ils_rate_from_bank_of_israel, parse_rates_csv
+from datetime import date, datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import threading
+
+import pytest
+
+SDMX_CSV_HEADER = 'SERIES_CODE,FREQ,BASE_CURRENCY,COUNTER_CURRENCY,UNIT_MEASURE,DATA_TYPE,TIME_PERIOD,OBS_VALUE,RELEASE_STATUS'
+
+
+def stand_in_rate(day):
+    return round(3 + day.toordinal() % 1000 / 1000, 3)
+
+
+class StandInBankOfIsraelHandler(BaseHTTPRequestHandler):
+    '''Answers like the Bank of Israel SDMX API - a rate for every day but Saturday and Sunday'''
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        start = datetime.strptime(query['startperiod'][0], '%Y-%m-%d').date()
+        end = datetime.strptime(query['endperiod'][0], '%Y-%m-%d').date()
+        self.server.requested_ranges.append((start, end))
+
+        lines = [SDMX_CSV_HEADER]
+        day = start
+        while day <= end:
+            if day.weekday() < 5:
+                lines.append(f'RER_USD_ILS,D,USD,ILS,ILS,OF00,{day.isoformat()},{stand_in_rate(day)},')
+            day += timedelta(days=1)
+        body = ('\ufeff' + '\r\n'.join(lines) + '\r\n').encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def bank_of_israel_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInBankOfIsraelHandler)
+    server.requested_ranges = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f'http://127.0.0.1:{server.server_address[1]}/rates'
+    server.shutdown()
+    server.server_close()
+
+
+def test_parse_rates_csv():
+    text = f'\ufeff{SDMX_CSV_HEADER}\r\n' \
+           'RER_USD_ILS,D,USD,ILS,ILS,OF00,2020-01-02,3.452,\r\n' \
+           'RER_USD_ILS,D,USD,ILS,ILS,OF00,2020-01-03,,\r\n'
+    assert parse_rates_csv(text.encode('utf-8').decode('utf-8-sig')) == {datetime(2020, 1, 2): 3.452}
+
+
+def test_only_missing_days_are_downloaded(bank_of_israel_server, tmp_path):
+    server, url = bank_of_israel_server
+    store_file = str(tmp_path / 'rates.json')
+
+    rates = dollar_ils_rate_from_bank_of_israel(date(2020, 3, 1), date(2020, 3, 31), store_file, url)
+    assert server.requested_ranges == [(date(2020, 3, 1), date(2020, 3, 31))]
+    assert rates[datetime(2020, 3, 2)] == stand_in_rate(date(2020, 3, 2))
+    assert datetime(2020, 3, 1) not in rates  # Sunday
+    assert min(rates) == datetime(2020, 3, 2)
+    assert max(rates) == datetime(2020, 3, 31)
+
+    # Everything is in the store
+    server.requested_ranges.clear()
+    assert dollar_ils_rate_from_bank_of_israel(date(2020, 3, 1), date(2020, 3, 31), store_file, url) == rates
+    assert dollar_ils_rate_from_bank_of_israel(date(2020, 3, 10), date(2020, 3, 12), store_file, url) == \
+           {day: rate for day, rate in rates.items() if datetime(2020, 3, 10) <= day <= datetime(2020, 3, 12)}
+    assert server.requested_ranges == []
+
+    # Only the days before and after the stored days are downloaded
+    rates = dollar_ils_rate_from_bank_of_israel(date(2020, 2, 25), date(2020, 4, 3), store_file, url)
+    assert server.requested_ranges == [(date(2020, 2, 25), date(2020, 2, 29)), (date(2020, 4, 1), date(2020, 4, 3))]
+    assert min(rates) == datetime(2020, 2, 25)
+    assert max(rates) == datetime(2020, 4, 3)
+    assert len(rates) == 29
+
+
+def test_long_range_is_downloaded_in_chunks(bank_of_israel_server, tmp_path):
+    server, url = bank_of_israel_server
+    rates = dollar_ils_rate_from_bank_of_israel(date(2018, 1, 1), date(2020, 12, 31), str(tmp_path / 'rates.json'), url)
+    assert len(server.requested_ranges) == 3
+    assert server.requested_ranges[0][0] == date(2018, 1, 1)
+    assert server.requested_ranges[-1][1] == date(2020, 12, 31)
+    assert len(rates) == sum(1 for i in range((date(2020, 12, 31) - date(2018, 1, 1)).days + 1)
+                             if (date(2018, 1, 1) + timedelta(days=i)).weekday() < 5)
@@ -0,0 +1,63 @@
+from ..src.batch import find_clients, run_batch, CLIENT_REPORT_FILE_NAME
+from ..src.pdf_helpers import HEBREW_FONT_FILE
+from ..src.rate_calendar import RateCalendar
+from datetime import datetime, timedelta
+import json
+import os
+import shutil
+
+import pytest
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+STATEMENT_CSV = os.path.join(REPO_ROOT, 'test.csv')
+GENERATED_FILES = ('Form1322_not_deducted_1st_half.pdf', 'Form1322_not_deducted_2nd_half.pdf', 'Form1324.pdf',
+                   'dividends.xlsx', 'interests.xlsx', 'stocks_and_summary.xlsx', CLIENT_REPORT_FILE_NAME)
+
+
+def write_config(client_dir, **extra):
+    config = {'first-name': 'Israel', 'last-name': 'Israeli', 'id-number': '123456789', 'phone-number': '0501234567',
+              'date': '01/04/2021'}
+    config.update(extra)
+    with open(os.path.join(client_dir, 'config.json'), 'w', encoding='utf-8') as f:
+        json.dump({key: {'description': key, 'value': value} for key, value in config.items()}, f)
+
+
+@pytest.fixture
+def clients_dir(tmp_path):
+    for name in ('client-a', 'client-b'):
+        client_dir = tmp_path / 'clients' / name
+        client_dir.mkdir(parents=True)
+        shutil.copy(STATEMENT_CSV, client_dir / '2020.csv')
+        write_config(client_dir)
+    # No statement of the tax year
+    write_config(tmp_path / 'clients' / 'client-a', **{'tax-year': '2019'})
+    # Not a client - no config file
+    (tmp_path / 'clients' / 'other').mkdir()
+    return tmp_path / 'clients'
+
+
+def test_find_clients(clients_dir):
+    clients = find_clients(str(clients_dir))
+    assert [client.name for client in clients] == ['client-a', 'client-b']
+    assert clients[0].tax_year == 2019
+    assert clients[1].tax_year == 2020
+    assert clients[1].statements == [str(clients_dir / 'client-b' / '2020.csv')]
+    assert clients[1].tax_year_statement == str(clients_dir / 'client-b' / '2020.csv')
+
+
+@pytest.mark.skipif(not os.path.exists(os.path.join(REPO_ROOT, HEBREW_FONT_FILE)),
+                    reason=f'needs the Hebrew font {HEBREW_FONT_FILE} in the repository root')
+def test_run_batch(clients_dir, tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
+    dollar_ils_rate = RateCalendar({datetime(2018, 1, 1) + timedelta(days=i): 3.5 for i in range(4 * 366)})
+    output_dir = tmp_path / 'output'
+
+    results = run_batch(find_clients(str(clients_dir)), str(output_dir), workers=1, dollar_ils_rate=dollar_ils_rate)
+
+    # A failing client does not stop the others
+    assert [result.name for result in results] == ['client-a', 'client-b']
+    assert 'No such file or directory' in results[0].error
+    assert results[1].error is None
+    assert sorted(os.listdir(output_dir / 'client-b')) == sorted(GENERATED_FILES)
+    with open(output_dir / 'client-a' / CLIENT_REPORT_FILE_NAME, encoding='utf-8') as report:
+        assert 'Traceback' in report.read()
@@ -0,0 +1,43 @@
+from ..src.console_table import print_table
+import datetime
+import io
+
+HEADER_LIST = ['symbol', 'date', 'value']
+ROWS = [['AAPL', datetime.datetime(2020, 1, 2), 1.5],
+        ['GOOGL', datetime.datetime(2020, 1, 3), 1234.5678],
+        ['BA', datetime.datetime(2020, 1, 4), 7]]
+
+
+def test_print_table():
+    out = io.StringIO()
+    assert print_table(HEADER_LIST, iter(ROWS), out=out) == 3
+    assert out.getvalue() == '+--------+------------+----------+\n' \
+                             '| symbol | date       | value    |\n' \
+                             '+========+============+==========+\n' \
+                             '| AAPL   | 2020-01-02 |    1.500 |\n' \
+                             '| GOOGL  | 2020-01-03 | 1234.568 |\n' \
+                             '| BA     | 2020-01-04 |        7 |\n' \
+                             '+--------+------------+----------+\n'
+
+
+def test_widths_from_sample():
+    out = io.StringIO()
+    print_table(HEADER_LIST, ROWS, sample_rows=1, out=out)
+    lines = out.getvalue().splitlines()
+    # Widths of the first row only - wider cells are printed in full
+    assert lines[0] == '+--------+------------+-------+'
+    assert lines[4] == '| GOOGL  | 2020-01-03 | 1234.568 |'
+
+
+def test_row_limit():
+    out = io.StringIO()
+    assert print_table(HEADER_LIST, ROWS, row_limit=2, out=out) == 3
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 7
+    assert lines[-1] == '... 1 more rows not printed (3 rows)'
+
+
+def test_summary_only():
+    out = io.StringIO()
+    assert print_table(HEADER_LIST, ROWS, row_limit=0, out=out) == 3
+    assert out.getvalue() == '(3 rows)\n'
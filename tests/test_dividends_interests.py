@@ -0,0 +1,72 @@
+from ..src.tax_generator import Interest, Interests, Dividend, Dividends, usd_ils_rates, get_existing_exchange_date
+from ..src.rate_calendar import RateCalendar
+from datetime import datetime, timedelta
+import random
+
+import pytest
+
+
+def random_rates(rnd, days=120):
+    # Business days only - the weekends are looked up from the Friday before
+    first_day = datetime(2020, 1, 1)
+    return {first_day + timedelta(days=i): round(rnd.uniform(3.2, 3.8), 4)
+            for i in range(days) if (first_day + timedelta(days=i)).weekday() < 5}
+
+
+def random_dividends(rnd, num):
+    dividends = []
+    for i in range(num):
+        dividend = Dividend()
+        dividend.symbol = f'S{i % 7}'
+        dividend.date = datetime(2020, 1, 3) + timedelta(days=rnd.randint(0, 100))
+        dividend.value_usd = rnd.uniform(1, 300)
+        dividend.tax_deducted_usd = dividend.value_usd * 0.25 if rnd.random() < 0.5 else 0
+        dividends.append(dividend)
+    return dividends
+
+
+@pytest.mark.parametrize('calendar', [False, True], ids=['dict', 'RateCalendar'])
+def test_usd_ils_rates(calendar):
+    rnd = random.Random(0)
+    dollar_ils_rate = random_rates(rnd)
+    dates = [datetime(2020, 1, 3) + timedelta(days=i) for i in range(100)]
+    expected = [dollar_ils_rate[get_existing_exchange_date(date, dollar_ils_rate)] for date in dates]
+    if calendar:
+        dollar_ils_rate = RateCalendar(dollar_ils_rate)
+    assert usd_ils_rates(dates, dollar_ils_rate) == expected
+    assert usd_ils_rates([], dollar_ils_rate) == []
+
+
+def test_dividends_converted_once():
+    rnd = random.Random(1)
+    dollar_ils_rate = random_rates(rnd)
+    dividends_list = random_dividends(rnd, 50)
+    dividends = Dividends(dividends_list, RateCalendar(dollar_ils_rate))
+
+    for dividend, entry in zip(dividends_list, dividends.dividend_list):
+        rate = dollar_ils_rate[get_existing_exchange_date(dividend.date, dollar_ils_rate)]
+        assert entry.to_list() == [dividend.symbol, dividend.date, dividend.value_usd, rate,
+                                   dividend.value_usd * rate, dividend.tax_deducted_usd * rate]
+    # The totals equal summing the list, in the same order
+    assert dividends.get_total_usd() == sum([entry.value_usd for entry in dividends.dividend_list])
+    assert dividends.get_total_ils() == sum([entry.value_ils for entry in dividends.dividend_list])
+    assert dividends.get_total_ils_deducted() == sum([entry.tax_deducted_ils for entry in dividends.dividend_list])
+
+
+def test_interests_totals():
+    rnd = random.Random(2)
+    dollar_ils_rate = random_rates(rnd)
+    interest_list = [Interest(datetime(2020, 2, 1) + timedelta(days=i), rnd.uniform(0.1, 20)) for i in range(30)]
+    with pytest.raises(Exception, match='not populated'):
+        interest_list[0].value_ils
+
+    interests = Interests(interest_list[:-1], dollar_ils_rate)
+    interest = interest_list[-1]
+    interest.populate(dollar_ils_rate)
+    interests.add_interest(interest)
+
+    for interest in interests.interest_list:
+        rate = dollar_ils_rate[get_existing_exchange_date(interest.date, dollar_ils_rate)]
+        assert interest.to_list() == [interest.date, interest.value_usd, interest.value_usd * rate, rate]
+    assert interests.get_total_usd() == sum([interest.value_usd for interest in interest_list])
+    assert interests.get_total_ils() == sum([interest.value_ils for interest in interest_list])
@@ -0,0 +1,53 @@
+from ..src.excel_helper import get_format, write_row, AppendixWriter
+from ..src import tax_generator
+import datetime
+import os
+
+import xlrd
+import xlsxwriter
+
+
+def test_formats_are_created_once_per_workbook(tmp_path):
+    workbook = xlsxwriter.Workbook(str(tmp_path / 'appendix.xlsx'))
+    worksheet = workbook.add_worksheet()
+    formats_num = len(workbook.formats)
+
+    next_row = write_row(worksheet, 0, ['symbol', 'date', 'value'], workbook, bold=True, underline=True)
+    for i in range(100):
+        next_row = write_row(worksheet, next_row, ['TEST', datetime.datetime(2020, 1, 1), i], workbook,
+                             highlighted_cols=[2])
+    # bold+underline, yellow background
+    assert len(workbook.formats) - formats_num == 2
+
+    assert get_format(workbook, {'bold': True, 'underline': True}) is get_format(workbook, {'underline': 1, 'bold': 1})
+    assert get_format(workbook, {'bold': True}) is not get_format(workbook, {'bold': True, 'bg_color': 'yellow'})
+    workbook.close()
+
+
+def test_formats_are_not_shared_between_workbooks(tmp_path):
+    workbook1 = xlsxwriter.Workbook(str(tmp_path / '1.xlsx'))
+    workbook2 = xlsxwriter.Workbook(str(tmp_path / '2.xlsx'))
+    assert get_format(workbook1, {'bold': True}) is not get_format(workbook2, {'bold': True})
+    workbook1.close()
+    workbook2.close()
+
+
+def test_appendix_writer_shards_full_worksheets(tmp_path, monkeypatch):
+    monkeypatch.setattr(tax_generator, 'GENERATED_FILES_DIR', str(tmp_path))
+    header_list = ['name', 'amount']
+    rows = ([f'S{i}', i] for i in range(25))
+
+    with AppendixWriter('appendix', header_list, 'description', max_rows=16) as writer:
+        writer.write_rows(rows)
+        writer.skip_rows(1)
+        writer.write_row(['Total', 300], highlighted_cols=[1])
+
+    book = xlrd.open_workbook(os.path.join(str(tmp_path), 'appendix.xlsx'))
+    # 6 rows of personal info, description and header, then 10 data rows per worksheet
+    assert book.nsheets == 3
+    data_rows = []
+    for sheet in book.sheets():
+        assert sheet.cell_value(2, 2) == 'description'
+        assert sheet.row_values(5)[:2] == header_list
+        data_rows += [sheet.row_values(row)[:2] for row in range(6, sheet.nrows)]
+    assert data_rows == [[f'S{i}', i] for i in range(25)] + [['', ''], ['Total', 300]]
@@ -0,0 +1,117 @@
+from ..src.flex_statement import parse_flex_statement, flex_statement_account
+from ..src.ledger import Ledger, statement_account
+from ..src.tax_generator import parse_statement, parse_statements, form1325_obj_create
+from ..benchmarks.statement_generator import generate_statement, write_flex_statement
+from datetime import date, datetime, timedelta
+import os
+import random
+
+import pytest
+
+TEST_STATEMENT_CSV = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'test.csv')
+PARTIAL_2019_STATEMENT_CSV = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..',
+                                          'U2903438_20190101_20190607.csv')
+
+
+def statement_rows(statement):
+    return ({symbol: [(trade.date, trade.total_shares_num, trade.transaction_price, trade.commission,
+                       type(trade).__name__) for trade in table] for symbol, table in statement.trades.items()},
+            [(d.symbol, d.date, d.value_usd, d.tax_deducted_usd) for d in statement.dividends],
+            [(i.date, i.value_usd) for i in statement.interests],
+            str(statement.stock_splits))
+
+
+@pytest.mark.parametrize('statement_csv', [TEST_STATEMENT_CSV, PARTIAL_2019_STATEMENT_CSV])
+def test_same_as_csv(tmp_path, statement_csv):
+    flex_xml = os.path.join(tmp_path, 'statement.xml')
+    write_flex_statement(statement_csv, flex_xml)
+    assert flex_statement_account(flex_xml) == 'U2903438'
+    assert statement_rows(parse_statement(flex_xml)) == statement_rows(parse_statement(statement_csv))
+    assert parse_statement(flex_xml, sections=('Interest',)).trades == {}
+
+
+def test_generated_same_as_csv(tmp_path):
+    statement_csv = os.path.join(tmp_path, 'statement.csv')
+    flex_xml = os.path.join(tmp_path, 'statement.xml')
+    generate_statement(statement_csv, 3000, symbols_num=10, splits_num=2, withholding_fraction=0.5,
+                       start_date=date(2019, 1, 2), end_date=date(2019, 12, 31), seed=3)
+    write_flex_statement(statement_csv, flex_xml)
+    expected = parse_statement(statement_csv)
+    statement = parse_statement(flex_xml)
+    assert statement_rows(statement) == statement_rows(expected)
+    assert any(dividend.tax_deducted_usd for dividend in statement.dividends)
+
+    rnd = random.Random(0)
+    dollar_ils_rate = {datetime(2018, 12, 20) + timedelta(days=i): rnd.uniform(3.2, 3.8) for i in range(400)}
+    form1325 = form1325_obj_create(statement.trades, dollar_ils_rate, statement.stock_splits)
+    expected_form1325 = form1325_obj_create(expected.trades, dollar_ils_rate, expected.stock_splits)
+    assert form1325.entry_list
+    assert [entry.to_list() for entry in form1325.entry_list] == \
+           [entry.to_list() for entry in expected_form1325.entry_list]
+
+
+def test_flex_and_csv_statements(tmp_path):
+    # A Flex export overlapping a CSV statement is de-duplicated, and imported to the ledger, as a CSV statement is
+    flex_xml = os.path.join(tmp_path, 'test.xml')
+    write_flex_statement(TEST_STATEMENT_CSV, flex_xml)
+    parsed = parse_statements([PARTIAL_2019_STATEMENT_CSV, flex_xml], flex_xml)
+    expected = parse_statements([PARTIAL_2019_STATEMENT_CSV, TEST_STATEMENT_CSV], TEST_STATEMENT_CSV)
+    assert statement_rows(parsed) == statement_rows(expected)
+    assert list(parsed.overlaps.values()) == list(expected.overlaps.values())
+
+    assert statement_account(flex_xml) == 'U2903438'
+    with Ledger(os.path.join(tmp_path, 'ledger.db')) as ledger:
+        ledger.import_statement(TEST_STATEMENT_CSV)
+        assert ledger.import_statement(flex_xml) == {'trades': 0, 'dividends': 0, 'interests': 0, 'stock_splits': 0}
+
+
+def test_flex_details(tmp_path):
+    flex_xml = os.path.join(tmp_path, 'flex.xml')
+    with open(flex_xml, 'w', encoding='utf-8') as f:
+        f.write('''<FlexQueryResponse queryName="q" type="AF"><FlexStatements count="1">
+<FlexStatement accountId="U1" fromDate="2019-01-01" toDate="2019-12-31">
+<Trades>
+<Trade symbol="AAPL" tradeDate="2019-04-22" dateTime="2019-04-22;14:04:29" quantity="7" tradePrice="204.34"
+       ibCommission="-1" fifoPnlRealized="0" openCloseIndicator="O" notes="P" levelOfDetail="EXECUTION" />
+<Trade symbol="AAPL" tradeDate="2019-04-22" quantity="7" tradePrice="204.34" ibCommission="-1"
+       fifoPnlRealized="0" openCloseIndicator="O" levelOfDetail="SYMBOL_SUMMARY" />
+<Order symbol="AAPL" tradeDate="2019-04-22" quantity="7" tradePrice="204.34" openCloseIndicator="O" />
+<Trade symbol="USD.ILS" tradeDate="2019-04-23" quantity="100" tradePrice="3.6" ibCommission="-2"
+       fifoPnlRealized="0" openCloseIndicator="" levelOfDetail="EXECUTION" />
+<Trade symbol="AAPL" tradeDate="2019-05-22" quantity="-7" tradePrice="224.34" ibCommission="-1"
+       fifoPnlRealized="138.67" openCloseIndicator="C" levelOfDetail="EXECUTION" />
+</Trades>
+<CashTransactions>
+<CashTransaction type="Withholding Tax" currency="USD" dateTime="2019-05-16" amount="-1.62"
+                 description="AAPL(US0378331005) Cash Dividend 0.77 USD per Share - US Tax" levelOfDetail="DETAIL" />
+<CashTransaction type="Dividends" currency="USD" dateTime="2019-05-16" amount="5.39"
+                 description="AAPL(US0378331005) Cash Dividend 0.77 USD per Share (Ordinary Dividend)" />
+<CashTransaction type="Dividends" currency="USD" dateTime="2019-05-16" amount="5.39"
+                 description="AAPL(US0378331005) Cash Dividend" levelOfDetail="SUMMARY" />
+<CashTransaction type="Broker Interest Paid" currency="USD" dateTime="2019-06-03" amount="-0.2"
+                 description="USD Debit Interest for May-2019" />
+<CashTransaction type="Deposits/Withdrawals" currency="USD" dateTime="2019-06-03" amount="1000"
+                 description="Cash transfer" />
+</CashTransactions>
+<CorporateActions>
+<CorporateAction assetCategory="STK" reportDate="20190601" description="AAPL(US0378331005) Split 4 for 1 (AAPL)" />
+</CorporateActions>
+</FlexStatement></FlexStatements></FlexQueryResponse>
+''')
+    assert flex_statement_account(flex_xml) == 'U1'
+    statement = parse_flex_statement(flex_xml)
+    assert list(statement.trades) == ['AAPL']
+    assert [(trade.date, trade.total_shares_num) for trade in statement.trades['AAPL']] == \
+           [(datetime(2019, 4, 22), 7), (datetime(2019, 5, 22), -7)]
+    # The withholding tax is joined to its dividend, even before it in the export
+    assert [(d.symbol, d.date, d.value_usd, d.tax_deducted_usd) for d in statement.dividends] == \
+           [('AAPL', datetime(2019, 5, 16), 5.39, 1.62)]
+    assert [(i.date, i.value_usd) for i in statement.interests] == [(datetime(2019, 6, 3), -0.2)]
+    assert [(split.date, split.ratio) for split in statement.stock_splits.get_stock_splits_for_symbol('AAPL')] == \
+           [(datetime(2019, 6, 1), 4)]
+
+    not_flex_xml = os.path.join(tmp_path, 'error.xml')
+    with open(not_flex_xml, 'w', encoding='utf-8') as f:
+        f.write('<FlexStatementResponse><Status>Fail</Status></FlexStatementResponse>')
+    with pytest.raises(Exception, match='not a Flex Query XML export'):
+        parse_statement(not_flex_xml)
@@ -1,8 +1,10 @@
 from ..src.tax_generator import form1325_obj_create, print_form1325_list
 from ..src.tax_generator import TradeOpen, TradeClose
 from ..src.tax_generator import _tax_to_pay
+from ..src.tax_generator import Form1325, Form1325Entry, create_form1325_from_date_range
 from datetime import date, timedelta
 from itertools import count
+import random
 
 import texttable as tt
 import pytest
@@ -407,3 +409,62 @@ bla = [(-180, -100, -80)]
 #     '''
 #     taxable = _tax_to_pay(nominal_profit_loss=nominal, inflational_profit_loss=inflational)
 #     assert taxable == expected_taxable
+
+
+def random_form1325(seed, entries_num=300):
+    rnd = random.Random(seed)
+    form1325 = Form1325()
+    for _ in range(entries_num):
+        entry = Form1325Entry()
+        entry.sale_date = date(2020, 1, 1) + timedelta(days=rnd.randint(0, 365))
+        entry.profit_loss = rnd.uniform(-1000, 1000)
+        entry.sale_value = rnd.uniform(0, 5000)
+        form1325.entry_list.append(entry)
+    form1325.add_totals()
+    return form1325
+
+
+def linear_range_totals(form1325, start_date, end_date):
+    entries = [entry for entry in form1325.entry_list if start_date <= entry.sale_date < end_date]
+    return (sum(entry.profit_loss for entry in entries if entry.profit_loss >= 0),
+            sum(entry.profit_loss for entry in entries if entry.profit_loss < 0),
+            sum(entry.sale_value for entry in entries),
+            sorted(entries, key=lambda entry: entry.sale_date))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_date_range_totals(seed):
+    form1325 = random_form1325(seed)
+    original_order = list(form1325.entry_list)
+    rnd = random.Random(seed)
+    ranges = [(date(2020, 1, 1), date(2020, 7, 1)), (date(2020, 7, 1), date(2021, 1, 1)),
+              (date(2019, 1, 1), date(2022, 1, 1)), (date(2020, 3, 1), date(2020, 3, 1)),
+              (date(2020, 5, 1), date(2020, 4, 1))]
+    for _ in range(20):
+        start_date = date(2020, 1, 1) + timedelta(days=rnd.randint(-10, 370))
+        ranges.append((start_date, start_date + timedelta(days=rnd.randint(0, 100))))
+
+    for start_date, end_date in ranges:
+        period = create_form1325_from_date_range(form1325, start_date, end_date)
+        profits, losses, sales, entries = linear_range_totals(form1325, start_date, end_date)
+        assert period.total_profits == pytest.approx(profits)
+        assert period.total_losses == pytest.approx(losses)
+        assert period.total_sales == pytest.approx(sales)
+        assert len(period) == len(entries)
+        assert [id(entry) for entry in period.entry_list] == [id(entry) for entry in entries]
+    # The form keeps its entries in their original order
+    assert form1325.entry_list == original_order
+
+
+def test_periods():
+    form1325 = random_form1325(0)
+    months = [date(2020, month, 1) for month in range(1, 13)] + [date(2021, 1, 1)]
+    periods = form1325.periods(months)
+
+    assert len(periods) == 12
+    assert sum(len(period) for period in periods) == len(form1325.entry_list)
+    assert sum(period.total_profits for period in periods) == pytest.approx(form1325.total_profits)
+    assert sum(period.total_losses for period in periods) == pytest.approx(form1325.total_losses)
+    assert sum(period.total_sales for period in periods) == pytest.approx(form1325.total_sales)
+    for month, period in zip(months, periods):
+        assert all(entry.sale_date.month == month.month for entry in period.entry_list)
@@ -0,0 +1,126 @@
+from ..src.tax_generator import form1325_obj_create, _tax_to_pay
+from ..src.tax_generator import TradeOpen, TradeClose, StockSplit, AllStockSplits
+from ..src.form1325_vectorized import tax_to_pay, TAX_CASE_NOT_HANDLED
+from ..src.rate_calendar import RateCalendar
+from .test_form1325 import test_params_generic, test_params_generic_test_names, ladar_testdata, \
+    ladar_testdata_test_case_names, check_entries_math, check_expected_profit_loss, ALLOWED_ERROR_MARGIN
+from .test_lot_matching import random_trade_list
+from copy import deepcopy
+from datetime import date, datetime, timedelta
+import random
+
+import numpy as np
+import pytest
+
+# test_form1325 consumes the shares of its module level trades - keep them as they were collected
+PRISTINE_PARAMS_GENERIC = deepcopy(test_params_generic)
+ENTRY_FIELDS = ('symbol', 'sale_value_usd', 'purchase_date', 'orig_price_ils', 'usd_sale_to_purchase_rate',
+                'adjusted_price', 'sale_date', 'sale_value', 'profit_loss')
+
+
+def both_engines(trade_dic, dollar_ils_rate, stock_splits=None):
+    '''
+    :return: (scalar Form1325, vectorized Form1325), each created from its own copy of trade_dic.
+             The entries of both are checked to agree
+    '''
+    scalar_trade_dic = deepcopy(trade_dic)
+    vectorized_trade_dic = deepcopy(trade_dic)
+    scalar = form1325_obj_create(scalar_trade_dic, dollar_ils_rate, deepcopy(stock_splits), vectorized=False)
+    vectorized = form1325_obj_create(vectorized_trade_dic, dollar_ils_rate, deepcopy(stock_splits), vectorized=True)
+
+    assert len(vectorized.entry_list) == len(scalar.entry_list)
+    for scalar_entry, vectorized_entry in zip(scalar.entry_list, vectorized.entry_list):
+        for field in ENTRY_FIELDS:
+            expected = getattr(scalar_entry, field)
+            actual = getattr(vectorized_entry, field)
+            if isinstance(expected, float):
+                assert actual == pytest.approx(expected, ALLOWED_ERROR_MARGIN), field
+            else:
+                assert actual == expected, field
+    for field in ('total_profits', 'total_losses', 'total_sales'):
+        assert getattr(vectorized, field) == pytest.approx(getattr(scalar, field), ALLOWED_ERROR_MARGIN)
+    # Same side effects on the trades
+    for symbol in trade_dic:
+        for scalar_trade, vectorized_trade in zip(scalar_trade_dic[symbol], vectorized_trade_dic[symbol]):
+            assert vectorized_trade.commission == scalar_trade.commission
+            assert vectorized_trade.shares_left == scalar_trade.shares_left
+            if type(scalar_trade) is TradeClose:
+                assert vectorized_trade.realized == pytest.approx(scalar_trade.realized, ALLOWED_ERROR_MARGIN)
+    return scalar, vectorized
+
+
+@pytest.mark.parametrize('test_trade_list_dic', PRISTINE_PARAMS_GENERIC, ids=test_params_generic_test_names)
+def test_vectorized_multiple_buy_sell(test_trade_list_dic):
+    dollar_ils_rate = {}
+    trade_dic = {}
+    for test_trade in test_trade_list_dic['test_trade_list']:
+        dollar_ils_rate[test_trade.trade.date] = test_trade.rate
+        trade_dic.setdefault(test_trade.trade.symbol, []).append(test_trade.trade)
+
+    _, form1325 = both_engines(trade_dic, dollar_ils_rate)
+
+    assert len(form1325.entry_list) == len(test_trade_list_dic['expected_profit_loss'])
+    for expected, entry in zip(test_trade_list_dic['expected_profit_loss'], form1325.entry_list):
+        check_expected_profit_loss(expected, entry.profit_loss)
+    check_entries_math(form1325.entry_list)
+
+
+@pytest.mark.parametrize("open_rate, close_rate, open_price_usd, close_price_usd, shares_num_open, shares_num_close, "
+                         "expected", ladar_testdata, ids=ladar_testdata_test_case_names)
+def test_vectorized_laradar_example(open_rate, close_rate, open_price_usd, close_price_usd, shares_num_open,
+                                    shares_num_close, expected):
+    open_date = date(2020, 1, 1)
+    close_date = date(2020, 1, 2)
+    dollar_ils_rate = {open_date: open_rate, close_date: close_rate}
+    trade_dic = {
+        'TEST': [
+            TradeOpen(symbol='TEST', transaction_price=open_price_usd, date=open_date,
+                      total_shares_num=shares_num_open, shares_left=shares_num_open),
+            TradeClose(symbol='TEST', transaction_price=close_price_usd, date=close_date,
+                       total_shares_num=shares_num_close, shares_left=shares_num_close),
+        ]
+    }
+    _, form1325 = both_engines(trade_dic, dollar_ils_rate)
+    check_expected_profit_loss(expected['profit_loss'], form1325.entry_list[0].profit_loss)
+    check_entries_math(form1325.entry_list)
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('calendar', [False, True], ids=['dict', 'RateCalendar'])
+def test_vectorized_random_trades(seed, calendar):
+    rnd = random.Random(seed)
+    trade_dic = dict()
+    for symbol in ('AAA', 'BBB', 'CCC'):
+        trade_list = random_trade_list(rnd, 150)
+        for trade in trade_list:
+            trade.symbol = symbol
+            trade.date = datetime(trade.date.year, trade.date.month, trade.date.day)
+            trade.commission = rnd.choice([0, 0.5, 1, 2.5])
+        trade_dic[symbol] = trade_list
+    last_day = max(trade.date for trade_list in trade_dic.values() for trade in trade_list)
+    # Rates of business days only - weekend trades take the rate of the Friday before
+    dollar_ils_rate = {datetime(2018, 12, 25) + timedelta(days=i): rnd.uniform(3.2, 3.8)
+                       for i in range((last_day - datetime(2018, 12, 25)).days + 1)
+                       if (datetime(2018, 12, 25) + timedelta(days=i)).weekday() < 5}
+    if calendar:
+        dollar_ils_rate = RateCalendar(dollar_ils_rate)
+    stock_splits = AllStockSplits()
+    stock_splits.add_stock_split(StockSplit('BBB', datetime(2019, 4, 6), 2))
+
+    scalar, _ = both_engines(trade_dic, dollar_ils_rate, stock_splits)
+    assert scalar.entry_list
+
+
+def test_vectorized_tax_to_pay():
+    rnd = random.Random(0)
+    pairs = [(rnd.uniform(-1000, 1000), rnd.uniform(-1000, 1000)) for _ in range(1000)]
+    pairs += [(0.0, 0.0), (0.0, 10.0), (10.0, 0.0), (-10.0, 0.0), (0.0, -10.0), (5.0, 5.0), (-5.0, -5.0)]
+    nominal = np.array([nominal for nominal, _ in pairs])
+    inflational = np.array([inflational for _, inflational in pairs])
+
+    assert tax_to_pay(nominal, inflational).tolist() == [_tax_to_pay(*pair) for pair in pairs]
+    # Nominal profit with an inflational and a real loss - only with a NaN inflation
+    with pytest.raises(Exception, match=TAX_CASE_NOT_HANDLED):
+        _tax_to_pay(1.0, float('nan'))
+    with pytest.raises(Exception, match=TAX_CASE_NOT_HANDLED):
+        tax_to_pay(np.array([1.0, 2.0]), np.array([0.5, np.nan]))
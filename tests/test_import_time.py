@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+# Dependencies only needed by some stages - they must be imported by the stage, not by the module
+DEFERRED_MODULES = ('reportlab', 'PyPDF2', 'xlsxwriter', 'xlrd', 'requests', 'texttable', 'win32com')
+IMPORT_TIME_BUDGET_US = 500000
+
+
+def import_times(module):
+    '''
+    Import module in a fresh interpreter with -X importtime
+    :return: (stdout of the import, dictionary of imported module -> cumulative import time in microseconds)
+    '''
+    # Warm up, so that compiling the .pyc files is not measured
+    subprocess.run([sys.executable, '-c', f'import {module}'], cwd=REPO_ROOT, check=True, capture_output=True)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=REPO_ROOT, check=True,
+                            capture_output=True, text=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return result.stdout, times
+
+
+def test_tax_generator_import_is_cheap():
+    stdout, times = import_times('src.tax_generator')
+
+    # No side effects such as printing the config
+    assert stdout == ''
+    heavy_imports = [name for name in times if name.split('.')[0] in DEFERRED_MODULES]
+    assert heavy_imports == []
+    assert times['src.tax_generator'] < IMPORT_TIME_BUDGET_US
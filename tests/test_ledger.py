@@ -0,0 +1,100 @@
+from ..src.ledger import Ledger, statement_account
+from ..src.tax_generator import form1325_obj_create, parse_statement, parse_statements
+from ..benchmarks.statement_generator import generate_statement
+from datetime import date, datetime, timedelta
+import os
+import random
+import sqlite3
+
+import pytest
+
+TEST_STATEMENT_CSV = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'test.csv')
+PARTIAL_2019_STATEMENT_CSV = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..',
+                                          'U2903438_20190101_20190607.csv')
+AAPL_OPEN_LINE = 'Trades,Data,Order,Stocks,USD,AAPL,"2019-04-22, 14:04:29",7,204.34,204.53,-1430.38,-1,1431.38,0,1.33,O\n'
+
+
+def trade_rows(trade_dic):
+    return {symbol: [(trade.date, trade.total_shares_num, trade.transaction_price, trade.commission)
+                     for trade in table] for symbol, table in trade_dic.items()}
+
+
+def test_import_deduplicates(tmp_path):
+    assert statement_account(TEST_STATEMENT_CSV) == 'U2903438'
+    with Ledger(os.path.join(tmp_path, 'ledger', 'ledger.db')) as ledger:
+        added = ledger.import_statement(TEST_STATEMENT_CSV)
+        statement = parse_statement(TEST_STATEMENT_CSV)
+        assert added == {'trades': sum(len(table) for table in statement.trades.values()), 'dividends': 2,
+                         'interests': 1, 'stock_splits': 0}
+        # The same file is not imported again
+        assert ledger.import_statement(TEST_STATEMENT_CSV) is None
+
+        # Another statement with the same rows adds only its new rows: a fill repeated in the statement is kept
+        with open(TEST_STATEMENT_CSV, encoding='utf-8') as f:
+            lines = f.readlines()
+        overlapping_csv = os.path.join(tmp_path, 'overlapping.csv')
+        with open(overlapping_csv, 'w', encoding='utf-8') as f:
+            f.writelines(line for line in lines for _ in range(2 if line == AAPL_OPEN_LINE else 1))
+        assert ledger.import_statement(overlapping_csv) == {'trades': 1, 'dividends': 0, 'interests': 0,
+                                                            'stock_splits': 0}
+
+        assert ledger.accounts() == ['U2903438']
+        assert ledger.statements('U2903438') == [os.path.abspath(TEST_STATEMENT_CSV), os.path.abspath(overlapping_csv)]
+        trades = ledger.trades('U2903438')
+        assert [trade.total_shares_num for trade in trades['AAPL']] == [7, 7, -7]
+        assert trades['AAPL'] is trades['AAPL']
+        with pytest.raises(KeyError):
+            trades['USD.ILS']
+        assert ledger.trades('U2903438', start_year=2020) == {}
+
+
+def test_import_needs_account(tmp_path):
+    statement_csv = os.path.join(tmp_path, 'statement.csv')
+    generate_statement(statement_csv, 10, symbols_num=2)
+    assert statement_account(statement_csv) is None
+    with Ledger(os.path.join(tmp_path, 'ledger.db')) as ledger:
+        with pytest.raises(Exception, match='account'):
+            ledger.import_statement(statement_csv)
+        assert ledger.import_statement(statement_csv, account='TEST')['trades'] == 10
+
+
+def test_ledger_version(tmp_path):
+    ledger_file = os.path.join(tmp_path, 'ledger.db')
+    Ledger(ledger_file).close()
+    connection = sqlite3.connect(ledger_file)
+    connection.execute('PRAGMA user_version = 1000')
+    connection.close()
+    with pytest.raises(Exception, match='version'):
+        Ledger(ledger_file)
+
+
+def test_ledger_same_as_statements(tmp_path):
+    statement_2019 = os.path.join(tmp_path, '2019.csv')
+    statement_2020 = os.path.join(tmp_path, '2020.csv')
+    generate_statement(statement_2019, 2000, symbols_num=10, splits_num=1, start_date=date(2019, 1, 2),
+                       end_date=date(2019, 12, 31), seed=1)
+    generate_statement(statement_2020, 2000, symbols_num=10, splits_num=2, start_date=date(2020, 1, 2),
+                       end_date=date(2020, 12, 31), seed=2)
+    rnd = random.Random(0)
+    dollar_ils_rate = {datetime(2018, 12, 20) + timedelta(days=i): rnd.uniform(3.2, 3.8) for i in range(750)}
+
+    expected = parse_statements([statement_2019, statement_2020], statement_2020)
+    with Ledger(os.path.join(tmp_path, 'ledger.db')) as ledger:
+        ledger.import_statement(statement_2019, account='TEST')
+        ledger.import_statement(statement_2020, account='TEST')
+        ledger.import_statement(PARTIAL_2019_STATEMENT_CSV)
+        statement = ledger.parsed_statement('TEST', 2020)
+
+        assert list(statement.trades) == list(expected.trades)
+        assert trade_rows(statement.trades) == trade_rows(expected.trades)
+        assert [(d.symbol, d.date, d.value_usd, d.tax_deducted_usd) for d in statement.dividends] == \
+               [(d.symbol, d.date, d.value_usd, d.tax_deducted_usd) for d in expected.dividends]
+        assert [(i.date, i.value_usd) for i in statement.interests] == \
+               [(i.date, i.value_usd) for i in expected.interests]
+        assert str(statement.stock_splits) == str(expected.stock_splits)
+
+        form1325 = form1325_obj_create(statement.trades, dollar_ils_rate, statement.stock_splits)
+        expected_form1325 = form1325_obj_create(expected.trades, dollar_ils_rate, expected.stock_splits)
+        assert form1325.entry_list
+        assert [entry.to_list() for entry in form1325.entry_list] == \
+               [entry.to_list() for entry in expected_form1325.entry_list]
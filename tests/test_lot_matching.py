@@ -0,0 +1,150 @@
+from ..src.tax_generator import match_symbol_lots, handle_stock_split
+from ..src.tax_generator import TradeOpen, TradeClose, StockSplit, AllStockSplits, SplitIndex
+from copy import deepcopy
+from datetime import date, timedelta
+import random
+
+import pytest
+
+
+def quadratic_match_symbol_lots(trade_list, stock_splits):
+    '''
+    The original matching loop of form1325_obj_create - rescans trade_list from the
+    start for every closing trade. Kept as the reference for the FIFO lot queue.
+    '''
+    opening_shares_lists = []
+    for closing_trade in trade_list:
+        opening_shares_list = []
+        if type(closing_trade) is TradeClose:
+            for opening_trade in trade_list:
+                if type(opening_trade) is TradeOpen:
+                    if opening_trade.shares_left == 0:
+                        continue
+                    covered = 0
+
+                    handle_stock_split(opening_trade, closing_trade, stock_splits)
+                    if opening_trade.shares_left + closing_trade.shares_left >= 0:
+                        covered += abs(closing_trade.shares_left)
+                        opening_trade.shares_left += closing_trade.shares_left
+                        closing_trade.shares_left = 0
+                    elif opening_trade.shares_left > 0 and opening_trade.shares_left + closing_trade.shares_left < 0:
+                        covered += abs(opening_trade.shares_left)
+                        closing_trade.shares_left += opening_trade.shares_left
+                        opening_trade.shares_left = 0
+
+                    opening_shares_list.append((closing_trade, opening_trade, covered))
+
+                    if closing_trade.shares_left == 0:
+                        break
+        if len(opening_shares_list) > 0:
+            opening_shares_lists.append(opening_shares_list[:])
+    return opening_shares_lists
+
+
+def random_trade_list(rnd, n, with_short_lots=False):
+    trade_list = []
+    position = 0
+    day = date(2019, 1, 1)
+    for _ in range(n):
+        day += timedelta(days=rnd.randint(0, 2))
+        price = rnd.uniform(10, 500)
+        if position == 0 or rnd.random() < 0.55:
+            shares = rnd.randint(1, 100)
+            if with_short_lots and rnd.random() < 0.05:
+                shares = -shares
+            else:
+                position += shares
+            trade_list.append(TradeOpen(symbol='TEST', transaction_price=price, date=day, total_shares_num=shares,
+                                        shares_left=shares, commission=1))
+        else:
+            # Sometimes sell more than the position, so that lots opened later are used
+            shares = rnd.randint(1, position + 20)
+            position = max(position - shares, 0)
+            trade_list.append(TradeClose(symbol='TEST', transaction_price=price, date=day, total_shares_num=-shares,
+                                         shares_left=-shares, commission=1))
+    return trade_list
+
+
+def as_comparable(trade_list, opening_shares_lists, index_of=None):
+    if index_of is None:
+        index = {id(trade): i for i, trade in enumerate(trade_list)}
+        index_of = lambda trade: index[id(trade)]
+    matches = [[(index_of(c), index_of(o), covered) for c, o, covered in lst] for lst in opening_shares_lists]
+    states = [(t.shares_left, t.total_shares_num, t.transaction_price) for t in trade_list]
+    return matches, states
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('with_short_lots', [False, True], ids=['long', 'with short lots'])
+def test_queue_matches_quadratic_reference(seed, with_short_lots):
+    rnd = random.Random(seed)
+    trade_list = random_trade_list(rnd, 200, with_short_lots)
+    stock_splits = AllStockSplits()
+    stock_splits.add_stock_split(StockSplit('TEST', date(2019, 3, 1), 2))
+    stock_splits.add_stock_split(StockSplit('TEST', date(2019, 6, 1), 3))
+
+    reference_trade_list = deepcopy(trade_list)
+    expected = quadratic_match_symbol_lots(reference_trade_list, stock_splits)
+    actual = match_symbol_lots(trade_list, stock_splits)
+
+    assert as_comparable(trade_list, actual) == as_comparable(reference_trade_list, expected)
+
+
+def test_close_covered_by_later_lot():
+    trade_list = [
+        TradeClose(symbol='TEST', transaction_price=10, date=date(2020, 1, 1), total_shares_num=-5, shares_left=-5),
+        TradeOpen(symbol='TEST', transaction_price=8, date=date(2020, 1, 2), total_shares_num=5, shares_left=5),
+    ]
+    opening_shares_lists = match_symbol_lots(trade_list, AllStockSplits())
+    assert opening_shares_lists == [[(trade_list[0], trade_list[1], 5)]]
+
+
+def test_split_index():
+    stock_splits = AllStockSplits()
+    # Added out of order
+    stock_splits.add_stock_split(StockSplit('TEST', date(2019, 6, 1), 3))
+    stock_splits.add_stock_split(StockSplit('TEST', date(2019, 3, 1), 2))
+    stock_splits.add_stock_split(StockSplit('TEST', date(2019, 9, 1), 5))
+    assert [split.date for split in stock_splits.get_stock_splits_for_symbol('TEST')] == \
+           [date(2019, 3, 1), date(2019, 6, 1), date(2019, 9, 1)]
+
+    index = stock_splits.get_split_index('TEST')
+    assert index.cumulative_ratios == [1, 2, 6, 30]
+    assert index.ratio_between(date(2019, 1, 1), date(2020, 1, 1)) == 30
+    assert index.ratio_between(date(2019, 3, 1), date(2019, 9, 2)) == 15
+    # Splits strictly between the dates
+    assert index.ratio_between(date(2019, 3, 1), date(2019, 9, 1)) == 3
+    assert index.ratio_between(date(2019, 7, 1), date(2019, 8, 1)) == 1
+    assert stock_splits.get_split_index('OTHER').ratio_between(date(2019, 1, 1), date(2020, 1, 1)) == 1
+
+    # A split added later is in the index
+    stock_splits.add_stock_split(StockSplit('TEST', date(2019, 4, 1), 4))
+    assert stock_splits.get_split_index('TEST').ratio_between(date(2019, 1, 1), date(2019, 5, 1)) == 8
+    # All the splits of all the symbols, by date
+    stock_splits.add_stock_split(StockSplit('OTHER', date(2019, 5, 1), 2))
+    assert [(split.symbol, split.date) for split in stock_splits] == \
+           [('TEST', date(2019, 3, 1)), ('TEST', date(2019, 4, 1)), ('OTHER', date(2019, 5, 1)),
+            ('TEST', date(2019, 6, 1)), ('TEST', date(2019, 9, 1))]
+    # A reverse split (truncated to 0 by StockSplit) does not break the splits after it
+    assert SplitIndex([StockSplit('TEST', date(2019, 1, 1), 0.1), StockSplit('TEST', date(2019, 3, 1), 2)]) \
+               .ratio_between(date(2019, 2, 1), date(2019, 4, 1)) == 2
+
+
+def test_lot_adjusted_once_for_split():
+    stock_splits = AllStockSplits()
+    stock_splits.add_stock_split(StockSplit('TEST', date(2019, 3, 1), 2))
+    stock_splits.add_stock_split(StockSplit('TEST', date(2019, 6, 1), 3))
+    trade_list = [
+        TradeOpen(symbol='TEST', transaction_price=60, date=date(2019, 1, 1), total_shares_num=10, shares_left=10),
+        # After the 2:1 split - the lot is 20 shares at 30
+        TradeClose(symbol='TEST', transaction_price=40, date=date(2019, 4, 1), total_shares_num=-5, shares_left=-5),
+        TradeClose(symbol='TEST', transaction_price=40, date=date(2019, 5, 1), total_shares_num=-5, shares_left=-5),
+        # After the 3:1 split - the 10 shares left are 30 shares at 10
+        TradeClose(symbol='TEST', transaction_price=15, date=date(2019, 7, 1), total_shares_num=-30,
+                   shares_left=-30),
+    ]
+    opening_shares_lists = match_symbol_lots(trade_list, stock_splits)
+
+    assert [[covered for _, _, covered in lst] for lst in opening_shares_lists] == [[5], [5], [30]]
+    lot = trade_list[0]
+    assert (lot.shares_left, lot.total_shares_num, lot.transaction_price) == (0, 60, 10)
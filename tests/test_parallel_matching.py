@@ -0,0 +1,94 @@
+from ..src.tax_generator import form1325_obj_create, match_symbol_lots, parse_statement
+from ..src.tax_generator import TradeTable, StockSplit, AllStockSplits
+from ..src.parallel_matching import match_lots_parallel, shard_symbols
+from .test_lot_matching import random_trade_list, as_comparable
+from copy import deepcopy
+from datetime import date, datetime, timedelta
+import os
+import random
+
+import pytest
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+TEST_STATEMENT_CSV = os.path.join(REPO_ROOT, 'test.csv')
+SYMBOLS = ('AAA', 'BBB', 'CCC', 'DDD', 'EEE')
+
+
+def random_trade_dic(seed, tables):
+    rnd = random.Random(seed)
+    trade_dic = dict()
+    for symbol in SYMBOLS:
+        trade_list = random_trade_list(rnd, rnd.randint(0, 300), with_short_lots=True)
+        for trade in trade_list:
+            trade.symbol = symbol
+            trade.date = datetime(trade.date.year, trade.date.month, trade.date.day)
+        if tables:
+            table = TradeTable(symbol)
+            table.extend(trade_list)
+            trade_list = table
+        trade_dic[symbol] = trade_list
+    stock_splits = AllStockSplits()
+    stock_splits.add_stock_split(StockSplit('BBB', datetime(2019, 3, 1), 2))
+    stock_splits.add_stock_split(StockSplit('BBB', datetime(2019, 6, 1), 3))
+    stock_splits.add_stock_split(StockSplit('DDD', datetime(2019, 4, 1), 4))
+    return trade_dic, stock_splits
+
+
+def comparable(trade_dic, opening_shares_lists):
+    '''Matches as (symbol, closing trade index, opening trade index, shares), and the state of the trades'''
+    # Every trade is a view of a row of a trade table (of its own, for the trades of lists)
+    index = {(id(trade._table), trade._row): i for trade_list in trade_dic.values() for i, trade in enumerate(trade_list)}
+    matches = [[(c.symbol, index[id(c._table), c._row], index[id(o._table), o._row], covered) for c, o, covered in lst]
+               for lst in opening_shares_lists]
+    states = {symbol: as_comparable(list(trade_list), [])[1] for symbol, trade_list in trade_dic.items()}
+    return matches, states
+
+
+def test_shard_symbols():
+    trade_dic = {'A': [0] * 10, 'B': [0] * 70, 'C': [0] * 20, 'D': [0] * 30, 'E': [0] * 40}
+    shards = shard_symbols(trade_dic, 2)
+    assert sorted(symbol for shard in shards for symbol in shard) == sorted(trade_dic)
+    assert sorted(sum(len(trade_dic[symbol]) for symbol in shard) for shard in shards) == [80, 90]
+    # Symbols keep the order of trade_dic within a shard
+    for shard in shards:
+        assert shard == [symbol for symbol in trade_dic if symbol in shard]
+    assert len(shard_symbols(trade_dic, 32)) == len(trade_dic)
+    assert shard_symbols(dict(), 4) == []
+
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('tables', [False, True], ids=['lists', 'tables'])
+def test_parallel_matches_serial(seed, tables):
+    trade_dic, stock_splits = random_trade_dic(seed, tables)
+    serial_trade_dic = deepcopy(trade_dic)
+    expected = []
+    for trade_list in serial_trade_dic.values():
+        expected += match_symbol_lots(trade_list, deepcopy(stock_splits))
+
+    actual = match_lots_parallel(trade_dic, stock_splits, 3)
+
+    # The matches are of the trades of trade_dic, which have the state of a serial run
+    assert comparable(trade_dic, actual) == comparable(serial_trade_dic, expected)
+
+
+@pytest.mark.parametrize('vectorized', [False, True], ids=['scalar', 'vectorized'])
+def test_parallel_form1325_same_as_serial(vectorized):
+    statement = parse_statement(TEST_STATEMENT_CSV)
+    trade_dates = [trade.date for trade_list in statement.trades.values() for trade in trade_list]
+    rnd = random.Random(0)
+    first_day = min(trade_dates) - timedelta(days=7)
+    dollar_ils_rate = {first_day + timedelta(days=i): rnd.uniform(3.2, 3.8)
+                       for i in range((max(trade_dates) - first_day).days + 1)}
+
+    serial_statement = deepcopy(statement)
+    serial = form1325_obj_create(serial_statement.trades, dollar_ils_rate, serial_statement.stock_splits,
+                                 vectorized=vectorized, matching_workers=1)
+    parallel = form1325_obj_create(statement.trades, dollar_ils_rate, statement.stock_splits,
+                                   vectorized=vectorized, matching_workers=2)
+
+    assert len(statement.trades) > 1 and parallel.entry_list
+    assert [entry.to_list() for entry in parallel.entry_list] == [entry.to_list() for entry in serial.entry_list]
+    assert (parallel.total_profits, parallel.total_losses, parallel.total_sales) == \
+           (serial.total_profits, serial.total_losses, serial.total_sales)
+    assert {symbol: str(trade_list) for symbol, trade_list in statement.trades.items()} == \
+           {symbol: str(trade_list) for symbol, trade_list in serial_statement.trades.items()}
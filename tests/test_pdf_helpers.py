@@ -0,0 +1,125 @@
+from ..src.pdf_helpers import get_pdf_template
+import io
+import os
+
+from PyPDF2 import PdfFileWriter, PdfFileReader
+from PyPDF2.generic import IndirectObject, DictionaryObject, ArrayObject, StreamObject
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+import pytest
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+TEMPLATE_PDF = os.path.join(REPO_ROOT, 'itc1324_18.pdf')
+PROC_FD_DIR = '/proc/self/fd'
+
+
+def references(obj, seen=None):
+    '''All the indirect references reachable from obj'''
+    if seen is None:
+        seen = set()
+    if isinstance(obj, IndirectObject):
+        yield obj
+        if (obj.idnum, obj.generation) not in seen:
+            seen.add((obj.idnum, obj.generation))
+            yield from references(obj.get_object(), seen)
+    elif isinstance(obj, DictionaryObject):
+        for key, value in obj.items():
+            if key != '/Parent':
+                yield from references(value, seen)
+    elif isinstance(obj, ArrayObject):
+        for value in obj:
+            yield from references(value, seen)
+
+
+def resolved(obj):
+    '''obj with all the references resolved, to compare objects of different PDFs'''
+    if isinstance(obj, IndirectObject):
+        return resolved(obj.get_object())
+    if isinstance(obj, StreamObject):
+        return obj.get_data(), resolved(DictionaryObject(obj))
+    if isinstance(obj, DictionaryObject):
+        return {key: sorted(value) if key == '/ProcSet' else resolved(value)
+                for key, value in obj.items() if key != '/Parent'}
+    if isinstance(obj, ArrayObject):
+        return [resolved(value) for value in obj]
+    return obj
+
+
+def overlay_page(text):
+    packet = io.BytesIO()
+    can = canvas.Canvas(packet, pagesize=letter)
+    can.drawString(100, 100, text)
+    can.save()
+    packet.seek(0)
+    return PdfFileReader(packet).getPage(0)
+
+
+def write_template_copy(template):
+    output = PdfFileWriter()
+    for page_num in range(len(template.pages)):
+        output.addPage(template.get_page(page_num))
+    stream = io.BytesIO()
+    output.write(stream)
+    return stream.getvalue()
+
+
+def test_template_is_parsed_once():
+    assert get_pdf_template(TEMPLATE_PDF) is get_pdf_template(TEMPLATE_PDF)
+
+
+def test_writing_does_not_change_template():
+    template = get_pdf_template(TEMPLATE_PDF)
+    first = write_template_copy(template)
+    assert write_template_copy(template) == first
+
+    # The writer rewrites the references of the objects it writes - only the copies were written
+    for page in template.pages:
+        assert all(reference.pdf is template.reader for reference in references(page))
+
+
+def test_merge_page_same_as_pypdf2_merge():
+    template = get_pdf_template(TEMPLATE_PDF)
+    with open(TEMPLATE_PDF, 'rb') as f:
+        template_data = f.read()
+    for page_num in range(len(template.pages)):
+        expected = PdfFileReader(io.BytesIO(template_data)).getPage(page_num)
+        expected.mergePage(overlay_page('1234'))
+        assert resolved(template.merge_page(page_num, overlay_page('1234'))) == resolved(expected)
+
+
+@pytest.mark.parametrize('template_file', ['itc1324_18.pdf', 'itc1322_18.pdf'])
+def test_written_merged_pages_same_as_pypdf2_merge(template_file):
+    # The pages are written and read back, as the forms are - the copied streams and content must survive the writer
+    template_file = os.path.join(REPO_ROOT, template_file)
+    template = get_pdf_template(template_file)
+    with open(template_file, 'rb') as f:
+        template_data = f.read()
+    output = PdfFileWriter()
+    expected_output = PdfFileWriter()
+    for page_num in range(len(template.pages)):
+        output.addPage(template.merge_page(page_num, overlay_page(f'page{page_num}')))
+        expected_page = PdfFileReader(io.BytesIO(template_data)).getPage(page_num)
+        expected_page.mergePage(overlay_page(f'page{page_num}'))
+        expected_output.addPage(expected_page)
+
+    written = []
+    for writer in (output, expected_output):
+        stream = io.BytesIO()
+        writer.write(stream)
+        written.append(PdfFileReader(io.BytesIO(stream.getvalue())))
+    merged, expected = written
+    assert merged.getNumPages() == expected.getNumPages() == len(template.pages)
+    for page_num in range(len(template.pages)):
+        page = merged.getPage(page_num)
+        assert page.getContents().get_data() == expected.getPage(page_num).getContents().get_data()
+        assert f'page{page_num}'.encode() in page.getContents().get_data()
+        assert resolved(page) == resolved(expected.getPage(page_num))
+
+
+@pytest.mark.skipif(not os.path.isdir(PROC_FD_DIR), reason='needs /proc')
+def test_template_file_is_closed():
+    get_pdf_template.cache_clear()
+    open_files_num = len(os.listdir(PROC_FD_DIR))
+    template = get_pdf_template(TEMPLATE_PDF)
+    write_template_copy(template)
+    assert len(os.listdir(PROC_FD_DIR)) == open_files_num
@@ -0,0 +1,62 @@
+from ..src.rate_cache import cached_rate_calendar
+from datetime import datetime
+import os
+
+import pytest
+
+
+class CountingParser:
+    def __init__(self, dollar_ils_rate):
+        self.dollar_ils_rate = dollar_ils_rate
+        self.calls = 0
+
+    def __call__(self, file):
+        self.calls += 1
+        return self.dollar_ils_rate
+
+
+@pytest.fixture
+def rates_file(tmp_path):
+    file = tmp_path / 'ExchangeRates.xlsx'
+    file.write_bytes(b'rates v1')
+    return str(file)
+
+
+def test_second_load_does_not_parse(rates_file, tmp_path):
+    parser = CountingParser({datetime(2020, 1, 2): 3.45, datetime(2020, 1, 1): 3.44})
+    calendar = cached_rate_calendar(rates_file, parser)
+    assert parser.calls == 1
+    assert calendar.rate(datetime(2020, 1, 1)) == 3.44
+    assert calendar.rate(datetime(2020, 1, 3)) == 3.45
+
+    calendar = cached_rate_calendar(rates_file, parser)
+    assert parser.calls == 1
+    assert calendar.rate(datetime(2020, 1, 3)) == 3.45
+    assert os.path.isdir(tmp_path / '.rate_cache')
+
+
+def test_touched_file_with_same_content_is_not_parsed(rates_file):
+    parser = CountingParser({datetime(2020, 1, 2): 3.45})
+    cached_rate_calendar(rates_file, parser)
+
+    stat = os.stat(rates_file)
+    os.utime(rates_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    cached_rate_calendar(rates_file, parser)
+    cached_rate_calendar(rates_file, parser)
+    assert parser.calls == 1
+
+
+def test_changed_file_is_parsed_again(rates_file, tmp_path):
+    parser = CountingParser({datetime(2020, 1, 2): 3.45})
+    cached_rate_calendar(rates_file, parser)
+
+    with open(rates_file, 'wb') as f:
+        f.write(b'rates v2 - more rates')
+    stat = os.stat(rates_file)
+    os.utime(rates_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    parser.dollar_ils_rate = {datetime(2020, 1, 2): 3.5}
+    calendar = cached_rate_calendar(rates_file, parser)
+    assert parser.calls == 2
+    assert calendar.rate(datetime(2020, 1, 2)) == 3.5
+    # The arrays of the old file were removed
+    assert len([f for f in os.listdir(tmp_path / '.rate_cache') if f.endswith('.npy')]) == 1
@@ -0,0 +1,75 @@
+from ..src.tax_generator import get_existing_exchange_date
+from ..src.rate_calendar import RateCalendar
+from datetime import date, datetime, timedelta
+import random
+
+import pytest
+
+
+def random_rates(rnd, days_num=400, start=datetime(2019, 1, 1)):
+    dollar_ils_rate = {}
+    day = start
+    for _ in range(days_num):
+        dollar_ils_rate[day] = round(rnd.uniform(3.2, 3.9), 3)
+        # Mostly business days, sometimes long vacations
+        day += timedelta(days=rnd.choice([1, 1, 1, 1, 3, 4, 6]))
+    return dollar_ils_rate
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_calendar_matches_probing(seed):
+    rnd = random.Random(seed)
+    dollar_ils_rate = random_rates(rnd)
+    calendar = RateCalendar(dollar_ils_rate)
+
+    first = min(dollar_ils_rate)
+    last = max(dollar_ils_rate)
+    day = first - timedelta(days=3)
+    while day <= last + timedelta(days=7):
+        try:
+            expected = get_existing_exchange_date(day, dollar_ils_rate)
+        except Exception as e:
+            with pytest.raises(Exception, match=str(e)):
+                calendar.exchange_date(day)
+        else:
+            assert calendar.exchange_date(day) == expected
+            assert calendar.rate(day) == dollar_ils_rate[expected]
+            assert calendar[expected] == dollar_ils_rate[expected]
+            assert get_existing_exchange_date(day, calendar) == expected
+        day += timedelta(days=1)
+
+
+def test_calendar_exact_lookup():
+    calendar = RateCalendar({date(2020, 1, 2): 3.45, date(2020, 1, 5): 3.5})
+    assert date(2020, 1, 2) in calendar
+    assert date(2020, 1, 3) not in calendar
+    assert calendar[date(2020, 1, 5)] == 3.5
+    with pytest.raises(KeyError):
+        calendar[date(2020, 1, 4)]
+    # The date type of the query is kept
+    assert calendar.exchange_date(datetime(2020, 1, 4)) == datetime(2020, 1, 2)
+
+
+def test_calendar_gap_too_wide():
+    calendar = RateCalendar({date(2020, 1, 1): 3.45, date(2020, 1, 10): 3.5})
+    assert calendar.rate(date(2020, 1, 5)) == 3.45
+    with pytest.raises(Exception, match='USD/ILS exchange rate not found near closing date: 2020-01-06'):
+        calendar.rate(date(2020, 1, 6))
+    with pytest.raises(Exception, match='not found'):
+        calendar.rate(date(2019, 12, 31))
+    with pytest.raises(Exception, match='not found'):
+        calendar.rate(date(2020, 1, 15))
+
+
+def test_calendar_batch_lookup():
+    rnd = random.Random(7)
+    dollar_ils_rate = random_rates(rnd)
+    calendar = RateCalendar(dollar_ils_rate)
+    dates = [day for day in dollar_ils_rate]
+    dates += [day + timedelta(days=1) for day in dates]
+    dates = [day for day in dates if day <= max(dollar_ils_rate)]
+
+    assert calendar.rates_for(dates).tolist() == [calendar.rate(day) for day in dates]
+
+    with pytest.raises(Exception, match='not found'):
+        calendar.rates_for([dates[0], min(dollar_ils_rate) - timedelta(days=1)])
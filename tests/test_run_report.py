@@ -0,0 +1,104 @@
+from ..src.run_report import RunReport
+from ..src.batch import find_clients, run_batch
+from ..src.pdf_helpers import HEBREW_FONT_FILE
+from ..src import tax_generator
+from ..src.rate_calendar import RateCalendar
+from .test_batch import clients_dir, REPO_ROOT
+from datetime import datetime, timedelta
+import json
+import os
+import pstats
+import tracemalloc
+
+import pytest
+
+MAIN_STAGES = ['rates', 'parse', 'form1325', 'dividends_interests', 'pdf', 'appendixes']
+
+
+def allocate(size):
+    return [bytearray(1024) for _ in range(size)]
+
+
+def test_disabled_report_measures_nothing(tmp_path):
+    report = RunReport()
+    with report.stage('parse') as stage:
+        stage.counts['trades'] = 1
+    assert report.stages == []
+    assert not tracemalloc.is_tracing()
+    assert report.write(str(tmp_path / 'report.json')) is None
+    assert not (tmp_path / 'report.json').exists()
+
+
+def test_stages(tmp_path):
+    report = RunReport(enabled=True)
+    with report.stage('small') as stage:
+        kept = allocate(10)
+        stage.counts['rows'] = 10
+    with report.stage('big'):
+        allocate(1000)
+    report.write(str(tmp_path / 'report.json'))
+    report.close()
+    assert not tracemalloc.is_tracing()
+
+    with open(tmp_path / 'report.json', encoding='utf-8') as f:
+        data = json.load(f)
+    small, big = data['stages']
+    assert [small['name'], big['name']] == ['small', 'big']
+    assert small['counts'] == {'rows': 10}
+    assert big['counts'] == {}
+    # The peak is of every stage on its own - the big stage frees what it allocated
+    assert 10 * 1024 <= small['peak_memory_bytes'] < 1000 * 1024
+    assert big['peak_memory_bytes'] >= 1000 * 1024
+    assert small['memory_growth_bytes'] >= 10 * 1024
+    assert big['memory_growth_bytes'] < 100 * 1024
+    assert all(stage['wall_seconds'] >= 0 and stage['cpu_seconds'] >= 0 for stage in data['stages'])
+    assert 'profile_stats_file' not in data
+    del kept
+
+
+def test_failed_stage_is_recorded():
+    report = RunReport(enabled=True, trace_memory=False)
+    with pytest.raises(ValueError):
+        with report.stage('parse'):
+            raise ValueError('bad statement')
+    assert [stage.name for stage in report.stages] == ['parse']
+    assert report.stages[0].peak_memory_bytes is None
+
+
+def test_profile_of_hottest_stage(tmp_path):
+    report = RunReport(profile=True, trace_memory=False)
+    with report.stage('fast'):
+        sum(range(10))
+    with report.stage('slow'):
+        sorted(str(i) for i in range(200000))
+    profile_stats_file = report.write(str(tmp_path / 'report.json'))
+
+    assert profile_stats_file == str(tmp_path / 'report.prof')
+    with open(tmp_path / 'report.json', encoding='utf-8') as f:
+        data = json.load(f)
+    assert data['hottest_stage'] == 'slow'
+    assert data['profile_stats_file'] == profile_stats_file
+    functions = {function for _, _, function in pstats.Stats(profile_stats_file).stats}
+    assert '<built-in method builtins.sorted>' in functions
+
+
+@pytest.mark.skipif(not os.path.exists(os.path.join(REPO_ROOT, HEBREW_FONT_FILE)),
+                    reason=f'needs the Hebrew font {HEBREW_FONT_FILE} in the repository root')
+def test_main_run_report(clients_dir, tmp_path, monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
+    dollar_ils_rate = RateCalendar({datetime(2018, 1, 1) + timedelta(days=i): 3.5 for i in range(4 * 366)})
+    output_dir = tmp_path / 'output'
+
+    run_batch(find_clients(str(clients_dir)), str(output_dir), workers=1, dollar_ils_rate=dollar_ils_rate,
+              run_report=True)
+
+    with open(output_dir / 'client-b' / tax_generator.RUN_REPORT_FILE_NAME, encoding='utf-8') as f:
+        data = json.load(f)
+    assert [stage['name'] for stage in data['stages']] == MAIN_STAGES
+    counts = {stage['name']: stage['counts'] for stage in data['stages']}
+    assert counts['parse']['statements'] == 1
+    assert counts['form1325']['entries'] > 0
+    assert counts['pdf'] == {'forms': 3}
+    # The failing client has a report that ends with the failed stage
+    with open(output_dir / 'client-a' / tax_generator.RUN_REPORT_FILE_NAME, encoding='utf-8') as f:
+        assert [stage['name'] for stage in json.load(f)['stages']] == ['rates', 'parse']
@@ -0,0 +1,45 @@
+from ..src.statement_decoder import SectionDecoder, section_rows, DayCache
+from ..src.tax_generator import _read_statement_sections, STATEMENT_SECTIONS
+from ..src.tax_generator import TRADES_COLUMNS, CASH_COLUMNS
+import csv
+import datetime
+import os
+
+import pytest
+
+TEST_STATEMENT_CSV = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'test.csv')
+
+
+@pytest.mark.parametrize('section, columns', [('Trades', TRADES_COLUMNS), ('Dividends', CASH_COLUMNS),
+                                              ('Interest', CASH_COLUMNS)])
+def test_same_as_dictreader(section, columns):
+    lines = _read_statement_sections(TEST_STATEMENT_CSV, STATEMENT_SECTIONS)[section]
+    expected = [tuple(row[column] for column in columns) for row in csv.DictReader(lines)]
+    assert list(section_rows(lines, columns)) == expected
+    assert len(expected) > 1
+
+
+def test_section_decoder():
+    # Like csv.DictReader: the last of duplicate columns, None for the columns missing from short rows
+    decoder = SectionDecoder(['Trades', 'Header', 'Code', '', 'Amount', ''], ['Amount', '', 'Code'])
+    assert decoder.indices == (4, 5, 2)
+    assert decoder.decode(['Trades', 'Data', 'O', 'x', '1.5', 'y']) == ('1.5', 'y', 'O')
+    assert decoder.decode(['Trades', 'Data', 'C']) == (None, None, 'C')
+    assert SectionDecoder(['Code', 'Amount'], ['Amount']).decode(['O', '2']) == ('2',)
+
+    lines = ['Interest,Header,Currency,Amount\n', 'Interest,Data,USD,0.5\n', '\n', 'Interest,Data,Total\n']
+    assert list(section_rows(lines, ('Currency', 'Amount'))) == [('USD', '0.5'), ('Total', None)]
+    assert list(section_rows([], ('Currency',))) == []
+    # A missing column fails on the first row - a section without rows is empty
+    assert list(section_rows(lines[:1], ('Date',))) == []
+    with pytest.raises(KeyError):
+        list(section_rows(lines, ('Date',)))
+
+
+def test_day_cache():
+    days = DayCache()
+    day = days.parse('2019-04-22')
+    assert day == datetime.datetime(2019, 4, 22)
+    assert days.parse('2019-04-22') is day and len(days) == 1
+    with pytest.raises(ValueError):
+        days.parse('22/04/2019')
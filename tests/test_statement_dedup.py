@@ -0,0 +1,102 @@
+from ..src.statement_dedup import StatementDeduplicator, table_fingerprints
+from ..src.tax_generator import parse_statement, parse_statements, trades_parse, ALL_STATEMENTS
+from ..src.tax_generator import TradeTable, ParsedStatement, TRADE_SIDE_OPEN
+from collections import Counter
+import datetime
+import os
+
+import pytest
+
+TEST_STATEMENT_CSV = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'test.csv')
+PARTIAL_2019_STATEMENT_CSV = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..',
+                                          'U2903438_20190101_20190607.csv')
+AAPL_OPEN_LINE = 'Trades,Data,Order,Stocks,USD,AAPL,"2019-04-22, 14:04:29",7,204.34,204.53,-1430.38,-1,1431.38,0,1.33,O\n'
+
+
+def trade_counter(trade_dic):
+    return Counter((symbol, trade.date, trade.total_shares_num, trade.transaction_price, trade.commission)
+                   for symbol, table in trade_dic.items() for trade in table)
+
+
+def test_overlapping_statements():
+    statements = [PARTIAL_2019_STATEMENT_CSV, TEST_STATEMENT_CSV]
+    partial = parse_statement(PARTIAL_2019_STATEMENT_CSV)
+    full = parse_statement(TEST_STATEMENT_CSV)
+
+    parsed = parse_statements(statements, TEST_STATEMENT_CSV)
+    assert parsed.overlaps == {(PARTIAL_2019_STATEMENT_CSV, TEST_STATEMENT_CSV):
+                               {'trades': 13, 'dividends': 2, 'interests': 1}}
+    # Every fill once
+    assert trade_counter(parsed.trades) == trade_counter(partial.trades) | trade_counter(full.trades)
+    assert trade_counter(trades_parse(statements)) == trade_counter(parsed.trades)
+    # The dividends and interests of the tax year statement are all kept
+    assert [(d.symbol, d.value_usd) for d in parsed.dividends] == [('AAPL', 5.39), ('BA', 6.17)]
+    assert len(parsed.interests) == 1
+
+    not_deduplicated = parse_statements(statements, TEST_STATEMENT_CSV, deduplicate=False)
+    assert not_deduplicated.overlaps == {}
+    assert trade_counter(not_deduplicated.trades) == trade_counter(partial.trades) + trade_counter(full.trades)
+
+
+def test_repeated_fill_in_statement_kept(tmp_path):
+    with open(TEST_STATEMENT_CSV, encoding='utf-8') as f:
+        lines = f.readlines()
+    repeated_fill_csv = os.path.join(tmp_path, 'repeated_fill.csv')
+    with open(repeated_fill_csv, 'w', encoding='utf-8') as f:
+        f.writelines(line for line in lines for _ in range(2 if line == AAPL_OPEN_LINE else 1))
+
+    trades = trades_parse([repeated_fill_csv, TEST_STATEMENT_CSV])
+    assert [trade.total_shares_num for trade in trades['AAPL']] == [7, 7, -7]
+    # The statement with the fill once adds it again after the statement with it once
+    trades = trades_parse([TEST_STATEMENT_CSV, repeated_fill_csv])
+    assert [trade.total_shares_num for trade in trades['AAPL']] == [7, 7, -7]
+    assert trade_counter(trades_parse([repeated_fill_csv, repeated_fill_csv])) == \
+           trade_counter(trades_parse([repeated_fill_csv]))
+
+
+def test_all_statements_of_tax_year():
+    statements = [PARTIAL_2019_STATEMENT_CSV, TEST_STATEMENT_CSV, TEST_STATEMENT_CSV]
+    parsed = parse_statements(statements, ALL_STATEMENTS, tax_year=2019)
+    assert [(d.symbol, d.value_usd) for d in parsed.dividends] == [('AAPL', 5.39), ('BA', 6.17)]
+    assert [(i.date, i.value_usd) for i in parsed.interests] == [(datetime.datetime(2019, 5, 3), 0.51)]
+    parsed = parse_statements(statements, ALL_STATEMENTS, tax_year=2020)
+    assert (parsed.dividends, parsed.interests) == ([], [])
+    with pytest.raises(Exception, match='tax year'):
+        parse_statements(statements, ALL_STATEMENTS)
+
+
+def test_table_fingerprints():
+    table = TradeTable('TEST')
+    for price in (10.0, 10.0, 11.0, 10.0):
+        table.append(TRADE_SIDE_OPEN, datetime.datetime(2019, 3, 1), price, 5, 1.0)
+    fingerprints = table_fingerprints(table).tolist()
+    # The same fills are told apart by their occurrence
+    assert len(set(fingerprints)) == 4
+    other = TradeTable('OTHER')
+    other.append(TRADE_SIDE_OPEN, datetime.datetime(2019, 3, 1), 10.0, 5, 1.0)
+    assert table_fingerprints(other).tolist()[0] not in fingerprints
+
+    deduplicator = StatementDeduplicator()
+    first = parse_statement(TEST_STATEMENT_CSV)
+    assert deduplicator.add('first', first).trades == first.trades
+    second = deduplicator.add('second', parse_statement(TEST_STATEMENT_CSV))
+    assert (second.trades, second.dividends, second.interests) == ({}, [], [])
+    assert len(deduplicator) == sum(len(table) for table in first.trades.values()) + 3
+
+
+def test_overlaps_of_every_earlier_statement():
+    def statement(*prices):
+        parsed = ParsedStatement()
+        table = parsed.trades['TEST'] = TradeTable('TEST')
+        for price in prices:
+            table.append(TRADE_SIDE_OPEN, datetime.datetime(2019, 3, 1), price, 5, 1.0)
+        return parsed
+
+    deduplicator = StatementDeduplicator()
+    deduplicator.add('a', statement(1.0, 2.0))
+    deduplicator.add('b', statement(2.0, 3.0, 3.0))
+    # The fills of c that a and b had are counted for the statement that had them first
+    unique = deduplicator.add('c', statement(4.0, 3.0, 1.0, 2.0, 3.0, 3.0))
+    assert [trade.transaction_price for trade in unique.trades['TEST']] == [4.0, 3.0]
+    assert deduplicator.overlaps == {('a', 'b'): {'trades': 1}, ('a', 'c'): {'trades': 2}, ('b', 'c'): {'trades': 2}}
+    assert len(deduplicator) == 6
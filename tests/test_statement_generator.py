@@ -0,0 +1,47 @@
+from ..benchmarks.statement_generator import generate_statement, fills_per_symbol
+from ..src.tax_generator import parse_statement, match_symbol_lots, TradeClose
+
+SYMBOLS_NUM = 10
+
+
+def test_generated_statement_parses(tmp_path):
+    statement_csv = str(tmp_path / 'statement.csv')
+    generated = generate_statement(statement_csv, 2000, symbols_num=SYMBOLS_NUM, dividends_num=30, splits_num=2,
+                                   withholding_fraction=0.5)
+    statement = parse_statement(statement_csv)
+
+    assert len(statement.trades) == SYMBOLS_NUM
+    assert sum(len(trade_list) for trade_list in statement.trades.values()) == generated.trades == 2000
+    assert sum(type(trade) is TradeClose for trade_list in statement.trades.values() for trade in trade_list) == \
+           generated.closes
+    assert len(statement.dividends) == generated.dividends == 30
+    assert sum(dividend.tax_deducted_usd > 0 for dividend in statement.dividends) == generated.withholdings
+    assert len(statement.interests) == generated.interests == 23
+    for symbol, date, ratio in generated.splits:
+        splits = statement.stock_splits.get_stock_splits_for_symbol(symbol)
+        assert [(split.date.date(), split.ratio) for split in splits] == [(date, ratio)]
+
+
+def test_sales_are_covered(tmp_path):
+    statement_csv = str(tmp_path / 'statement.csv')
+    generate_statement(statement_csv, 2000, symbols_num=SYMBOLS_NUM, splits_num=0)
+    statement = parse_statement(statement_csv)
+
+    for trade_list in statement.trades.values():
+        for opening_shares_list in match_symbol_lots(trade_list, statement.stock_splits):
+            closing_trade = opening_shares_list[0][0]
+            assert sum(covered for _, _, covered in opening_shares_list) == -closing_trade.total_shares_num
+
+
+def test_generation_is_deterministic(tmp_path):
+    for name in ('first.csv', 'second.csv'):
+        generate_statement(str(tmp_path / name), 500, seed=7)
+    assert (tmp_path / 'first.csv').read_bytes() == (tmp_path / 'second.csv').read_bytes()
+    generate_statement(str(tmp_path / 'other_seed.csv'), 500, seed=8)
+    assert (tmp_path / 'first.csv').read_bytes() != (tmp_path / 'other_seed.csv').read_bytes()
+
+
+def test_fills_per_symbol():
+    counts = fills_per_symbol(1000, SYMBOLS_NUM)
+    assert sum(counts) == 1000
+    assert counts == sorted(counts, reverse=True)
@@ -0,0 +1,68 @@
+from ..src.tax_generator import parse_statement, parse_statements, trades_parse
+from ..src.tax_generator import TradeOpen, TradeClose
+import datetime
+import os
+
+TEST_STATEMENT_CSV = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'test.csv')
+PARTIAL_2019_STATEMENT_CSV = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..',
+                                          'U2903438_20190101_20190607.csv')
+
+
+def test_parse_statement_all_sections():
+    statement = parse_statement(TEST_STATEMENT_CSV)
+
+    # Forex trades and SubTotal/Total rows are not stock trades
+    assert 'USD.ILS' not in statement.trades
+    assert [type(t) for t in statement.trades['AAPL']] == [TradeOpen, TradeClose]
+    aapl_open = statement.trades['AAPL'][0]
+    assert aapl_open.date == datetime.datetime(2019, 4, 22)
+    assert aapl_open.total_shares_num == 7
+    assert aapl_open.shares_left == 7
+    assert aapl_open.commission == 1
+
+    assert [(d.symbol, d.value_usd) for d in statement.dividends] == [('AAPL', 5.39), ('BA', 6.17)]
+    assert [(i.date, i.value_usd) for i in statement.interests] == [(datetime.datetime(2019, 5, 3), 0.51)]
+    assert statement.stock_splits.get_stock_splits_for_symbol('AAPL') == []
+
+
+def test_parse_statement_sections_subset():
+    statement = parse_statement(TEST_STATEMENT_CSV, sections=('Interest',))
+    assert statement.trades == {}
+    assert statement.dividends == []
+    assert len(statement.interests) == 1
+
+
+def test_parse_statements_matches_trades_parse():
+    statements = [PARTIAL_2019_STATEMENT_CSV, TEST_STATEMENT_CSV]
+    parsed = parse_statements(statements, TEST_STATEMENT_CSV)
+    expected = trades_parse(statements)
+
+    assert list(parsed.trades.keys()) == list(expected.keys())
+    for symbol, trade_list in expected.items():
+        assert [(t.date, t.transaction_price, t.total_shares_num) for t in parsed.trades[symbol]] == \
+               [(t.date, t.transaction_price, t.total_shares_num) for t in trade_list]
+    # Dividends and interests come from the tax year statement only
+    assert len(parsed.dividends) == 2
+    assert len(parsed.interests) == 1
+
+
+def test_parse_statements_parallel():
+    statements = [PARTIAL_2019_STATEMENT_CSV, TEST_STATEMENT_CSV]
+    serial = parse_statements(statements, TEST_STATEMENT_CSV, workers=1)
+    parallel = parse_statements(statements, TEST_STATEMENT_CSV, workers=2)
+
+    assert {symbol: str(trade_list) for symbol, trade_list in parallel.trades.items()} == \
+           {symbol: str(trade_list) for symbol, trade_list in serial.trades.items()}
+    assert list(parallel.trades.keys()) == list(serial.trades.keys())
+    assert [(d.symbol, d.value_usd, d.tax_deducted_usd) for d in parallel.dividends] == \
+           [(d.symbol, d.value_usd, d.tax_deducted_usd) for d in serial.dividends]
+    assert str(parallel.stock_splits) == str(serial.stock_splits)
+    assert str(trades_parse(statements, workers=2)) == str(serial.trades)
+
+
+def test_parse_statements_merges_chronologically():
+    # Listing the statements out of order gives the trades of every symbol in chronological order
+    parsed = parse_statements([TEST_STATEMENT_CSV, PARTIAL_2019_STATEMENT_CSV], TEST_STATEMENT_CSV)
+    for trade_list in parsed.trades.values():
+        dates = [trade.date for trade in trade_list]
+        assert dates == sorted(dates)
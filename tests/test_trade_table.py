@@ -0,0 +1,114 @@
+from ..src.trade_table import TradeTable, TradeOpen, TradeClose, TRADE_SIDE_OPEN, TRADE_SIDE_CLOSE, merge_trade_tables
+from ..src.tax_generator import match_symbol_lots, parse_statement, StockSplit, AllStockSplits
+from .test_lot_matching import random_trade_list, as_comparable
+from copy import deepcopy
+from datetime import date, datetime
+import os
+import pickle
+import random
+
+import pytest
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+TEST_STATEMENT_CSV = os.path.join(REPO_ROOT, 'test.csv')
+
+
+def test_row_views():
+    table = TradeTable('TEST')
+    table.append(TRADE_SIDE_OPEN, datetime(2020, 1, 2), 10.5, 100, 1.25)
+    table.append(TRADE_SIDE_CLOSE, datetime(2020, 1, 3), 11.0, -40, 1.0, 20.0)
+
+    opening_trade, closing_trade = table
+    assert (type(opening_trade), type(closing_trade)) == (TradeOpen, TradeClose)
+    assert (opening_trade.symbol, opening_trade.date, opening_trade.transaction_price, opening_trade.total_shares_num,
+            opening_trade.shares_left, opening_trade.commission, opening_trade.splits_applied) == \
+           ('TEST', datetime(2020, 1, 2), 10.5, 100, 100, 1.25, None)
+    assert closing_trade.realized == 20.0
+    assert not hasattr(opening_trade, '__dict__')
+
+    # Writing a view writes the table - other views of the row see it
+    opening_trade.shares_left -= 40
+    opening_trade.splits_applied = 2
+    assert table[0].shares_left == 60 and table.shares_left[0] == 60
+    assert table[-2].splits_applied == 2
+    assert table[0] == opening_trade and table[0] is not opening_trade
+    assert table[0] != table[1]
+    assert len({table[0], table[0], table[1]}) == 2
+    assert table.nbytes() < 2 * 64
+
+
+def test_standalone_trade():
+    trade = TradeOpen(symbol='TEST', transaction_price=151.92, date=None, total_shares_num=3, shares_left=3)
+    assert trade.date is None
+    trade.date = date(2020, 1, 1)
+    assert trade.date == date(2020, 1, 1) and type(trade.date) is date
+    assert str(trade) == 'Trade: symbol:TEST, date:2020-01-01 comm:0.0, price:151.92'
+    with pytest.raises(AttributeError):
+        trade.unknown = 1
+    with pytest.raises(ValueError, match='time of day'):
+        trade.date = datetime(2020, 1, 1, 14, 4, 29)
+
+    copied = deepcopy(trade)
+    copied.shares_left = 0
+    assert trade.shares_left == 3
+    unpickled = pickle.loads(pickle.dumps(trade))
+    assert (unpickled.symbol, unpickled.date, unpickled.shares_left) == ('TEST', date(2020, 1, 1), 3)
+
+
+def test_table_dates_are_one_type():
+    table = TradeTable('TEST')
+    table.append(TRADE_SIDE_OPEN, datetime(2020, 1, 2), 10.0, 1)
+    table.append(TRADE_SIDE_OPEN, datetime(2020, 1, 3), 10.0, 1)
+    with pytest.raises(TypeError):
+        table[0].date = date(2020, 1, 2)
+    with pytest.raises(ValueError):
+        table[0].symbol = 'OTHER'
+
+
+def test_parsed_trades_are_tables():
+    statement = parse_statement(TEST_STATEMENT_CSV)
+    for symbol, table in statement.trades.items():
+        assert isinstance(table, TradeTable)
+        assert {trade.symbol for trade in table} == {symbol}
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_table_matches_list(seed):
+    rnd = random.Random(seed)
+    trade_list = random_trade_list(rnd, 300, with_short_lots=True)
+    table = TradeTable('TEST', date_class=date)
+    table.extend(trade_list)
+    stock_splits = AllStockSplits()
+    stock_splits.add_stock_split(StockSplit('TEST', date(2019, 3, 1), 2))
+    stock_splits.add_stock_split(StockSplit('TEST', date(2019, 6, 1), 3))
+
+    expected = match_symbol_lots(trade_list, deepcopy(stock_splits))
+    actual = match_symbol_lots(table, stock_splits)
+
+    assert as_comparable(list(table), actual, index_of=lambda trade: trade._row) == \
+           as_comparable(trade_list, expected)
+
+
+def day_table(days, first_price=0):
+    table = TradeTable('TEST')
+    for i, day in enumerate(days):
+        table.append(TRADE_SIDE_OPEN, datetime(2020, 1, day), first_price + i, 1)
+    return table
+
+
+def test_merge_trade_tables():
+    # Statements that do not overlap are appended one after another
+    merged = merge_trade_tables([day_table([1, 2, 2]), TradeTable('TEST'), day_table([2, 5], 10)])
+    assert [trade.transaction_price for trade in merged] == [0, 1, 2, 10, 11]
+
+    # Overlapping statements are merged by day - fills of the same day in the order of the statements
+    merged = merge_trade_tables([day_table([1, 3, 3, 6]), day_table([2, 3, 4], 10), day_table([3], 20)])
+    assert [(trade.date.day, trade.transaction_price) for trade in merged] == \
+           [(1, 0), (2, 10), (3, 1), (3, 2), (3, 11), (3, 20), (4, 12), (6, 3)]
+    assert merged.symbol == 'TEST' and merged.shares_left.tolist() == [1] * 8
+    assert len(merge_trade_tables([])) == 0
+
+    other_dates = TradeTable('TEST', date_class=date)
+    other_dates.append(TRADE_SIDE_OPEN, date(2020, 1, 1), 1.0, 1)
+    with pytest.raises(TypeError):
+        merge_trade_tables([day_table([1, 2]), other_dates])
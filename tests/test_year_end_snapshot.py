@@ -0,0 +1,91 @@
+from ..src.tax_generator import form1325_obj_create, match_symbol_lots, parse_statements, _merge_trades, ALL_STATEMENTS
+from ..src.tax_generator import TradeTable, StockSplit, AllStockSplits, TRADE_SIDE_OPEN, TRADE_SIDE_CLOSE
+from ..src.year_end_snapshot import YearEndSnapshot
+from ..benchmarks.statement_generator import generate_statement
+from collections import Counter
+from datetime import date, datetime, timedelta
+import json
+import os
+import random
+
+import pytest
+
+
+def entry_counter(form1325):
+    return Counter(tuple(entry.to_list()) for entry in form1325.entry_list)
+
+
+def test_snapshot_same_as_full_history(tmp_path):
+    statement_2019 = os.path.join(tmp_path, '2019.csv')
+    statement_2020 = os.path.join(tmp_path, '2020.csv')
+    generate_statement(statement_2019, 3000, symbols_num=10, splits_num=0, start_date=date(2019, 1, 2),
+                       end_date=date(2019, 12, 31), seed=1)
+    generate_statement(statement_2020, 3000, symbols_num=10, splits_num=2, start_date=date(2020, 1, 2),
+                       end_date=date(2020, 12, 31), seed=2)
+    rnd = random.Random(0)
+    dollar_ils_rate = {datetime(2018, 12, 20) + timedelta(days=i): rnd.uniform(3.2, 3.8) for i in range(750)}
+
+    # Matching all the history at once
+    full = parse_statements([statement_2019, statement_2020], statement_2020)
+    full_form1325 = form1325_obj_create(full.trades, dollar_ils_rate, full.stock_splits, vectorized=True)
+
+    # 2019, then 2020 from the year-end snapshot of 2019
+    parsed_2019 = parse_statements([statement_2019], statement_2019)
+    form1325_2019 = form1325_obj_create(parsed_2019.trades, dollar_ils_rate, parsed_2019.stock_splits,
+                                        vectorized=True)
+    snapshot_file = os.path.join(tmp_path, 'snapshot', '2019.json')
+    YearEndSnapshot.from_run(2019, parsed_2019.trades, parsed_2019.stock_splits, 100, 250).save(snapshot_file)
+    snapshot = YearEndSnapshot.load(snapshot_file)
+    assert (snapshot.tax_year, snapshot.loss_from_prev_years) == (2019, 350)
+    parsed_2020 = parse_statements([statement_2020], statement_2020)
+    trades_2020 = _merge_trades([snapshot.trades, parsed_2020.trades])
+    form1325_2020 = form1325_obj_create(trades_2020, dollar_ils_rate, parsed_2020.stock_splits, vectorized=True)
+
+    assert form1325_2019.entry_list and form1325_2020.entry_list
+    assert entry_counter(full_form1325) - entry_counter(form1325_2019) == entry_counter(form1325_2020)
+    # The same lots are left open
+    for symbol, table in trades_2020.items():
+        open_rows = [(trade.date, trade.shares_left, trade.transaction_price, trade.commission)
+                     for trade in table if trade.shares_left != 0]
+        assert open_rows == [(trade.date, trade.shares_left, trade.transaction_price, trade.commission)
+                             for trade in full.trades[symbol] if trade.shares_left != 0]
+
+    # All the statements of the history, with the snapshot: only their trades of 2020 are taken
+    parsed_all = parse_statements([statement_2019, statement_2020], ALL_STATEMENTS, tax_year=2020, start_year=2020)
+    assert all(table.days[0] >= date(2020, 1, 1).toordinal() for table in parsed_all.trades.values())
+    trades_all = _merge_trades([YearEndSnapshot.load(snapshot_file).trades, parsed_all.trades])
+    form1325_all = form1325_obj_create(trades_all, dollar_ils_rate, parsed_all.stock_splits, vectorized=True)
+    assert entry_counter(form1325_all) == entry_counter(form1325_2020)
+
+
+def test_snapshot_lots(tmp_path):
+    table = TradeTable('TEST')
+    table.append(TRADE_SIDE_OPEN, datetime(2019, 3, 1), 90.0, 10, 1.0)
+    table.append(TRADE_SIDE_CLOSE, datetime(2019, 9, 1), 100.0, -4, 1.0, 20.0)
+    table.append(TRADE_SIDE_OPEN, datetime(2019, 10, 1), 120.0, 5, 2.0)
+    stock_splits = AllStockSplits()
+    stock_splits.add_stock_split(StockSplit('TEST', datetime(2019, 6, 1), 2))
+    stock_splits.add_stock_split(StockSplit('TEST', datetime(2019, 11, 1), 3))
+    match_symbol_lots(table, stock_splits)
+
+    snapshot = YearEndSnapshot.from_run(2019, {'TEST': table, 'CLOSED': TradeTable('CLOSED')}, stock_splits)
+    # The closed trade is not kept, and the open lots are adjusted to all the splits of the year
+    lots = snapshot.trades['TEST']
+    assert list(snapshot.trades) == ['TEST']
+    assert [(lot.date, lot.total_shares_num, lot.shares_left, lot.transaction_price, lot.commission,
+             lot.splits_applied) for lot in lots] == [(datetime(2019, 3, 1), 60, 48, 15.0, 1.0, None),
+                                                      (datetime(2019, 10, 1), 15, 15, 40.0, 2.0, None)]
+
+    snapshot_file = os.path.join(tmp_path, 'snapshot.json')
+    snapshot.save(snapshot_file)
+    loaded = YearEndSnapshot.load(snapshot_file)
+    assert str(loaded.trades) == str(snapshot.trades)
+    assert loaded.trades['TEST'].shares_left.tolist() == [48, 15]
+
+    with open(snapshot_file, encoding='utf-8') as f:
+        data = json.load(f)
+    data['version'] = 0
+    with open(snapshot_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    with pytest.raises(Exception, match='version'):
+        YearEndSnapshot.load(snapshot_file)